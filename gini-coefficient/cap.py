@@ -1,9 +1,10 @@
 import numpy as np
-import pandas as pd
-from matplotlib import pyplot as plt
-from scipy.integrate import trapezoid
 
+from inputs import as_array, as_binary, check_same_length
+from profiling import profiled, span
 
+
+@profiled(size_arg="y")
 def plot_cap_curve(classifier, X, y, method="predict", normalised=True):
     """Plot Cumulative Accuracy Profile (CAP) curve for trained binary classifier
 
@@ -18,6 +19,10 @@ def plot_cap_curve(classifier, X, y, method="predict", normalised=True):
     :type normalised: bool
     :return: None
     """
+    from matplotlib import pyplot as plt
+
+    y = as_binary(y, name="y")
+
     # generate cumulative positive outputs for classifier and a perfect classifier
     perfect_cumulative_positive_outputs = get_perfect_cumulative_positive_outputs(y=y)
     classifier_cumulative_positive_outputs = get_classifier_cumulative_positive_outputs(
@@ -62,6 +67,7 @@ def plot_cap_curve(classifier, X, y, method="predict", normalised=True):
     ax.legend(title="Model")
 
 
+@profiled(size_arg="y")
 def get_accuracy_ratio(classifier, X, y, method):
     """The accuracy ratio for a binary classifier
 
@@ -76,6 +82,9 @@ def get_accuracy_ratio(classifier, X, y, method):
         area between a perfect model's CAP curve and that of a random model
     :rtype: float
     """
+    from scipy.integrate import trapezoid
+
+    y = as_binary(y, name="y")
     samples_count = len(y)
     positive_samples_count = y.sum()
 
@@ -92,15 +101,16 @@ def get_accuracy_ratio(classifier, X, y, method):
     )
 
     # areas under cap curves using trapezoid rule
-    area_under_perfect_cap_curve = trapezoid(
-        y=perfect_cumulative_positive_outputs, x=x_vals
-    )
-    area_under_classifier_cap_curve = trapezoid(
-        y=classifier_cumulative_positive_outputs, x=x_vals
-    )
-    area_under_random_cap_curve = trapezoid(
-        y=random_cumulative_positive_outputs, x=x_vals
-    )
+    with span("integration", input_size=samples_count):
+        area_under_perfect_cap_curve = trapezoid(
+            y=perfect_cumulative_positive_outputs, x=x_vals
+        )
+        area_under_classifier_cap_curve = trapezoid(
+            y=classifier_cumulative_positive_outputs, x=x_vals
+        )
+        area_under_random_cap_curve = trapezoid(
+            y=random_cumulative_positive_outputs, x=x_vals
+        )
 
     # calculate accuracy ratio
     accuracy_ratio = area_under_classifier_cap_curve - area_under_random_cap_curve
@@ -109,6 +119,7 @@ def get_accuracy_ratio(classifier, X, y, method):
     return accuracy_ratio
 
 
+@profiled(size_arg="y")
 def get_classifier_cumulative_positive_outputs(classifier, X, y, method="predict"):
     """Running total of samples classified positive when put in decreasing order by prediction method
 
@@ -122,29 +133,33 @@ def get_classifier_cumulative_positive_outputs(classifier, X, y, method="predict
     :return:  index is number of samples and value number of positive samples classified positive, length len(y)+1
     :rtype: np.ndarray
     """
-    if method == "predict":
-        classifier_output = classifier.predict(X)
-    elif method == "predict_proba":
-        classifier_output = classifier.predict_proba(X)
-        classifier_output = classifier_output[:, 1]
-    else:
+    if method not in ("predict", "predict_proba"):
         raise ValueError("method should be either 'predict' or 'predict_proba'")
 
-    # order labels according to classifier output
-    output_with_labels = pd.DataFrame(
-        data={"classifier_output": classifier_output, "label": y}
-    )
-    output_with_labels = output_with_labels.sort_values(
-        ["classifier_output", "label"], ascending=False
-    )
+    y = as_binary(y, name="y")
+
+    with span("scoring", input_size=len(y)):
+        if method == "predict":
+            classifier_output = classifier.predict(X)
+        else:
+            classifier_output = classifier.predict_proba(X)
+            classifier_output = classifier_output[:, 1]
+
+    classifier_output = as_array(classifier_output, name="classifier_output")
+    check_same_length(classifier_output, y, names=("classifier_output", "y"))
+
+    # order labels according to classifier output, positive labels first among ties
+    with span("sorting", input_size=len(y)):
+        order = np.lexsort((y, classifier_output))[::-1]
 
-    # calculate running total - add a 0 at the start
-    cumulative_positive_outputs = output_with_labels.label.cumsum(axis=0).values
-    cumulative_positive_outputs = np.concatenate(([0], cumulative_positive_outputs))
+    # calculate running total - with a 0 at the start
+    cumulative_positive_outputs = np.zeros(len(y) + 1, dtype=np.int64)
+    np.cumsum(y[order], dtype=np.int64, out=cumulative_positive_outputs[1:])
 
     return cumulative_positive_outputs
 
 
+@profiled(size_arg="y")
 def get_perfect_cumulative_positive_outputs(y):
     """Running total of samples classified positive for a perfect model with labels y
 
@@ -153,16 +168,15 @@ def get_perfect_cumulative_positive_outputs(y):
     :return: index is number of samples and value number of positive samples classified positive, length len(y)+1
     :rtype: np.ndarray
     """
-    # order labels with 1s before 0s
-    y_sorted = np.sort(y)[::-1]
+    y = as_binary(y, name="y")
 
-    # calculate running total - add a 0 at the start
-    cumulative_positive_outputs = y_sorted.cumsum()
-    cumulative_positive_outputs = np.concatenate(([0], cumulative_positive_outputs))
+    # a perfect model puts all positives first - the running total rises by one per sample until they run out
+    cumulative_positive_outputs = np.minimum(np.arange(len(y) + 1), np.count_nonzero(y))
 
     return cumulative_positive_outputs
 
 
+@profiled(size_arg="cap_values")
 def transform_cap_to_roc(cap_values):
     """Maps an array of values defining a (un-normalised) CAP curve to values defining the (un-normalised) ROC curve
 
@@ -177,6 +191,7 @@ def transform_cap_to_roc(cap_values):
     return roc_values
 
 
+@profiled(size_arg="roc_values")
 def transform_roc_to_cap(roc_values):
     """Maps an array of values defining a (un-normalised) ROC curve to values defining the (un-normalised) CAP curve
 
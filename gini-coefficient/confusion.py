@@ -1,8 +1,10 @@
-from scipy.stats.contingency import crosstab
-import pandas as pd
 import numpy as np
 
+from inputs import as_array, as_binary_labels, check_same_length
+from profiling import profiled, span
 
+
+@profiled(size_arg="y_true")
 def get_recall(y_pred, y_true):
     """Recall for a binary classifier
 
@@ -16,6 +18,7 @@ def get_recall(y_pred, y_true):
     return get_true_positive_rate(y_pred, y_true)
 
 
+@profiled(size_arg="y_true")
 def get_specificity(y_pred, y_true):
     """Specificity for a binary classifier
 
@@ -29,6 +32,7 @@ def get_specificity(y_pred, y_true):
     return get_true_negative_rate(y_pred, y_true)
 
 
+@profiled(size_arg="y_true")
 def get_precision(y_pred, y_true):
     """Precision for a binary classifier
 
@@ -45,6 +49,7 @@ def get_precision(y_pred, y_true):
     return precision
 
 
+@profiled(size_arg="y_true")
 def get_true_positive_rate(y_pred, y_true):
     """True positive rate for a binary classifier
 
@@ -61,6 +66,7 @@ def get_true_positive_rate(y_pred, y_true):
     return true_positive_rate
 
 
+@profiled(size_arg="y_true")
 def get_false_positive_rate(y_pred, y_true):
     """False positive rate for a binary classifier
 
@@ -77,6 +83,7 @@ def get_false_positive_rate(y_pred, y_true):
     return false_positive_rate
 
 
+@profiled(size_arg="y_true")
 def get_true_negative_rate(y_pred, y_true):
     """True negative rate for a binary classifier
 
@@ -93,6 +100,7 @@ def get_true_negative_rate(y_pred, y_true):
     return true_negative_rate
 
 
+@profiled(size_arg="y_true")
 def get_false_negative_rate(y_pred, y_true):
     """False negative rate for a binary classifier
 
@@ -109,9 +117,12 @@ def get_false_negative_rate(y_pred, y_true):
     return false_negative_rate
 
 
+@profiled(size_arg="y_true")
 def get_binary_outcome_counts(y_pred, y_true):
     """True/False Positive/Negative counts for a binary classifier
 
+    Classes are 0/1 or boolean, or any two labels with the greater one positive, as in get_confusion_matrix.
+
     :param y_pred: predicted binary classes
     :type y_pred: np.ndarray
     :param y_true: true binary classes
@@ -119,17 +130,23 @@ def get_binary_outcome_counts(y_pred, y_true):
     :return: true_negatives, false_positives, false_negatives, true_positives
     :rtype: (float, float, float, float)
     """
-    confusion_matrix = get_confusion_matrix(y_pred, y_true)
-    (
-        true_negatives,
-        false_positives,
-        false_negatives,
-        true_positives,
-    ) = confusion_matrix.values.ravel()
+    check_same_length(y_pred, y_true)
+    y_pred, y_true = as_binary_labels(y_pred, y_true)
+
+    # count on boolean labels directly rather than building the full confusion matrix
+    with span("counting", input_size=len(y_true)):
+        positives_count = np.count_nonzero(y_true)
+        predicted_positives_count = np.count_nonzero(y_pred)
+        true_positives = np.int64(np.count_nonzero(y_pred & y_true))
+
+    false_positives = predicted_positives_count - true_positives
+    false_negatives = positives_count - true_positives
+    true_negatives = len(y_true) - positives_count - false_positives
 
     return true_negatives, false_positives, false_negatives, true_positives
 
 
+@profiled(size_arg="y_true")
 def get_confusion_matrix(y_pred, y_true):
     """Confusion matrix for classifier
 
@@ -140,7 +157,15 @@ def get_confusion_matrix(y_pred, y_true):
     :return: confusion_matrix - rows are true, columns are predictions, values are counts
     :rtype: pd.DataFrame
     """
-    (row_vals, column_vals), counts = crosstab(y_true, y_pred)
+    import pandas as pd
+    from scipy.stats.contingency import crosstab
+
+    y_pred = as_array(y_pred, name="y_pred")
+    y_true = as_array(y_true, name="y_true")
+    check_same_length(y_pred, y_true)
+
+    with span("crosstab", input_size=len(y_true)):
+        (row_vals, column_vals), counts = crosstab(y_true, y_pred)
     confusion_matrix = pd.DataFrame(
         index=pd.Index(row_vals, name="True"),
         columns=pd.Index(column_vals, name="Pred"),
@@ -1,6 +1,10 @@
 import numpy as np
 
+from inputs import as_array
+from profiling import profiled
 
+
+@profiled(size_arg="y_true")
 def gini_coefficient(y_pred, y_true):
     """Gini coefficient for predictions/probabilities of a binary target
 
@@ -16,6 +20,7 @@ def gini_coefficient(y_pred, y_true):
     return gini
 
 
+@profiled(size_arg="iterable_1")
 def somers_d(iterable_1, iterable_2):
     """Equal to Kendall's Tau-a ratio: tau(iter1, iter2) / tau(iter2, iter2)
 
@@ -32,6 +37,7 @@ def somers_d(iterable_1, iterable_2):
     return d
 
 
+@profiled(size_arg="iterable_1")
 def kendalls_tau(iterable_1, iterable_2):
     """Kendall's Tau-a: concordant pairs less discordant pairs over number of pairs
 
@@ -42,21 +48,87 @@ def kendalls_tau(iterable_1, iterable_2):
     :return: Kendall's Tau-a
     :rtype: float
     """
+    iterable_1 = as_array(iterable_1, name="iterable_1")
+    iterable_2 = as_array(iterable_2, name="iterable_2")
+
     if len(iterable_1) != len(iterable_2):
         raise ValueError("Iterables must have the same length")
 
     n_elements = len(iterable_1)
     n_pairs = n_elements * (n_elements - 1) / 2
 
-    pairwise_differences_1 = get_pairwise_differences(iterable_1)
-    pairwise_differences_2 = get_pairwise_differences(iterable_2)
-
-    tau = (np.sign(pairwise_differences_1) * np.sign(pairwise_differences_2)).sum()
+    # Knight's algorithm: sorted by iterable_1 then iterable_2, the discordant pairs are the inversions of iterable_2,
+    # and the concordant ones are the rest of the pairs not tied in either iterable
+    order = np.lexsort((iterable_2, iterable_1))
+    sorted_1 = iterable_1[order]
+    sorted_2 = iterable_2[order]
+    changes_1 = sorted_1[1:] != sorted_1[:-1]
+    changes_both = changes_1 | (sorted_2[1:] != sorted_2[:-1])
+    tied_pairs_1 = _count_tied_pairs(changes_1)
+    tied_pairs_2 = _count_tied_pairs(np.diff(np.sort(iterable_2)) != 0)
+    tied_pairs_both = _count_tied_pairs(changes_both)
+    discordant_pairs = count_inversions(sorted_2)
+
+    concordance = (
+        n_elements * (n_elements - 1) // 2
+        - tied_pairs_1
+        - tied_pairs_2
+        + tied_pairs_both
+        - 2 * discordant_pairs
+    )
+    tau = np.float64(concordance)
     tau /= n_pairs
 
     return tau
 
 
+def _count_tied_pairs(changes):
+    """Pairs of equal elements in a sorted array, from whether each element differs from the one before"""
+    bounds = np.concatenate(([0], np.flatnonzero(changes) + 1, [len(changes) + 1]))
+    run_lengths = np.diff(bounds).astype(np.int64)
+
+    return int((run_lengths * (run_lengths - 1) // 2).sum())
+
+
+def count_inversions(values):
+    """Number of pairs i < j with values[i] > values[j], by a bottom-up merge sort in O(n log^2 n)
+
+    Each pass merges neighbouring sorted runs of the same width at once: offsetting every value by its merged block
+    keeps the blocks apart in one global sort and searchsorted, so there is no loop over elements.
+
+    :param values: array of values
+    :type values: np.ndarray
+    :return: inversions
+    :rtype: int
+    """
+    _, ranks = np.unique(values, return_inverse=True)
+    ranks = ranks.astype(np.int64).ravel()
+    n_elements = len(ranks)
+    ranks_count = ranks.max() + 1 if n_elements else 0
+    positions = np.arange(n_elements)
+
+    inversions = 0
+    width = 1
+    while width < n_elements:
+        offsets = positions // (2 * width) * ranks_count
+        keys = ranks + offsets
+        in_right = positions % (2 * width) >= width
+        left_keys = keys[~in_right]
+
+        # left elements of the same block greater than each right element
+        block_ends = np.searchsorted(
+            left_keys, offsets[in_right] + ranks_count - 1, side="right"
+        )
+        not_greater = np.searchsorted(left_keys, keys[in_right], side="right")
+        inversions += int((block_ends - not_greater).sum())
+
+        ranks = np.sort(keys) - offsets
+        width *= 2
+
+    return inversions
+
+
+@profiled(size_arg="iterable")
 def get_pairwise_differences(iterable):
     """Differences between distinct pairs of elements without repeats
 
@@ -65,14 +137,11 @@ def get_pairwise_differences(iterable):
     :return: pairwise_differences iterable[j] - iterable[i] for i less than j, length n(n-1)/2
     :rtype: np.ndarray
     """
+    iterable = as_array(iterable, name="iterable")
     n_elements = len(iterable)
 
-    pairwise_differences = np.array(
-        [
-            iterable[j] - iterable[i]
-            for i in range(n_elements)
-            for j in range(i + 1, n_elements)
-        ]
-    )
+    # row-major upper triangle gives pairs (i, j) in the same order as nested loops over i < j
+    rows, columns = np.triu_indices(n_elements, k=1)
+    pairwise_differences = iterable[columns] - iterable[rows]
 
     return pairwise_differences
@@ -0,0 +1,173 @@
+"""Guard the cold-start cost of importing the metric modules
+
+Runs `python -X importtime` in a fresh interpreter, reports the cumulative import time of each module and fails if
+the total exceeds a budget or if a heavy dependency is loaded eagerly. For example:
+
+    python import_time.py --budget-ms 300
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+METRIC_MODULES = ("gini", "confusion", "cap")
+MODULES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# only loaded when a function that needs them is first called
+LAZY_MODULES = ("pandas", "scipy", "matplotlib")
+
+
+def measure_import_times(modules=METRIC_MODULES, repeats=5):
+    """Cumulative import time of each top-level module imported by `import <modules>` in a fresh interpreter
+
+    :param modules: modules to import
+    :type modules: tuple
+    :param repeats: number of fresh interpreters - the fastest run is kept to reduce noise
+    :type repeats: int
+    :return: import_times - microseconds keyed by module name, in import order
+    :rtype: dict
+    """
+    best_times = None
+    for _ in range(repeats):
+        import_times = _run_importtime(modules)
+        if best_times is None or sum(import_times.values()) < sum(best_times.values()):
+            best_times = import_times
+
+    return best_times
+
+
+def _run_importtime(modules):
+    # imports made by interpreter startup (site, encodings, ...) are reported too - leave them out
+    startup = _get_importtime_output("pass")
+    completed = _get_importtime_output("import " + ", ".join(modules))
+
+    startup_times = parse_importtime(startup)
+    import_times = parse_importtime(completed)
+
+    return {
+        name: microseconds
+        for name, microseconds in import_times.items()
+        if name not in startup_times
+    }
+
+
+def _get_importtime_output(code):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=MODULES_DIR,
+    )
+
+    return completed.stderr
+
+
+def parse_importtime(output):
+    """Cumulative times of top-level imports from `python -X importtime` output
+
+    :param output: stderr of `python -X importtime`
+    :type output: str
+    :return: import_times - microseconds keyed by module name, in import order
+    :rtype: dict
+    """
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # header line
+            continue
+
+        # nested imports are indented under the module that imported them
+        if not name[1:].startswith(" "):
+            import_times[name.strip()] = int(cumulative)
+
+    return import_times
+
+
+def get_loaded_modules(modules=METRIC_MODULES):
+    """Names of all modules loaded by importing the metric modules in a fresh interpreter
+
+    :param modules: modules to import
+    :type modules: tuple
+    :return: loaded module names
+    :rtype: set
+    """
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; import {}; print('\\n'.join(sys.modules))".format(
+                ", ".join(modules)
+            ),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=MODULES_DIR,
+    )
+
+    return set(completed.stdout.split())
+
+
+def check_import_time(budget_ms, modules=METRIC_MODULES, repeats=5, import_times=None):
+    """Problems with the cold start of the metric modules, empty if it is within budget
+
+    :param budget_ms: maximum total import time in milliseconds
+    :type budget_ms: float
+    :param modules: modules to import
+    :type modules: tuple
+    :param repeats: number of fresh interpreters timed
+    :type repeats: int
+    :param import_times: result of measure_import_times for modules, to check instead of measuring again
+    :type import_times: dict
+    :return: problems - descriptions of each failed check
+    :rtype: list
+    """
+    problems = []
+
+    if import_times is None:
+        import_times = measure_import_times(modules=modules, repeats=repeats)
+    total_ms = sum(import_times.values()) / 1000
+    if total_ms > budget_ms:
+        problems.append(
+            "importing {} took {:.1f}ms, budget is {:.1f}ms".format(
+                ", ".join(modules), total_ms, budget_ms
+            )
+        )
+
+    loaded_modules = get_loaded_modules(modules=modules)
+    for name in LAZY_MODULES:
+        if name in loaded_modules:
+            problems.append("{} is imported eagerly".format(name))
+
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the cold-start import time of the metric modules"
+    )
+    parser.add_argument("--budget-ms", type=float, default=300.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    import_times = measure_import_times(repeats=args.repeats)
+    for name, microseconds in sorted(
+        import_times.items(), key=lambda item: item[1], reverse=True
+    ):
+        print("{:>10.1f}ms  {}".format(microseconds / 1000, name))
+
+    problems = check_import_time(args.budget_ms, import_times=import_times)
+    for problem in problems:
+        print("FAIL: " + problem)
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
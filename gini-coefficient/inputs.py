@@ -0,0 +1,114 @@
+import numpy as np
+
+
+def as_array(values, name="values"):
+    """One-dimensional NumPy array of the input, without copying or changing its dtype where possible
+
+    NumPy arrays are returned as they are. pandas Series/Index backed by NumPy and objects exposing the buffer protocol
+    are viewed in place. Arrow-backed Series and pyarrow arrays are viewed in place when they are a single chunk of a
+    primitive type without nulls, and converted otherwise.
+
+    :param values: array-like input
+    :param name: name of the input used in error messages
+    :type name: str
+    :return: array
+    :rtype: np.ndarray
+    """
+    if isinstance(values, np.ndarray):
+        array = values
+    elif type(getattr(values, "dtype", None)).__name__ == "ArrowDtype":
+        array = _arrow_to_numpy(values.array.__arrow_array__())
+    elif type(values).__module__.startswith("pyarrow"):
+        array = _arrow_to_numpy(values)
+    else:
+        array = np.asarray(values)
+
+    if array.ndim != 1:
+        raise ValueError("{} must be one-dimensional".format(name))
+
+    return array
+
+
+def _arrow_to_numpy(arrow_values):
+    if hasattr(arrow_values, "num_chunks"):
+        if arrow_values.num_chunks == 1:
+            arrow_values = arrow_values.chunk(0)
+        else:
+            arrow_values = arrow_values.combine_chunks()
+
+    return arrow_values.to_numpy(zero_copy_only=False)
+
+
+def as_binary(values, name="values"):
+    """Boolean array of binary labels, checking they are all 0 or 1
+
+    Boolean input is returned as it is and one-byte integer input is reinterpreted in place, other dtypes are compared
+    against zero into a new boolean array.
+
+    :param values: array-like of 0/1 or boolean labels
+    :param name: name of the input used in error messages
+    :type name: str
+    :return: labels - True for the positive class
+    :rtype: np.ndarray
+    """
+    array = as_array(values, name=name)
+
+    if array.dtype == np.bool_:
+        return array
+
+    if array.dtype.kind in "iu" and array.dtype.itemsize == 1:
+        if (array.view(np.uint8) > 1).any():
+            raise ValueError("{} must only contain binary labels 0 and 1".format(name))
+
+        return array.view(np.bool_)
+
+    if not ((array == 0) | (array == 1)).all():
+        raise ValueError("{} must only contain binary labels 0 and 1".format(name))
+
+    return array != 0
+
+
+def as_binary_labels(y_pred, y_true):
+    """Boolean arrays of predicted and true classes, which may be any two labels
+
+    0/1 and boolean labels go through as_binary. Any other two labels are compared with the greater of them, which is
+    the positive class as get_confusion_matrix sorts them, e.g. "b" of "a" and "b".
+
+    :param y_pred: array-like of predicted classes
+    :param y_true: array-like of true classes
+    :return: y_pred, y_true - True for the positive class
+    :rtype: (np.ndarray, np.ndarray)
+    """
+    y_pred = as_array(y_pred, name="y_pred")
+    y_true = as_array(y_true, name="y_true")
+    try:
+        return as_binary(y_pred, name="y_pred"), as_binary(y_true, name="y_true")
+    except ValueError:
+        pass
+
+    labels = np.unique(np.concatenate((np.unique(y_pred), np.unique(y_true))))
+    if len(labels) != 2:
+        raise ValueError(
+            "y_pred and y_true must contain two class labels together, got {}".format(
+                len(labels)
+            )
+        )
+
+    return y_pred == labels[1], y_true == labels[1]
+
+
+def check_same_length(first, second, names=("y_pred", "y_true")):
+    """Raise ValueError if two inputs have different lengths
+
+    :param first: array-like
+    :param second: array-like
+    :param names: names of the inputs used in the error message
+    :type names: (str, str)
+    :return: None
+    """
+    if len(first) != len(second):
+        raise ValueError(
+            "{} and {} must have the same length, got {} and {}".format(
+                names[0], names[1], len(first), len(second)
+            )
+        )
@@ -0,0 +1,238 @@
+import functools
+import inspect
+import json
+import threading
+import time
+
+_enabled = False
+_records = []
+_records_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable():
+    """Start recording calls and spans of instrumented functions
+
+    :return: None
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording calls and spans - instrumented functions fall straight through to the wrapped code
+
+    :return: None
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Whether instrumentation is currently recording
+
+    :return: True if recording
+    :rtype: bool
+    """
+    return _enabled
+
+
+def reset():
+    """Discard all recorded calls and spans
+
+    :return: None
+    """
+    with _records_lock:
+        _records.clear()
+
+
+def get_records():
+    """Copy of the records collected so far, in order of completion
+
+    :return: records - dicts with keys name, kind, parent, start, duration_s and input_size
+    :rtype: list
+    """
+    with _records_lock:
+        return list(_records)
+
+
+class _Span:
+    """Times a named block of code and records it on exit, nested under the enclosing span of the same thread"""
+
+    __slots__ = ("name", "kind", "input_size", "parent", "start")
+
+    def __init__(self, name, kind="span", input_size=None):
+        self.name = name
+        self.kind = kind
+        self.input_size = input_size
+
+    def __enter__(self):
+        stack = _get_stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        _get_stack().pop()
+
+        record = {
+            "name": self.name,
+            "kind": self.kind,
+            "parent": self.parent,
+            "start": self.start,
+            "duration_s": duration,
+            "input_size": self.input_size,
+        }
+        with _records_lock:
+            _records.append(record)
+
+        return False
+
+
+class _NullSpan:
+    """Stand-in returned by span() while instrumentation is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _get_stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+
+    return stack
+
+
+def span(name, input_size=None):
+    """Context manager timing a stage inside an instrumented function, e.g. sorting or integration
+
+    :param name: name of the stage
+    :type name: str
+    :param input_size: optional number of samples processed by the stage
+    :type input_size: int
+    :return: context manager - a shared no-op object when instrumentation is disabled
+    """
+    if not _enabled:
+        return _NULL_SPAN
+
+    return _Span(name, input_size=input_size)
+
+
+def profiled(size_arg=None):
+    """Decorator recording duration and input size of each call to a function while instrumentation is enabled
+
+    :param size_arg: name of the argument whose length is recorded as the input size
+    :type size_arg: str
+    :return: decorator
+    """
+
+    def decorator(func):
+        name = "{}.{}".format(func.__module__, func.__qualname__)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            input_size = None
+            if size_arg is not None:
+                bound = signature.bind_partial(*args, **kwargs)
+                input_size = _get_length(bound.arguments.get(size_arg))
+
+            with _Span(name, kind="call", input_size=input_size):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _get_length(value):
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def export_jsonl(path):
+    """Write recorded calls and spans to a JSON lines file, one record per line
+
+    :param path: output file path
+    :type path: str
+    :return: None
+    """
+    with open(path, "w") as f:
+        for record in get_records():
+            f.write(json.dumps(record) + "\n")
+
+
+def export_prometheus(path, prefix="metric_eval"):
+    """Write totals per call/span name in Prometheus text exposition format, e.g. for the node exporter textfile collector
+
+    :param path: output file path
+    :type path: str
+    :param prefix: prefix of the exported metric names
+    :type prefix: str
+    :return: None
+    """
+    with open(path, "w") as f:
+        f.write(format_prometheus(prefix=prefix))
+
+
+def format_prometheus(prefix="metric_eval"):
+    """Recorded calls and spans aggregated per name in Prometheus text exposition format
+
+    :param prefix: prefix of the exported metric names
+    :type prefix: str
+    :return: exposition text
+    :rtype: str
+    """
+    totals = {}
+    for record in get_records():
+        key = (record["kind"], record["name"])
+        count, duration, samples = totals.get(key, (0, 0.0, 0))
+        totals[key] = (
+            count + 1,
+            duration + record["duration_s"],
+            samples + (record["input_size"] or 0),
+        )
+
+    lines = [
+        "# HELP {}_duration_seconds Time spent in instrumented calls and spans".format(
+            prefix
+        ),
+        "# TYPE {}_duration_seconds summary".format(prefix),
+    ]
+    for (kind, name), (count, duration, _) in sorted(totals.items()):
+        labels = '{{kind="{}",name="{}"}}'.format(kind, _escape_label(name))
+        lines.append("{}_duration_seconds_sum{} {!r}".format(prefix, labels, duration))
+        lines.append("{}_duration_seconds_count{} {}".format(prefix, labels, count))
+
+    lines.append(
+        "# HELP {}_input_samples_total Samples passed to instrumented calls and spans".format(
+            prefix
+        )
+    )
+    lines.append("# TYPE {}_input_samples_total counter".format(prefix))
+    for (kind, name), (_, _, samples) in sorted(totals.items()):
+        labels = '{{kind="{}",name="{}"}}'.format(kind, _escape_label(name))
+        lines.append("{}_input_samples_total{} {}".format(prefix, labels, samples))
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,217 @@
+"""Evaluate many (model, segment, metric) combinations over the same arrays in a process pool
+
+The labels, each model's scores and each segment mask are copied into shared memory once. Workers attach to them
+when they start, so tasks only carry the names of the model, segment and metric to evaluate.
+
+    with SharedMemoryEvaluator(y_true, {"logistic": p1, "forest": p2}, {"north": mask}) as evaluator:
+        results = evaluator.evaluate(metrics=("gini", "accuracy_ratio", "true_positive_rate"))
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import cap
+import confusion
+from batch_eval import get_ranking_metrics
+from inputs import as_array, as_binary, check_same_length
+
+ALL_SAMPLES = "all"
+
+# views of the shared arrays in a worker process, keyed by (kind, name)
+_worker_arrays = {}
+_worker_blocks = []
+
+
+class _PrecomputedScores:
+    """Stands in for a classifier whose scores have already been computed, so cap functions can be reused"""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def predict(self, X):
+        return self.scores
+
+
+def _gini(scores, y_true, threshold):
+    # one bin per distinct score makes batch_eval's histogram Gini exact - O(n log n) instead of the O(n^2) pairs of
+    # gini.gini_coefficient, with ties counted the same way
+    score_values, score_bins = np.unique(scores, return_inverse=True)
+    positive_counts = np.bincount(score_bins[y_true], minlength=len(score_values))
+    negative_counts = np.bincount(score_bins[~y_true], minlength=len(score_values))
+
+    return get_ranking_metrics(positive_counts, negative_counts)[0]
+
+
+def _accuracy_ratio(scores, y_true, threshold):
+    return cap.get_accuracy_ratio(
+        _PrecomputedScores(scores), X=None, y=y_true, method="predict"
+    )
+
+
+def _confusion_metric(function):
+    def metric(scores, y_true, threshold):
+        return function(y_pred=scores >= threshold, y_true=y_true)
+
+    return metric
+
+
+METRICS = {
+    "gini": _gini,
+    "accuracy_ratio": _accuracy_ratio,
+    "precision": _confusion_metric(confusion.get_precision),
+    "true_positive_rate": _confusion_metric(confusion.get_true_positive_rate),
+    "false_positive_rate": _confusion_metric(confusion.get_false_positive_rate),
+    "true_negative_rate": _confusion_metric(confusion.get_true_negative_rate),
+    "false_negative_rate": _confusion_metric(confusion.get_false_negative_rate),
+}
+
+
+class SharedMemoryEvaluator:
+    """Process pool evaluating metrics of several models on several segments of the same labelled samples
+
+    :param y_true: true binary classes
+    :type y_true: np.ndarray
+    :param scores: scores or probabilities keyed by model name, each the same length as y_true
+    :type scores: dict
+    :param segments: boolean masks selecting samples keyed by segment name, other than ALL_SAMPLES - all samples are
+        always evaluated too
+    :type segments: dict
+    :param processes: number of worker processes - defaults to the number of CPUs
+    :type processes: int
+    :param threshold: score threshold at which a sample is predicted positive for confusion metrics
+    :type threshold: float
+    """
+
+    def __init__(self, y_true, scores, segments=None, processes=None, threshold=0.5):
+        self.threshold = threshold
+        self.processes = processes or os.cpu_count()
+        self._blocks = []
+        self._specs = {}
+        self._executor = None
+
+        # every input is checked before any shared memory is allocated
+        if ALL_SAMPLES in (segments or {}):
+            raise ValueError(
+                "segment name '{}' is reserved for all samples".format(ALL_SAMPLES)
+            )
+        y_true = as_binary(y_true, name="y_true")
+        arrays = {("labels", None): y_true}
+        for model, model_scores in scores.items():
+            model_scores = as_array(model_scores, name="scores")
+            check_same_length(model_scores, y_true, names=("scores", "y_true"))
+            arrays[("scores", model)] = model_scores
+        for segment, mask in (segments or {}).items():
+            mask = as_binary(mask, name="segment mask")
+            check_same_length(mask, y_true, names=("segment mask", "y_true"))
+            arrays[("segments", segment)] = mask
+
+        try:
+            for key, array in arrays.items():
+                self._share(key, array)
+        except BaseException:
+            self.close()
+            raise
+
+        self.models = list(scores)
+        self.segments = [ALL_SAMPLES] + list(segments or {})
+
+    def _share(self, key, array):
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+
+        shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared_array[:] = array
+        self._specs[key] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+        return False
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=_attach_shared_arrays,
+                initargs=(self._specs,),
+            )
+
+        return self._executor
+
+    def evaluate(self, models=None, segments=None, metrics=tuple(METRICS)):
+        """Evaluate every combination of model, segment and metric
+
+        :param models: model names - defaults to all models
+        :type models: list
+        :param segments: segment names - defaults to all segments including ALL_SAMPLES
+        :type segments: list
+        :param metrics: names of metrics in METRICS
+        :type metrics: tuple
+        :return: results - one row per combination with columns model, segment, metric, samples_count and value
+        :rtype: pd.DataFrame
+        """
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(
+                    "metric should be one of {}, got '{}'".format(list(METRICS), metric)
+                )
+
+        tasks = list(product(models or self.models, segments or self.segments, metrics))
+
+        # send tasks in batches so each worker round trip amortises over several evaluations
+        chunksize = max(1, len(tasks) // (4 * self.processes))
+        results = self._get_executor().map(
+            _evaluate_task,
+            tasks,
+            [self.threshold] * len(tasks),
+            chunksize=chunksize,
+        )
+
+        return pd.DataFrame(
+            list(results),
+            columns=["model", "segment", "metric", "samples_count", "value"],
+        )
+
+    def close(self):
+        """Shut down the worker processes and release the shared memory
+
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def _attach_shared_arrays(specs):
+    for key, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _evaluate_task(task, threshold):
+    model, segment, metric = task
+
+    y_true = _worker_arrays[("labels", None)]
+    scores = _worker_arrays[("scores", model)]
+    if segment != ALL_SAMPLES:
+        mask = _worker_arrays[("segments", segment)]
+        y_true = y_true[mask]
+        scores = scores[mask]
+
+    value = METRICS[metric](scores, y_true, threshold)
+
+    return model, segment, metric, len(y_true), float(value)
@@ -0,0 +1,488 @@
+"""Confusion counts, confusion matrices and Gini/AUC computed inside the database over a predictions table
+
+Rather than pulling every scored row into Python, each metric is a single SQLAlchemy select returning a few aggregates
+per segment:
+
+- confusion counts: GROUP BY the segment columns with conditional sums over the label and predicted class
+- Gini and AUC: the Mann-Whitney rank sum of the positives, from RANK() and COUNT() window functions so that tied
+  scores get their average rank, grouped by segment
+
+Results match confusion.get_binary_outcome_counts, confusion.get_confusion_matrix and gini.gini_coefficient on the
+same rows exactly. Labels must be 0/1; the database must support window functions (SQLite 3.25+).
+
+    engine = create_engine("sqlite:///predictions.db")
+    with engine.connect() as connection:
+        ginis = gini_coefficient(connection, predictions, segment_cols=("segment",))
+
+Run from this directory to report on a database, or to check against the in-memory functions:
+
+    python sql_metrics.py predictions.db --table predictions --segment segment
+    python sql_metrics.py --benchmark 20000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    case,
+    create_engine,
+    func,
+    select,
+)
+
+OVERALL = ()
+
+predictions_metadata = MetaData()
+
+predictions = Table(
+    "predictions",
+    predictions_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("segment", String),
+    Column("label", Integer, nullable=False),
+    Column("score", Float, nullable=False),
+)
+
+
+def _get_predicted_class(table, score_col, pred_col, threshold):
+    if pred_col is not None:
+        return table.c[pred_col]
+
+    return case((table.c[score_col] >= threshold, 1), else_=0)
+
+
+def _group_by_segments(statement, segment_columns):
+    if segment_columns:
+        statement = statement.group_by(*segment_columns)
+
+    return statement
+
+
+def _get_segment_key(row, segment_cols):
+    return tuple(row._mapping[name] for name in segment_cols)
+
+
+def select_binary_outcome_counts(
+    table=predictions,
+    score_col="score",
+    label_col="label",
+    pred_col=None,
+    segment_cols=(),
+    threshold=0.5,
+):
+    """Select true/false positive/negative counts per segment using conditional sums
+
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param score_col: score column, thresholded when there is no predicted class column
+    :type score_col: str
+    :param label_col: 0/1 label column
+    :type label_col: str
+    :param pred_col: 0/1 predicted class column, or None for score >= threshold
+    :type pred_col: str
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :param threshold: score at or above which the predicted class is 1
+    :type threshold: float
+    :return: statement selecting the segment columns, true_negatives, false_positives, false_negatives and
+        true_positives
+    :rtype: sqlalchemy.sql.Select
+    """
+    segment_columns = [table.c[name] for name in segment_cols]
+    label = table.c[label_col]
+    predicted = _get_predicted_class(table, score_col, pred_col, threshold)
+
+    def count_where(label_value, predicted_value):
+        return func.coalesce(
+            func.sum(
+                case(
+                    ((label == label_value) & (predicted == predicted_value), 1),
+                    else_=0,
+                )
+            ),
+            0,
+        )
+
+    statement = select(
+        *segment_columns,
+        count_where(0, 0).label("true_negatives"),
+        count_where(0, 1).label("false_positives"),
+        count_where(1, 0).label("false_negatives"),
+        count_where(1, 1).label("true_positives"),
+    )
+
+    return _group_by_segments(statement, segment_columns)
+
+
+def get_binary_outcome_counts(connection, table=predictions, segment_cols=(), **kwargs):
+    """True/False Positive/Negative counts per segment, as confusion.get_binary_outcome_counts
+
+    :param connection: connection to the database holding the table
+    :type connection: sqlalchemy.engine.Connection
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :param kwargs: column names and threshold, see select_binary_outcome_counts
+    :return: counts - (true_negatives, false_positives, false_negatives, true_positives) keyed by tuple of segment
+        values, OVERALL without segment columns
+    :rtype: dict
+    """
+    statement = select_binary_outcome_counts(table, segment_cols=segment_cols, **kwargs)
+
+    return {
+        _get_segment_key(row, segment_cols): (
+            row.true_negatives,
+            row.false_positives,
+            row.false_negatives,
+            row.true_positives,
+        )
+        for row in connection.execute(statement)
+    }
+
+
+def select_confusion_counts(
+    table=predictions,
+    score_col="score",
+    label_col="label",
+    pred_col=None,
+    segment_cols=(),
+    threshold=0.5,
+):
+    """Select the number of rows of each (true class, predicted class) per segment
+
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param score_col: score column, thresholded when there is no predicted class column
+    :type score_col: str
+    :param label_col: true class column
+    :type label_col: str
+    :param pred_col: predicted class column, or None for score >= threshold
+    :type pred_col: str
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :param threshold: score at or above which the predicted class is 1
+    :type threshold: float
+    :return: statement selecting the segment columns, true, pred and rows_count
+    :rtype: sqlalchemy.sql.Select
+    """
+    segment_columns = [table.c[name] for name in segment_cols]
+    true_class = table.c[label_col].label("true")
+    predicted_class = _get_predicted_class(table, score_col, pred_col, threshold).label(
+        "pred"
+    )
+
+    return select(
+        *segment_columns, true_class, predicted_class, func.count().label("rows_count")
+    ).group_by(*segment_columns, true_class, predicted_class)
+
+
+def get_confusion_matrix(connection, table=predictions, segment_cols=(), **kwargs):
+    """Confusion matrix per segment, as confusion.get_confusion_matrix
+
+    :param connection: connection to the database holding the table
+    :type connection: sqlalchemy.engine.Connection
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :param kwargs: column names and threshold, see select_confusion_counts
+    :return: confusion matrices keyed by tuple of segment values, OVERALL without segment columns - rows are true,
+        columns are predictions, values are counts
+    :rtype: dict
+    """
+    import pandas as pd
+
+    statement = select_confusion_counts(table, segment_cols=segment_cols, **kwargs)
+    counts = {}
+    for row in connection.execute(statement):
+        segment_counts = counts.setdefault(_get_segment_key(row, segment_cols), {})
+        segment_counts[row.true, row.pred] = row.rows_count
+
+    confusion_matrices = {}
+    for key, segment_counts in counts.items():
+        # like crosstab, only classes seen in the segment get a row or column, and missing pairs count zero
+        row_vals = np.array(sorted({true for true, _ in segment_counts}))
+        column_vals = np.array(sorted({pred for _, pred in segment_counts}))
+        data = np.zeros((len(row_vals), len(column_vals)), dtype=np.int64)
+        for (true, pred), count in segment_counts.items():
+            data[
+                np.searchsorted(row_vals, true), np.searchsorted(column_vals, pred)
+            ] = count
+
+        confusion_matrices[key] = pd.DataFrame(
+            index=pd.Index(row_vals, name="True"),
+            columns=pd.Index(column_vals, name="Pred"),
+            data=data,
+        )
+
+    return confusion_matrices
+
+
+def select_rank_sums(
+    table=predictions, score_col="score", label_col="label", segment_cols=()
+):
+    """Select the number of rows and positives and twice the rank sum of the positives per segment
+
+    Ranks are by ascending score within the segment, with tied scores sharing their average rank. Twice the average
+    rank, 2 * RANK() + (number of ties - 1), is always an integer, so the sums are exact.
+
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param score_col: score column
+    :type score_col: str
+    :param label_col: 0/1 label column
+    :type label_col: str
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :return: statement selecting the segment columns, rows_count, positives_count and twice_positive_rank_sum
+    :rtype: sqlalchemy.sql.Select
+    """
+    segment_columns = [table.c[name] for name in segment_cols]
+    score = table.c[score_col]
+    ranked = select(
+        *segment_columns,
+        table.c[label_col].label("label"),
+        (
+            2 * func.rank().over(partition_by=segment_columns, order_by=score)
+            + func.count().over(partition_by=segment_columns + [score])
+            - 1
+        ).label("twice_rank"),
+    ).subquery("ranked")
+
+    ranked_segment_columns = [ranked.c[column.name] for column in segment_columns]
+    statement = select(
+        *ranked_segment_columns,
+        func.count().label("rows_count"),
+        func.coalesce(func.sum(ranked.c.label), 0).label("positives_count"),
+        func.coalesce(
+            func.sum(case((ranked.c.label == 1, ranked.c.twice_rank), else_=0)), 0
+        ).label("twice_positive_rank_sum"),
+    )
+
+    return _group_by_segments(statement, ranked_segment_columns)
+
+
+def _get_gini(rows_count, positives_count, twice_positive_rank_sum):
+    negatives_count = rows_count - positives_count
+
+    # concordant less discordant (positive, negative) pairs - an integer, from the Mann-Whitney U statistic
+    concordance = (
+        twice_positive_rank_sum
+        - positives_count * (positives_count + 1)
+        - positives_count * negatives_count
+    )
+
+    # the same float64 operations as gini.somers_d and gini.kendalls_tau, so results are identical
+    n_pairs = rows_count * (rows_count - 1) / 2
+    tau = np.float64(concordance)
+    tau /= n_pairs
+    tau_labels = np.float64(positives_count * negatives_count)
+    tau_labels /= n_pairs
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return tau / tau_labels
+
+
+def gini_coefficient(connection, table=predictions, segment_cols=(), **kwargs):
+    """Gini coefficient of the scores per segment, as gini.gini_coefficient
+
+    NaN for segments where every label is the same.
+
+    :param connection: connection to the database holding the table
+    :type connection: sqlalchemy.engine.Connection
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :param kwargs: score_col and label_col, see select_rank_sums
+    :return: Gini coefficients keyed by tuple of segment values, OVERALL without segment columns
+    :rtype: dict
+    """
+    statement = select_rank_sums(table, segment_cols=segment_cols, **kwargs)
+
+    return {
+        _get_segment_key(row, segment_cols): _get_gini(
+            row.rows_count, row.positives_count, row.twice_positive_rank_sum
+        )
+        for row in connection.execute(statement)
+    }
+
+
+def get_auc(connection, table=predictions, segment_cols=(), **kwargs):
+    """Area under the ROC curve of the scores per segment, (Gini + 1) / 2
+
+    :param connection: connection to the database holding the table
+    :type connection: sqlalchemy.engine.Connection
+    :param table: predictions table
+    :type table: sqlalchemy.Table
+    :param segment_cols: columns to group by
+    :type segment_cols: tuple
+    :param kwargs: score_col and label_col, see select_rank_sums
+    :return: AUCs keyed by tuple of segment values, OVERALL without segment columns
+    :rtype: dict
+    """
+    ginis = gini_coefficient(connection, table, segment_cols=segment_cols, **kwargs)
+
+    return {key: (gini + 1) / 2 for key, gini in ginis.items()}
+
+
+def generate_predictions(rows_count, segments_count=4, seed=0):
+    """Random scored rows for the predictions table, with scores rounded so that some are tied
+
+    :param rows_count: number of rows
+    :type rows_count: int
+    :param segments_count: number of distinct segments
+    :type segments_count: int
+    :param seed: random seed
+    :type seed: int
+    :return: rows - dicts with id, segment, label and score
+    :rtype: list
+    """
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 2, rows_count)
+    scores = np.round(np.clip(rng.normal(0.4 + 0.2 * labels, 0.2), 0, 1), 3)
+    segments = rng.integers(0, segments_count, rows_count)
+
+    return [
+        {
+            "id": i + 1,
+            "segment": "segment_{}".format(segment),
+            "label": int(label),
+            "score": float(score),
+        }
+        for i, (segment, label, score) in enumerate(zip(segments, labels, scores))
+    ]
+
+
+def benchmark(rows_count, segments_count=4):
+    """Compare computing per-segment metrics in SQL with fetching the rows and using the in-memory functions
+
+    Raises AssertionError if any result differs.
+
+    :param rows_count: number of rows in the predictions table
+    :type rows_count: int
+    :param segments_count: number of segments
+    :type segments_count: int
+    :return: results - dicts with method and seconds
+    :rtype: list
+    """
+    import confusion
+    import gini
+
+    engine = create_engine("sqlite://")
+    predictions_metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            predictions.insert(), generate_predictions(rows_count, segments_count)
+        )
+
+    segment_cols = ("segment",)
+    results = []
+    with engine.connect() as connection:
+        start = time.perf_counter()
+        sql_counts = get_binary_outcome_counts(connection, segment_cols=segment_cols)
+        sql_matrices = get_confusion_matrix(connection, segment_cols=segment_cols)
+        sql_ginis = gini_coefficient(connection, segment_cols=segment_cols)
+        results.append({"method": "sql", "seconds": time.perf_counter() - start})
+
+        start = time.perf_counter()
+        rows = connection.execute(
+            select(predictions.c.segment, predictions.c.label, predictions.c.score)
+        ).all()
+        segments = np.array([row.segment for row in rows])
+        labels = np.array([row.label for row in rows])
+        scores = np.array([row.score for row in rows])
+        for segment in np.unique(segments):
+            mask = segments == segment
+            key = (segment,)
+            predicted = (scores[mask] >= 0.5).astype(np.int64)
+            assert sql_counts[key] == confusion.get_binary_outcome_counts(
+                predicted, labels[mask]
+            )
+            assert sql_matrices[key].equals(
+                confusion.get_confusion_matrix(predicted, labels[mask])
+            )
+            assert sql_ginis[key] == gini.gini_coefficient(scores[mask], labels[mask])
+        results.append({"method": "in_memory", "seconds": time.perf_counter() - start})
+
+    engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compute confusion counts and Gini coefficients inside a database"
+    )
+    parser.add_argument("path", nargs="?", help="SQLite database file")
+    parser.add_argument("--table", default="predictions")
+    parser.add_argument("--score-col", default="score")
+    parser.add_argument("--label-col", default="label")
+    parser.add_argument(
+        "--pred-col", help="predicted class column (default: score >= threshold)"
+    )
+    parser.add_argument(
+        "--segment", action="append", default=[], dest="segment_cols", metavar="COL"
+    )
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="ROWS",
+        help="compare with the in-memory functions on generated rows instead",
+    )
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for result in benchmark(args.benchmark):
+            print("{method:>10} {seconds:>8.3f}s".format(**result))
+        return
+    if args.path is None:
+        parser.error("a database path is required without --benchmark")
+
+    engine = create_engine("sqlite:///{}".format(args.path))
+    table = Table(args.table, MetaData(), autoload_with=engine)
+    segment_cols = tuple(args.segment_cols)
+    with engine.connect() as connection:
+        counts = get_binary_outcome_counts(
+            connection,
+            table,
+            segment_cols=segment_cols,
+            score_col=args.score_col,
+            label_col=args.label_col,
+            pred_col=args.pred_col,
+            threshold=args.threshold,
+        )
+        ginis = gini_coefficient(
+            connection,
+            table,
+            segment_cols=segment_cols,
+            score_col=args.score_col,
+            label_col=args.label_col,
+        )
+
+    print(
+        "segment\ttrue_negatives\tfalse_positives\tfalse_negatives\ttrue_positives\tgini"
+    )
+    # NULL segment values (None) sort after the others instead of failing to compare
+    for key in sorted(
+        counts, key=lambda key: tuple((value is None, value) for value in key)
+    ):
+        print(
+            "\t".join(
+                [" / ".join(map(str, key)) or "all"]
+                + [str(count) for count in counts[key]]
+                + ["{:.6f}".format(ginis[key])]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
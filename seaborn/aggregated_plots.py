@@ -0,0 +1,620 @@
+"""Scatter plots and histograms of millions of rows, binned in NumPy before seaborn or matplotlib sees them
+
+relplot and displot draw one artist per point or aggregate in pandas per facet, so their time and memory grow with
+the number of rows. Here rows are binned once, in a single pass over all hue/col/row groups, and only the bins are
+plotted, so rendering time depends on the number of bins and facets, not rows:
+
+- raster_relplot draws each facet's scatter as an image of a 2-D histogram - every pixel is coloured by the mix of
+  hue levels (or the mean of a numeric hue) falling in it, and shaded by its log count
+- binned_displot passes bin counts to sns.displot as weights, so stat, common_norm, multiple and the other histogram
+  options behave exactly as for the raw rows
+
+    grid = raster_relplot(events, x="latency_ms", y="size_kb", hue="kind", col="region", col_wrap=4)
+    grid = binned_displot(events, x="latency_ms", hue="kind", col="region", stat="density", common_norm=False)
+
+Bins are shared across facets, matching seaborn's default shared axes. Run from this directory to compare render
+times with seaborn's on synthetic event data:
+
+    python aggregated_plots.py --rows 20000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as plt
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+from matplotlib.patches import Patch
+
+import seaborn as sns
+
+DEFAULT_HIST_BINS = 50
+DEFAULT_RASTER_BINS = (300, 200)
+COUNT = "count"
+
+
+def get_group_codes(data, columns):
+    """Code of each row's combination of values in columns, and the combinations present
+
+    Rows with a missing value in any column get code -1. Combinations are ordered like a sorted groupby.
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param columns: grouping columns, may be empty
+    :type columns: list
+    :return: codes, keys - one row per combination, with columns as data's
+    :rtype: (np.ndarray, pd.DataFrame)
+    """
+    if not columns:
+        return np.zeros(len(data), dtype=np.intp), pd.DataFrame(index=[0])
+
+    factorized = [pd.factorize(data[column], sort=True) for column in columns]
+    shape = tuple(max(len(uniques), 1) for _, uniques in factorized)
+    missing = np.zeros(len(data), dtype=bool)
+    for codes, _ in factorized:
+        missing |= codes < 0
+    combined = np.ravel_multi_index(
+        tuple(np.where(missing, 0, codes) for codes, _ in factorized), shape
+    )
+
+    # a lookup from the full product of levels to the combinations actually present keeps this O(rows)
+    present = np.flatnonzero(np.bincount(combined[~missing], minlength=np.prod(shape)))
+    lookup = np.full(np.prod(shape), -1, dtype=np.intp)
+    lookup[present] = np.arange(len(present))
+    codes = np.where(missing, -1, lookup[combined])
+
+    level_codes = np.unravel_index(present, shape)
+    keys = pd.DataFrame(
+        {
+            column: pd.Series(uniques.take(level_codes[i]))
+            for i, (column, (_, uniques)) in enumerate(zip(columns, factorized))
+        }
+    )
+
+    return codes, keys
+
+
+def get_bin_edges(values, bins=DEFAULT_HIST_BINS, binrange=None):
+    """Equal-width bin edges spanning values, or the edges given
+
+    :param values: numeric values, NaN ignored
+    :type values: np.ndarray
+    :param bins: number of bins, or bin edges
+    :type bins: int | Sequence[float]
+    :param binrange: lowest and highest edge, defaults to the range of values
+    :type binrange: (float, float)
+    :return: edges
+    :rtype: np.ndarray
+    """
+    if not np.isscalar(bins):
+        return np.asarray(bins, dtype=float)
+
+    low, high = (
+        binrange if binrange is not None else (np.nanmin(values), np.nanmax(values))
+    )
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+
+    return np.linspace(low, high, bins + 1)
+
+
+def _digitize(values, edges):
+    """Bin index of each value, -1 outside the edges or for NaN - the last bin includes the highest edge"""
+    values = np.asarray(values, dtype=float)
+    bins_count = len(edges) - 1
+    widths = np.diff(edges)
+    if np.allclose(widths, widths[0]):
+        indices = np.floor((values - edges[0]) / widths[0])
+    else:
+        indices = np.searchsorted(edges, values, side="right").astype(float) - 1
+    indices[values == edges[-1]] = bins_count - 1
+    outside = ~((indices >= 0) & (indices < bins_count))
+
+    return np.where(outside, -1, indices).astype(np.intp)
+
+
+def aggregate_histogram(
+    data,
+    x,
+    y=None,
+    hue=None,
+    col=None,
+    row=None,
+    bins=DEFAULT_HIST_BINS,
+    binrange=None,
+):
+    """Count rows in equal bins of x (and y) for each combination of hue, col and row
+
+    Categorical or object x and y are counted by value rather than binned.
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: column binned on the x axis
+    :type x: str
+    :param y: column binned on the y axis, for bivariate histograms
+    :type y: str
+    :param hue: column mapped to colour
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param bins: number of bins or bin edges, a pair for x and y when y is given
+    :type bins: int | Sequence
+    :param binrange: lowest and highest edge, a pair of pairs when y is given
+    :type binrange: tuple
+    :return: counts, edges - non-empty bins with the grouping columns, x (and y) set to the bin centres or values and
+        a count column; edges of x (and y), None for columns counted by value
+    :rtype: (pd.DataFrame, list)
+    """
+    variables = [x] if y is None else [x, y]
+    if y is None:
+        bins, binrange = [bins], [binrange]
+    else:
+        bins = [bins, bins] if np.isscalar(bins) else list(bins)
+        binrange = [None, None] if binrange is None else list(binrange)
+
+    groups = [column for column in (row, col, hue) if column is not None]
+    codes, keys = get_group_codes(data, groups)
+    valid = codes >= 0
+    combined = codes
+    shape = [len(keys)]
+    all_edges = []
+    centres = []
+
+    for variable, variable_bins, variable_range in zip(variables, bins, binrange):
+        values = data[variable]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(
+            values
+        ):
+            values = values.to_numpy(dtype=float)
+            edges = get_bin_edges(values, variable_bins, variable_range)
+            indices = _digitize(values, edges)
+            levels = pd.Series((edges[:-1] + edges[1:]) / 2)
+        else:
+            indices, levels = get_group_codes(data, [variable])
+            levels = levels[variable]
+            edges = None
+        valid &= indices >= 0
+        combined = combined * len(levels) + indices
+        shape.append(len(levels))
+        all_edges.append(edges)
+        centres.append(levels)
+
+    counts = np.bincount(combined[valid], minlength=np.prod(shape))
+    present = np.flatnonzero(counts)
+    indices = np.unravel_index(present, shape)
+
+    result = keys.iloc[indices[0]].reset_index(drop=True)
+    for variable, levels, variable_indices in zip(variables, centres, indices[1:]):
+        result[variable] = levels.iloc[variable_indices].reset_index(drop=True)
+    result[COUNT] = counts[present]
+
+    return result, all_edges
+
+
+def binned_displot(
+    data,
+    x,
+    y=None,
+    hue=None,
+    col=None,
+    row=None,
+    bins=DEFAULT_HIST_BINS,
+    binrange=None,
+    **kwargs,
+):
+    """Histogram of data with sns.displot, drawn from bin counts instead of rows
+
+    Counts are passed as weights with the same bin edges, so stat, common_norm, multiple, element, cbar and the
+    faceting options apply as if displot had binned the rows itself.
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: column on the x axis
+    :type x: str
+    :param y: column on the y axis, for bivariate histograms
+    :type y: str
+    :param hue: column mapped to colour
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param bins: number of bins or bin edges, a pair for x and y when y is given
+    :type bins: int | Sequence
+    :param binrange: lowest and highest edge, a pair of pairs when y is given
+    :type binrange: tuple
+    :param kwargs: further displot arguments, except kind, weights, bins and binwidth
+    :return: grid
+    :rtype: sns.FacetGrid
+    """
+    counts, edges = aggregate_histogram(
+        data, x, y=y, hue=hue, col=col, row=row, bins=bins, binrange=binrange
+    )
+
+    # seaborn compares bins to "auto", so edges are passed as lists
+    discrete = [variable_edges is None for variable_edges in edges]
+    bins = [
+        "auto" if variable_edges is None else variable_edges.tolist()
+        for variable_edges in edges
+    ]
+    if y is None:
+        kwargs.setdefault("discrete", discrete[0])
+        kwargs["bins"] = bins[0]
+    else:
+        kwargs.setdefault("discrete", tuple(discrete))
+        kwargs["bins"] = tuple(bins)
+
+    return sns.displot(
+        data=counts,
+        x=x,
+        y=y,
+        hue=hue,
+        col=col,
+        row=row,
+        weights=COUNT,
+        kind="hist",
+        **kwargs,
+    )
+
+
+def aggregate_scatter(
+    data,
+    x,
+    y,
+    hue=None,
+    col=None,
+    row=None,
+    bins=DEFAULT_RASTER_BINS,
+    xlim=None,
+    ylim=None,
+):
+    """2-D histograms of x and y for each facet and hue level, the raster form of a scatter plot
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: numeric column on the x axis
+    :type x: str
+    :param y: numeric column on the y axis
+    :type y: str
+    :param hue: column mapped to colour - categorical levels are counted separately, numeric values are averaged
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param bins: number of bins along x and y - the resolution of each facet's image
+    :type bins: (int, int)
+    :param xlim: x range, defaults to the range of x
+    :type xlim: (float, float)
+    :param ylim: y range, defaults to the range of y
+    :type ylim: (float, float)
+    :return: raster - dict with facets (one row per facet with its col/row values), hue_levels (None for no or
+        numeric hue), counts (facets x hue levels x x bins x y bins), hue_means (facets x x bins x y bins, numeric hue
+        only), hue_range, xedges and yedges
+    :rtype: dict
+    """
+    facets = [column for column in (row, col) if column is not None]
+    facet_codes, facet_keys = get_group_codes(data, facets)
+
+    x_values = data[x].to_numpy(dtype=float)
+    y_values = data[y].to_numpy(dtype=float)
+    xedges = get_bin_edges(x_values, bins[0], xlim)
+    yedges = get_bin_edges(y_values, bins[1], ylim)
+    x_indices = _digitize(x_values, xedges)
+    y_indices = _digitize(y_values, yedges)
+    valid = (facet_codes >= 0) & (x_indices >= 0) & (y_indices >= 0)
+
+    numeric_hue = hue is not None and pd.api.types.is_numeric_dtype(data[hue])
+    if hue is None or numeric_hue:
+        hue_codes = np.zeros(len(data), dtype=np.intp)
+        hue_levels = None
+    else:
+        hue_codes, hue_levels = get_group_codes(data, [hue])
+        hue_levels = hue_levels[hue]
+        valid &= hue_codes >= 0
+    if numeric_hue:
+        hue_values = data[hue].to_numpy(dtype=float)
+        valid &= ~np.isnan(hue_values)
+
+    shape = (
+        len(facet_keys),
+        1 if hue_levels is None else len(hue_levels),
+        len(xedges) - 1,
+        len(yedges) - 1,
+    )
+    cells = np.ravel_multi_index(
+        (facet_codes[valid], hue_codes[valid], x_indices[valid], y_indices[valid]),
+        shape,
+    )
+    counts = np.bincount(cells, minlength=np.prod(shape)).reshape(shape)
+
+    raster = {
+        "facets": facet_keys,
+        "hue_levels": hue_levels,
+        "counts": counts,
+        "hue_means": None,
+        "hue_range": None,
+        "xedges": xedges,
+        "yedges": yedges,
+    }
+    if numeric_hue:
+        sums = np.bincount(
+            cells, weights=hue_values[valid], minlength=np.prod(shape)
+        ).reshape(shape)[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            raster["hue_means"] = sums / counts[:, 0]
+        raster["hue_range"] = (np.nanmin(hue_values), np.nanmax(hue_values))
+
+    return raster
+
+
+def get_rgba_images(raster, colors=None, cmap=None, min_alpha=0.3):
+    """Colour each facet's histogram: hue mix or mean as colour, log count as opacity
+
+    Opacity is normalized by the largest count of all facets, so equal shading means equal density across facets.
+    Pixels with any rows are at least min_alpha opaque so that isolated points stay visible.
+
+    :param raster: output of aggregate_scatter
+    :type raster: dict
+    :param colors: RGB colour of each hue level, or of all points without hue
+    :type colors: Sequence
+    :param cmap: colormap of a numeric hue
+    :type cmap: matplotlib.colors.Colormap
+    :param min_alpha: opacity of a pixel with a single row
+    :type min_alpha: float
+    :return: images - facets x y bins x x bins x RGBA, with y increasing along the rows
+    :rtype: np.ndarray
+    """
+    counts = raster["counts"].astype(float)
+    totals = counts.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if raster["hue_means"] is not None:
+            norm = Normalize(*raster["hue_range"])
+            rgb = cmap(norm(np.nan_to_num(raster["hue_means"])))[..., :3]
+        else:
+            # average the hue colours weighted by the number of rows of each level in the pixel
+            rgb = np.einsum("fhxy,hc->fxyc", counts, np.asarray(colors)[:, :3])
+            rgb /= totals[..., np.newaxis]
+        alpha = min_alpha + (1 - min_alpha) * np.log(np.maximum(totals, 1)) / np.log(
+            max(totals.max(), 2)
+        )
+    alpha[totals == 0] = 0
+
+    images = np.concatenate([np.nan_to_num(rgb), alpha[..., np.newaxis]], axis=-1)
+
+    return images.transpose(0, 2, 1, 3)
+
+
+def raster_relplot(
+    data,
+    x,
+    y,
+    hue=None,
+    col=None,
+    row=None,
+    col_wrap=None,
+    bins=DEFAULT_RASTER_BINS,
+    xlim=None,
+    ylim=None,
+    palette=None,
+    hue_order=None,
+    min_alpha=0.3,
+    legend=True,
+    height=5,
+    aspect=1,
+    **kwargs,
+):
+    """Scatter plot of data on a FacetGrid, drawn as one image of binned counts per facet
+
+    Takes relplot's hue, col, row, col_wrap, palette, height and aspect. Each facet's image has the same bins, colours
+    and shading scale.
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: numeric column on the x axis
+    :type x: str
+    :param y: numeric column on the y axis
+    :type y: str
+    :param hue: column mapped to colour
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param col_wrap: wrap the column facets at this width
+    :type col_wrap: int
+    :param bins: number of bins along x and y - the resolution of each facet's image
+    :type bins: (int, int)
+    :param xlim: x range, defaults to the range of x
+    :type xlim: (float, float)
+    :param ylim: y range, defaults to the range of y
+    :type ylim: (float, float)
+    :param palette: colours of the hue levels, or colormap of a numeric hue
+    :param hue_order: order of the hue levels in the palette and legend - rows of other levels are not drawn
+    :type hue_order: list
+    :param min_alpha: opacity of a pixel with a single row
+    :type min_alpha: float
+    :param legend: add a legend (categorical hue) or colorbar (numeric hue)
+    :type legend: bool
+    :param height: height of each facet in inches
+    :type height: float
+    :param aspect: width of each facet relative to its height
+    :type aspect: float
+    :param kwargs: further FacetGrid arguments
+    :return: grid
+    :rtype: sns.FacetGrid
+    """
+    raster = aggregate_scatter(
+        data, x, y, hue=hue, col=col, row=row, bins=bins, xlim=xlim, ylim=ylim
+    )
+
+    if hue_order is not None and raster["hue_levels"] is not None:
+        # like relplot, levels missing from the data get no pixels and rows of levels left out of hue_order are dropped
+        positions = {level: i for i, level in enumerate(raster["hue_levels"])}
+        counts = np.zeros(
+            (raster["counts"].shape[0], len(hue_order)) + raster["counts"].shape[2:],
+            dtype=raster["counts"].dtype,
+        )
+        for i, level in enumerate(hue_order):
+            if level in positions:
+                counts[:, i] = raster["counts"][:, positions[level]]
+        raster = dict(raster, counts=counts, hue_levels=list(hue_order))
+
+    colors, cmap, hue_levels = None, None, raster["hue_levels"]
+    if raster["hue_means"] is not None:
+        cmap = (
+            sns.color_palette(palette, as_cmap=True)
+            if palette is not None
+            else sns.cubehelix_palette(as_cmap=True)
+        )
+    elif hue_levels is None:
+        colors = [sns.color_palette(palette)[0]]
+    else:
+        colors = sns.color_palette(palette, len(hue_levels))
+    images = get_rgba_images(raster, colors=colors, cmap=cmap, min_alpha=min_alpha)
+
+    grid = sns.FacetGrid(
+        raster["facets"],
+        col=col,
+        row=row,
+        col_wrap=col_wrap,
+        height=height,
+        aspect=aspect,
+        **kwargs,
+    )
+    extent = (
+        raster["xedges"][0],
+        raster["xedges"][-1],
+        raster["yedges"][0],
+        raster["yedges"][-1],
+    )
+    for image, (_, facet) in zip(images, raster["facets"].iterrows()):
+        if row is not None and col is not None:
+            key = (facet[row], facet[col])
+        elif row is not None or col is not None:
+            key = facet[row if row is not None else col]
+        else:
+            key = None
+        ax = grid.ax if key is None else grid.axes_dict[key]
+        ax.imshow(
+            image,
+            extent=extent,
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+        )
+
+    grid.set_titles()
+    grid.set_axis_labels(x, y)
+    if legend and cmap is not None:
+        mappable = ScalarMappable(Normalize(*raster["hue_range"]), cmap)
+        grid.figure.colorbar(mappable, ax=grid.axes.ravel().tolist(), label=hue)
+    elif legend and hue_levels is not None:
+        grid.add_legend(
+            legend_data={
+                str(level): Patch(color=color)
+                for level, color in zip(hue_levels, colors)
+            },
+            title=hue,
+        )
+    if cmap is None:
+        grid.tight_layout()
+
+    return grid
+
+
+def generate_events(rows, seed=0):
+    """Synthetic event data - skewed latencies and sizes with a categorical kind and region
+
+    :param rows: number of rows
+    :type rows: int
+    :param seed: random seed
+    :type seed: int
+    :return: events - columns latency_ms, size_kb, kind and region
+    :rtype: pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    kinds = pd.Categorical.from_codes(
+        rng.choice(3, rows, p=[0.6, 0.3, 0.1]), ["read", "write", "delete"]
+    )
+    regions = pd.Categorical.from_codes(
+        rng.integers(0, 4, rows), ["eu", "us", "apac", "latam"]
+    )
+    size_kb = rng.lognormal(3, 1, rows).astype(np.float32)
+    latency_ms = (
+        rng.lognormal(1, 0.5, rows) * (1 + kinds.codes) + size_kb / 50
+    ).astype(np.float32)
+
+    return pd.DataFrame(
+        {"latency_ms": latency_ms, "size_kb": size_kb, "kind": kinds, "region": regions}
+    )
+
+
+def benchmark(rows_counts, max_seaborn_rows=100_000):
+    """Time drawing a faceted scatter plot and histogram with seaborn and from aggregates
+
+    Figures are rendered with the Agg backend and closed, so times include drawing but not display.
+
+    :param rows_counts: numbers of rows
+    :type rows_counts: list
+    :param max_seaborn_rows: largest number of rows plotted directly with seaborn
+    :type max_seaborn_rows: int
+    :return: results - dicts with rows, method and seconds
+    :rtype: list
+    """
+    plt.switch_backend("Agg")
+    events = generate_events(max(rows_counts))
+    scatter = dict(x="size_kb", y="latency_ms", hue="kind", col="region", col_wrap=2)
+    histogram = dict(x="latency_ms", hue="kind", col="region", col_wrap=2)
+
+    def time_plot(function, data, **kwargs):
+        start = time.perf_counter()
+        grid = function(data, height=3, **kwargs)
+        grid.figure.canvas.draw()
+        seconds = time.perf_counter() - start
+        plt.close(grid.figure)
+        return seconds
+
+    methods = {
+        "relplot": (sns.relplot, scatter),
+        "raster_relplot": (raster_relplot, scatter),
+        "displot": (sns.displot, histogram),
+        "binned_displot": (binned_displot, histogram),
+    }
+    results = []
+    for rows_count in rows_counts:
+        data = events.iloc[:rows_count]
+        for method, (function, kwargs) in methods.items():
+            if function in (sns.relplot, sns.displot) and rows_count > max_seaborn_rows:
+                continue
+            results.append(
+                {
+                    "rows": rows_count,
+                    "method": method,
+                    "seconds": time_plot(function, data, **kwargs),
+                }
+            )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare faceted scatter and histogram render times with and without pre-aggregation"
+    )
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 20_000_000]
+    )
+    parser.add_argument("--max-seaborn-rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.rows, args.max_seaborn_rows):
+        print("{rows:>10} {method:>16} {seconds:>8.2f}s".format(**result))
+
+
+if __name__ == "__main__":
+    main()
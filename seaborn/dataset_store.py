@@ -0,0 +1,383 @@
+"""Local columnar copies of datasets, memory-mapped on load instead of fetched and parsed from CSV every time
+
+sns.load_dataset downloads (or re-parses) a CSV on every call and fails without network access. Here a dataset is
+imported once into a directory of one .npy file per column:
+
+- text columns become categoricals, stored as integer codes with the categories in the metadata
+- integers are downcast to the smallest type holding their range, and floats to float32 when no value changes
+- datetimes and timedeltas are stored as int64, with their dtype (and time zone) in the metadata
+- nullable Int64, Float64 and boolean columns are stored as values and a file of their missing-value mask
+
+Loading memory-maps the column files read-only, so it takes milliseconds whatever the size, pages are read only when
+used, and every process loading the same dataset shares them in the page cache. Stores are versioned by format, so a
+change of layout starts a fresh directory rather than misreading an old one.
+
+    import dataset_store
+
+    dataset_store.import_dataset("tips")  # once, from seaborn's repository or sns.load_dataset's cache
+    dataset_store.import_csv("events", "events.csv")
+    tips = dataset_store.load_dataset("tips")
+
+Columns are read-only views of the files - assigning to a column replaces it, but modifying values in place needs a
+copy first. Run from this directory to compare load times with reading the CSV:
+
+    python dataset_store.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+DEFAULT_STORE = os.environ.get(
+    "DATASET_STORE", os.path.join("~", ".cache", "python-playground", "datasets")
+)
+METADATA_FILE = "metadata.json"
+
+
+def get_store_directory(store=None):
+    """Directory of the datasets stored in the current format
+
+    :param store: store root, defaults to $DATASET_STORE or ~/.cache/python-playground/datasets
+    :type store: str
+    :return: directory
+    :rtype: str
+    """
+    root = os.path.expanduser(store if store is not None else DEFAULT_STORE)
+
+    return os.path.join(root, "v{}".format(FORMAT_VERSION))
+
+
+def get_dataset_names(store=None):
+    """Names of the datasets in the store
+
+    :param store: store root
+    :type store: str
+    :return: names, sorted
+    :rtype: list
+    """
+    directory = get_store_directory(store)
+    if not os.path.isdir(directory):
+        return []
+
+    return sorted(
+        name
+        for name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, name, METADATA_FILE))
+    )
+
+
+def downcast(values):
+    """Values in the smallest integer type holding them, or as float32 if that changes none of them
+
+    :param values: numeric column
+    :type values: pd.Series
+    :return: values, possibly of a smaller type
+    :rtype: pd.Series
+    """
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast="integer")
+    if pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+        single = values.astype(np.float32)
+        if np.array_equal(single.to_numpy(), values.to_numpy(), equal_nan=True):
+            return single
+
+    return values
+
+
+def _encode_column(values):
+    """Arrays to store for a column, keyed by file suffix, and its metadata - categorical codes with their categories,
+    datetimes as int64, nullable values with their mask, or numbers"""
+    if pd.api.types.is_datetime64_any_dtype(
+        values
+    ) or pd.api.types.is_timedelta64_dtype(values):
+        timezone = getattr(values.dtype, "tz", None)
+        unit = np.datetime_data(
+            values.dtype.base if timezone is not None else values.dtype
+        )[0]
+        if timezone is not None:
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+
+        # missing values are stored as the smallest int64, which NumPy reads back as NaT
+        return {"": values.to_numpy().view(np.int64)}, {
+            "kind": "timedelta" if values.dtype.kind == "m" else "datetime",
+            "unit": unit,
+            "timezone": None if timezone is None else str(timezone),
+        }
+
+    if pd.api.types.is_extension_array_dtype(values) and hasattr(
+        values.dtype, "numpy_dtype"
+    ):
+        mask = values.isna().to_numpy()
+        data = pd.Series(values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0))
+        if values.dtype.kind != "b":
+            data = downcast(data)
+
+        return {"": data.to_numpy(), ".mask": mask}, {"kind": "masked"}
+
+    if isinstance(values.dtype, pd.CategoricalDtype) or not (
+        pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)
+    ):
+        categorical = (
+            values.cat
+            if isinstance(values.dtype, pd.CategoricalDtype)
+            else values.astype("category").cat
+        )
+        # from_codes stores the smallest integer type for the number of categories
+        codes = pd.to_numeric(categorical.codes, downcast="integer").to_numpy()
+        categories = categorical.categories
+
+        return {"": codes}, {
+            "kind": "categorical",
+            "categories": categories.tolist(),
+            "categories_dtype": str(categories.dtype),
+            "ordered": bool(categorical.ordered),
+        }
+
+    values = downcast(values)
+
+    return {"": values.to_numpy()}, {"kind": "numeric"}
+
+
+def save_dataset(name, data, store=None):
+    """Write a data frame to the store, replacing any dataset with the same name
+
+    The dataset is written to a temporary directory and moved into place, so concurrent loads see either the old or
+    the new dataset in full. The index is not kept.
+
+    :param name: dataset name
+    :type name: str
+    :param data: data
+    :type data: pd.DataFrame
+    :param store: store root
+    :type store: str
+    :return: dataset directory
+    :rtype: str
+    """
+    directory = get_store_directory(store)
+    os.makedirs(directory, exist_ok=True)
+    partial = tempfile.mkdtemp(prefix=".{}.".format(name), dir=directory)
+
+    try:
+        columns = []
+        for i, column in enumerate(data.columns):
+            arrays, metadata = _encode_column(data[column])
+            for suffix, array in arrays.items():
+                np.save(
+                    os.path.join(partial, "{}{}.npy".format(i, suffix)),
+                    np.ascontiguousarray(array),
+                )
+            columns.append(
+                dict(
+                    name=column,
+                    file="{}.npy".format(i),
+                    dtype=str(arrays[""].dtype),
+                    **metadata,
+                )
+            )
+        with open(os.path.join(partial, METADATA_FILE), "w") as f:
+            json.dump(
+                {"version": FORMAT_VERSION, "rows": len(data), "columns": columns},
+                f,
+                indent=2,
+            )
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        # a directory cannot replace another in one rename, so move the old one aside first
+        stale = os.path.join(directory, ".{}.{}.stale".format(name, uuid.uuid4().hex))
+        os.rename(path, stale)
+        os.rename(partial, path)
+        shutil.rmtree(stale, ignore_errors=True)
+    else:
+        os.rename(partial, path)
+
+    return path
+
+
+def import_csv(name, path, store=None, **kwargs):
+    """Read a CSV file and save it to the store
+
+    :param name: dataset name
+    :type name: str
+    :param path: CSV file path or URL
+    :type path: str
+    :param store: store root
+    :type store: str
+    :param kwargs: further pd.read_csv arguments
+    :return: dataset directory
+    :rtype: str
+    """
+    return save_dataset(name, pd.read_csv(path, **kwargs), store=store)
+
+
+def import_dataset(name, store=None, **kwargs):
+    """Fetch one of seaborn's example datasets with sns.load_dataset and save it to the store
+
+    sns.load_dataset sets the category orders of tips, penguins and the others, so they are kept.
+
+    :param name: seaborn dataset name
+    :type name: str
+    :param store: store root
+    :type store: str
+    :param kwargs: further sns.load_dataset arguments, e.g. data_home
+    :return: dataset directory
+    :rtype: str
+    """
+    import seaborn as sns
+
+    return save_dataset(name, sns.load_dataset(name, **kwargs), store=store)
+
+
+def remove_dataset(name, store=None):
+    """Delete a dataset from the store - processes that have it loaded keep their mapped files until they close them
+
+    :param name: dataset name
+    :type name: str
+    :param store: store root
+    :type store: str
+    :return: None
+    """
+    shutil.rmtree(os.path.join(get_store_directory(store), name))
+
+
+def load_dataset(name, store=None, mmap=True, source=None):
+    """Dataset from the store, importing it first if it is missing
+
+    :param name: dataset name
+    :type name: str
+    :param store: store root
+    :type store: str
+    :param mmap: memory-map the columns read-only, rather than reading them into memory
+    :type mmap: bool
+    :param source: CSV path or URL imported if the dataset is missing, defaults to seaborn's dataset of that name
+    :type source: str
+    :return: data
+    :rtype: pd.DataFrame
+    """
+    path = os.path.join(get_store_directory(store), name)
+    if not os.path.isfile(os.path.join(path, METADATA_FILE)):
+        if source is not None:
+            import_csv(name, source, store=store)
+        else:
+            import_dataset(name, store=store)
+
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+
+    def load(filename):
+        array = np.load(os.path.join(path, filename), mmap_mode="r" if mmap else None)
+        # a plain ndarray view of the map, so pandas treats it like any other array
+        return array.view(np.ndarray)
+
+    columns = {}
+    for column in metadata["columns"]:
+        array = load(column["file"])
+        if column["kind"] in ("datetime", "timedelta"):
+            array = array.view(
+                "{}8[{}]".format(
+                    "M" if column["kind"] == "datetime" else "m", column["unit"]
+                )
+            )
+            if column["timezone"] is not None:
+                array = (
+                    pd.DatetimeIndex(array)
+                    .tz_localize("UTC")
+                    .tz_convert(column["timezone"])
+                )
+        elif column["kind"] == "masked":
+            mask = load(column["file"].replace(".npy", ".mask.npy"))
+            if array.dtype.kind == "b":
+                array = pd.arrays.BooleanArray(array, mask)
+            elif array.dtype.kind == "f":
+                array = pd.arrays.FloatingArray(array, mask)
+            else:
+                array = pd.arrays.IntegerArray(array, mask)
+        elif column["kind"] == "categorical":
+            categories = pd.Index(
+                column["categories"], dtype=column["categories_dtype"]
+            )
+            array = pd.Categorical.from_codes(
+                array, dtype=pd.CategoricalDtype(categories, column["ordered"])
+            )
+        columns[column["name"]] = array
+
+    # copy=False keeps the columns as views of the mapped files
+    return pd.DataFrame(columns, copy=False)
+
+
+def benchmark(rows_count, repeats=5):
+    """Time reading synthetic events from CSV and loading them from the store, in memory and memory-mapped
+
+    :param rows_count: number of rows
+    :type rows_count: int
+    :param repeats: number of loads timed, the fastest is kept
+    :type repeats: int
+    :return: results - dicts with method, seconds and bytes (on disk)
+    :rtype: list
+    """
+    from aggregated_plots import generate_events
+
+    events = generate_events(rows_count)
+    events["latency_ms"] = events["latency_ms"].astype(np.float64)
+
+    with tempfile.TemporaryDirectory() as store:
+        csv_path = os.path.join(store, "events.csv")
+        events.to_csv(csv_path, index=False)
+        dataset_path = import_csv("events", csv_path, store=store)
+        dataset_bytes = sum(
+            os.path.getsize(os.path.join(dataset_path, filename))
+            for filename in os.listdir(dataset_path)
+        )
+
+        methods = {
+            "read_csv": (lambda: pd.read_csv(csv_path), os.path.getsize(csv_path)),
+            "load_dataset": (
+                lambda: load_dataset("events", store=store, mmap=False),
+                dataset_bytes,
+            ),
+            "load_dataset_mmap": (
+                lambda: load_dataset("events", store=store),
+                dataset_bytes,
+            ),
+        }
+        results = []
+        for method, (load, size) in methods.items():
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                load()
+                timings.append(time.perf_counter() - start)
+            results.append({"method": method, "seconds": min(timings), "bytes": size})
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare loading a dataset from CSV and from the columnar store"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.rows, args.repeats):
+        print(
+            "{method:>18} {seconds:>8.4f}s {megabytes:>8.1f} MB".format(
+                megabytes=result["bytes"] / 1e6, **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
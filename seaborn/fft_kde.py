@@ -0,0 +1,708 @@
+"""Gaussian kernel density estimates of large samples by linear binning and FFT convolution, in 1-D and 2-D
+
+seaborn's kdeplot evaluates scipy's gaussian_kde at every grid point, which costs O(rows x grid points) per curve.
+Here each sample's weight is shared linearly between its neighbouring nodes of a fine grid, and the binned weights are
+convolved with the kernel by FFT, so the cost is O(rows + grid log grid). The fine grid has several nodes per
+bandwidth and the densities are read off every few nodes, at seaborn's evaluation grid.
+
+Bandwidths, support and normalization follow seaborn: Scott's or Silverman's rule (or a scalar factor) times
+bw_adjust on the weighted covariance, a grid extending cut bandwidths beyond the data and clipped to clip, and with
+common_norm each group's density scaled by its share of the total weight.
+
+    densities = estimate_densities(events, x="latency_ms", hue="kind", col="region", bw_adjust=0.5)
+    grid = kde_displot(events, x="latency_ms", hue="kind", multiple="stack", fill=True)
+
+Run from this directory to compare with the exact estimate:
+
+    python fft_kde.py --rows 1000 100000 1000000 10000000
+"""
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from matplotlib.patches import Patch
+from scipy import signal, stats
+
+import seaborn as sns
+
+from aggregated_plots import generate_events, get_group_codes
+
+DENSITY = "density"
+DEFAULT_GRIDSIZE = 200
+# fine grid spacing relative to the bandwidth, and its largest number of nodes per dimension
+NODES_PER_BANDWIDTH = 8
+MAX_FINE_GRIDSIZE = (2**16, 2**10)
+# distance, in bandwidths, beyond a clipped grid from which samples still add density to it
+TAIL_BANDWIDTHS = 8
+# smallest determinant of a group's covariance, relative to the product of its variances, for a density estimate
+SINGULAR_TOLERANCE = 1e-12
+
+
+def get_bandwidth_factor(neff, dimensions, bw_method="scott"):
+    """Factor scaling the data covariance to the kernel's, as gaussian_kde computes it
+
+    :param neff: effective number of samples, (sum of weights)^2 / sum of squared weights
+    :type neff: float | np.ndarray
+    :param dimensions: number of dimensions
+    :type dimensions: int
+    :param bw_method: "scott", "silverman" or a scalar factor
+    :type bw_method: str | float
+    :return: factor
+    :rtype: float | np.ndarray
+    """
+    if bw_method == "scott":
+        return neff ** (-1 / (dimensions + 4))
+    if bw_method == "silverman":
+        return (neff * (dimensions + 2) / 4) ** (-1 / (dimensions + 4))
+    if np.isscalar(bw_method) and not isinstance(bw_method, str):
+        return np.full_like(np.asarray(neff, dtype=float), bw_method)
+
+    raise ValueError("bw_method must be 'scott', 'silverman' or a number")
+
+
+def _get_group_covariances(values, weights, codes, groups_count):
+    """Weighted covariance matrix (unbiased, like np.cov with aweights), total weight and effective size per group"""
+    total = np.bincount(codes, weights, minlength=groups_count)
+    squares = np.bincount(codes, weights**2, minlength=groups_count)
+    # centring on the overall mean first keeps the sums of squares from cancelling
+    centred = values - values.mean(axis=0)
+    means = (
+        np.stack(
+            [
+                np.bincount(codes, weights * column, minlength=groups_count)
+                for column in centred.T
+            ],
+            axis=1,
+        )
+        / total[:, np.newaxis]
+    )
+
+    dimensions = values.shape[1]
+    covariances = np.empty((groups_count, dimensions, dimensions))
+    for i in range(dimensions):
+        for j in range(i, dimensions):
+            products = np.bincount(
+                codes,
+                weights * centred[:, i] * centred[:, j],
+                minlength=groups_count,
+            )
+            covariance = (products - total * means[:, i] * means[:, j]) / (
+                total - squares / total
+            )
+            covariances[:, i, j] = covariances[:, j, i] = covariance
+
+    return covariances, total, total**2 / squares
+
+
+def _get_group_ranges(values, codes, groups_count):
+    """Lowest and highest value per group and dimension, as two groups x dimensions arrays"""
+    frame = pd.DataFrame(values).groupby(codes)
+    index = np.arange(groups_count)
+
+    return (
+        frame.min().reindex(index).to_numpy(),
+        frame.max().reindex(index).to_numpy(),
+    )
+
+
+def _linear_binning(positions, weights, codes, shape):
+    """Share each weight between the 2^d nodes around its fractional grid position
+
+    :param positions: position of each sample in units of grid spacing, from 0 to gridsize - 1
+    :type positions: np.ndarray
+    :param weights: sample weights
+    :type weights: np.ndarray
+    :param codes: group of each sample
+    :type codes: np.ndarray
+    :param shape: groups count and grid size along each dimension
+    :type shape: tuple
+    :return: binned weights, with shape
+    :rtype: np.ndarray
+    """
+    dimensions = positions.shape[1]
+    nodes = np.floor(positions).astype(np.intp)
+    # samples on the upper edge go to the last cell
+    for d in range(dimensions):
+        np.minimum(nodes[:, d], shape[d + 1] - 2, out=nodes[:, d])
+    fractions = positions - nodes
+
+    binned = np.zeros(np.prod(shape))
+    for corner in np.ndindex(*(2,) * dimensions):
+        corner_weights = weights.copy()
+        for d, offset in enumerate(corner):
+            corner_weights *= fractions[:, d] if offset else 1 - fractions[:, d]
+        cells = np.ravel_multi_index(
+            (codes,) + tuple(nodes[:, d] + offset for d, offset in enumerate(corner)),
+            shape,
+        )
+        binned += np.bincount(cells, corner_weights, minlength=len(binned))
+
+    return binned.reshape(shape)
+
+
+def _get_kernel(covariance, spacings, gridsize):
+    """Gaussian density on the grid offsets -(gridsize - 1)..(gridsize - 1) along each dimension"""
+    offsets = np.meshgrid(
+        *(
+            np.arange(-(size - 1), size) * spacing
+            for size, spacing in zip(gridsize, spacings)
+        ),
+        indexing="ij",
+    )
+    offsets = np.stack(offsets, axis=-1)
+    precision = np.linalg.inv(covariance)
+    quadratic = np.einsum("...i,ij,...j->...", offsets, precision, offsets)
+    normalization = np.sqrt((2 * np.pi) ** len(spacings) * np.linalg.det(covariance))
+
+    return np.exp(-quadratic / 2) / normalization
+
+
+def fft_kde(
+    values,
+    weights=None,
+    codes=None,
+    bw_method="scott",
+    bw_adjust=1,
+    gridsize=DEFAULT_GRIDSIZE,
+    cut=3,
+    clip=None,
+    common_norm=False,
+    common_grid=False,
+):
+    """Densities of one or more groups of samples on seaborn's evaluation grids
+
+    :param values: samples - 1-D array, or rows x 2 array for bivariate densities
+    :type values: np.ndarray
+    :param weights: sample weights, defaults to 1
+    :type weights: np.ndarray
+    :param codes: group of each sample, from 0, or -1 to ignore it - defaults to one group. Like seaborn, groups with
+        fewer than 2 samples, no weight or no variance are skipped with a warning, and their grids and densities are NaN
+    :type codes: np.ndarray
+    :param bw_method: "scott", "silverman" or a scalar factor
+    :type bw_method: str | float
+    :param bw_adjust: multiple of the bandwidth factor
+    :type bw_adjust: float
+    :param gridsize: number of evaluation points per dimension
+    :type gridsize: int
+    :param cut: distance of the grid beyond the data, in bandwidths
+    :type cut: float
+    :param clip: lowest and highest grid value, a pair of pairs for bivariate densities
+    :type clip: tuple
+    :param common_norm: scale each group's density by its share of the total weight, so they integrate to 1 together
+    :type common_norm: bool
+    :param common_grid: evaluate every group on the grid spanning all groups
+    :type common_grid: bool
+    :return: grids, densities - evaluation points per group and dimension (groups x dimensions x gridsize), and
+        density per group on them (groups x gridsize, or groups x gridsize x gridsize indexed by x then y)
+    :rtype: (np.ndarray, np.ndarray)
+    """
+    values = np.asarray(values, dtype=float)
+    univariate = values.ndim == 1
+    values = values.reshape(len(values), -1)
+    dimensions = values.shape[1]
+    weights = (
+        np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+    )
+    codes = (
+        np.zeros(len(values), dtype=np.intp)
+        if codes is None
+        else np.asarray(codes, dtype=np.intp)
+    )
+    # counted before dropping missing values, so a group with none left keeps its place
+    groups_count = codes.max() + 1 if len(codes) else 0
+    valid = (codes >= 0) & ~np.isnan(values).any(axis=1) & ~np.isnan(weights)
+    values, weights, codes = values[valid], weights[valid], codes[valid]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariances, totals, neff = _get_group_covariances(
+            values, weights, codes, groups_count
+        )
+    lows, highs = _get_group_ranges(values, codes, groups_count)
+    estimated = (
+        (np.bincount(codes, minlength=groups_count) >= 2)
+        & (totals > 0)
+        & np.all(highs > lows, axis=1)
+    )
+    covariances[~estimated] = np.eye(dimensions)
+    variances = np.diagonal(covariances, axis1=1, axis2=2)
+    estimated &= np.linalg.det(covariances) > SINGULAR_TOLERANCE * variances.prod(
+        axis=1
+    )
+    if not estimated.all():
+        warnings.warn(
+            "{} of {} groups have fewer than 2 samples, no weight or no variance; skipping their density "
+            "estimates".format((~estimated).sum(), groups_count),
+            UserWarning,
+        )
+    densities = np.full((groups_count,) + (gridsize,) * dimensions, np.nan)
+    if not estimated.any():
+        return np.full((groups_count, dimensions, gridsize), np.nan), densities
+
+    factors = get_bandwidth_factor(neff, dimensions, bw_method) * bw_adjust
+    covariances *= factors[:, np.newaxis, np.newaxis] ** 2
+    bandwidths = np.sqrt(np.diagonal(covariances, axis1=1, axis2=2))
+    bandwidths[~estimated] = np.nan
+
+    if clip is None:
+        clip = [(None, None)] * dimensions
+    elif univariate:
+        clip = [clip]
+    clip_lows = np.array([-np.inf if low is None else low for low, _ in clip])
+    clip_highs = np.array([np.inf if high is None else high for _, high in clip])
+    grid_lows = np.maximum(lows - bandwidths * cut, clip_lows)
+    grid_highs = np.minimum(highs + bandwidths * cut, clip_highs)
+    if common_grid:
+        grid_lows[estimated] = np.nanmin(grid_lows, axis=0)
+        grid_highs[estimated] = np.nanmax(grid_highs, axis=0)
+
+    # fine grid with NODES_PER_BANDWIDTH nodes per bandwidth that passes through every evaluation point
+    spacings = (grid_highs - grid_lows) / (gridsize - 1)
+    steps = np.ceil(
+        np.nanmax(spacings, axis=0)
+        / np.nanmin(bandwidths, axis=0)
+        * NODES_PER_BANDWIDTH
+    )
+    max_steps = (MAX_FINE_GRIDSIZE[dimensions - 1] - 1) // (gridsize - 1)
+    steps = np.clip(steps, 1, max_steps).astype(int)
+    fine_gridsize = (gridsize - 1) * steps + 1
+    fine_spacings = spacings / steps
+
+    # clip limits the grid, not the data - samples beyond a clipped edge still add density inside it, so the fine
+    # grid is padded to bin them, as far as TAIL_BANDWIDTHS bandwidths out
+    with np.errstate(invalid="ignore"):
+        reach_lows = np.minimum(grid_lows - lows, TAIL_BANDWIDTHS * bandwidths)
+        reach_highs = np.minimum(highs - grid_highs, TAIL_BANDWIDTHS * bandwidths)
+        pads = [
+            np.nan_to_num(np.ceil(np.maximum(reach, 0) / fine_spacings))
+            .max(axis=0)
+            .clip(0, MAX_FINE_GRIDSIZE[dimensions - 1])
+            .astype(int)
+            for reach in (reach_lows, reach_highs)
+        ]
+    padded_gridsize = tuple(fine_gridsize + pads[0] + pads[1])
+
+    keep = estimated[codes]
+    values, weights, codes = values[keep], weights[keep], codes[keep]
+    positions = (values - grid_lows[codes]) / fine_spacings[codes] + pads[0]
+    inside = np.all(
+        (positions >= 0) & (positions <= np.array(padded_gridsize) - 1), axis=1
+    )
+    binned = _linear_binning(
+        positions[inside],
+        weights[inside],
+        codes[inside],
+        (groups_count,) + padded_gridsize,
+    )
+
+    evaluation = tuple(
+        slice(pad, pad + size, step)
+        for pad, size, step in zip(pads[0], fine_gridsize, steps)
+    )
+    for group in np.flatnonzero(estimated):
+        kernel = _get_kernel(covariances[group], fine_spacings[group], padded_gridsize)
+        density = signal.fftconvolve(binned[group], kernel, mode="same")
+        # FFT round-off leaves tiny negative values far from the data
+        densities[group] = np.maximum(density[evaluation], 0) / totals[group]
+    if common_norm:
+        densities *= (totals / totals.sum()).reshape((-1,) + (1,) * dimensions)
+
+    grids = np.linspace(grid_lows, grid_highs, gridsize, axis=-1)
+
+    return grids, densities
+
+
+def exact_kde(values, grids, weights=None, bw_method="scott", bw_adjust=1):
+    """Density of one group by direct evaluation with scipy's gaussian_kde, as seaborn computes it
+
+    :param values: samples - 1-D array, or rows x 2 array
+    :type values: np.ndarray
+    :param grids: evaluation points per dimension (dimensions x gridsize)
+    :type grids: np.ndarray
+    :param weights: sample weights
+    :type weights: np.ndarray
+    :param bw_method: "scott", "silverman" or a scalar factor
+    :type bw_method: str | float
+    :param bw_adjust: multiple of the bandwidth factor
+    :type bw_adjust: float
+    :return: density on the grid, gridsize or gridsize x gridsize indexed by x then y
+    :rtype: np.ndarray
+    """
+    values = np.asarray(values, dtype=float)
+    kde = stats.gaussian_kde(values.T, bw_method=bw_method, weights=weights)
+    kde.set_bandwidth(kde.factor * bw_adjust)
+    points = np.stack([axis.ravel() for axis in np.meshgrid(*grids, indexing="ij")])
+
+    return kde(points).reshape((len(grids[0]),) * len(grids))
+
+
+def estimate_densities(
+    data,
+    x,
+    y=None,
+    hue=None,
+    col=None,
+    row=None,
+    weights=None,
+    common_norm=True,
+    common_grid=False,
+    **kwargs,
+):
+    """Densities of x (and y) for each combination of hue, col and row, in long form for plotting
+
+    Defaults match displot(kind="kde"): with common_norm the groups, across all facets, integrate to 1 together.
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: numeric column
+    :type x: str
+    :param y: numeric column, for bivariate densities
+    :type y: str
+    :param hue: column mapped to colour
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param weights: column of sample weights
+    :type weights: str
+    :param common_norm: scale each group's density by its share of the total weight
+    :type common_norm: bool
+    :param common_grid: evaluate every group on the same grid
+    :type common_grid: bool
+    :param kwargs: bw_method, bw_adjust, gridsize, cut and clip, see fft_kde
+    :return: densities - the grouping columns, x (and y) and density, one row per grid point of each group estimated
+    :rtype: pd.DataFrame
+    """
+    groups = [column for column in (row, col, hue) if column is not None]
+    codes, keys = get_group_codes(data, groups)
+    values = data[x] if y is None else data[[x, y]]
+    grids, densities = fft_kde(
+        values.to_numpy(dtype=float),
+        weights=None if weights is None else data[weights].to_numpy(dtype=float),
+        codes=codes,
+        common_norm=common_norm,
+        common_grid=common_grid,
+        **kwargs,
+    )
+
+    # groups skipped by fft_kde have no rows
+    estimated = np.flatnonzero(~np.isnan(grids[:, 0, 0]))
+    grids, densities = grids[estimated], densities[estimated]
+    points = densities[0].size if len(densities) else 0
+    result = keys.iloc[np.repeat(estimated, points)].reset_index(drop=True)
+    if y is None:
+        result[x] = grids[:, 0].ravel()
+    else:
+        xx = np.broadcast_to(grids[:, 0, :, np.newaxis], densities.shape)
+        yy = np.broadcast_to(grids[:, 1, np.newaxis, :], densities.shape)
+        result[x] = xx.ravel()
+        result[y] = yy.ravel()
+    result[DENSITY] = densities.ravel()
+
+    return result
+
+
+def get_contour_levels(densities, thresh=0.05, levels=10):
+    """Density levels enclosing the given proportions of probability mass, as seaborn draws bivariate KDE contours
+
+    :param densities: densities on a grid - all groups for common levels
+    :type densities: np.ndarray
+    :param thresh: lowest level, as the proportion of mass outside it
+    :type thresh: float
+    :param levels: number of levels
+    :type levels: int
+    :return: levels in increasing order
+    :rtype: np.ndarray
+    """
+    proportions = np.linspace(thresh, 1, levels)
+    values = np.sort(np.ravel(densities))[::-1]
+    cumulative = np.cumsum(values) / values.sum()
+
+    return np.take(values, np.searchsorted(cumulative, 1 - proportions), mode="clip")
+
+
+def kde_displot(
+    data,
+    x,
+    y=None,
+    hue=None,
+    col=None,
+    row=None,
+    col_wrap=None,
+    weights=None,
+    multiple="layer",
+    fill=False,
+    common_norm=True,
+    palette=None,
+    hue_order=None,
+    thresh=0.05,
+    levels=10,
+    legend=True,
+    height=5,
+    aspect=1,
+    bw_method="scott",
+    bw_adjust=1,
+    gridsize=DEFAULT_GRIDSIZE,
+    cut=3,
+    clip=None,
+):
+    """displot(kind="kde") on a FacetGrid, drawn from FFT densities
+
+    Supports multiple="layer", "stack" and "fill" for univariate densities - the latter two evaluate every hue level
+    on a common grid - and contours at iso-proportion levels for bivariate ones.
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: numeric column
+    :type x: str
+    :param y: numeric column, for bivariate densities
+    :type y: str
+    :param hue: column mapped to colour
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param col_wrap: wrap the column facets at this width
+    :type col_wrap: int
+    :param weights: column of sample weights
+    :type weights: str
+    :param multiple: "layer", "stack" or "fill"
+    :type multiple: str
+    :param fill: fill under curves, or between contours
+    :type fill: bool
+    :param common_norm: scale each group's density by its share of the total weight
+    :type common_norm: bool
+    :param palette: colours of the hue levels
+    :param hue_order: order of the hue levels
+    :type hue_order: list
+    :param thresh: lowest contour, as the proportion of mass outside it
+    :type thresh: float
+    :param levels: number of contours
+    :type levels: int
+    :param legend: add a legend of the hue levels
+    :type legend: bool
+    :param height: height of each facet in inches
+    :type height: float
+    :param aspect: width of each facet relative to its height
+    :type aspect: float
+    :param bw_method: "scott", "silverman" or a scalar factor
+    :type bw_method: str | float
+    :param bw_adjust: multiple of the bandwidth factor
+    :type bw_adjust: float
+    :param gridsize: number of evaluation points per dimension
+    :type gridsize: int
+    :param cut: distance of the grid beyond the data, in bandwidths
+    :type cut: float
+    :param clip: lowest and highest grid value, a pair of pairs for bivariate densities
+    :type clip: tuple
+    :return: grid
+    :rtype: sns.FacetGrid
+    """
+    if multiple not in ("layer", "stack", "fill"):
+        raise ValueError("multiple must be 'layer', 'stack' or 'fill'")
+
+    densities = estimate_densities(
+        data,
+        x,
+        y=y,
+        hue=hue,
+        col=col,
+        row=row,
+        weights=weights,
+        common_norm=common_norm,
+        common_grid=multiple != "layer",
+        bw_method=bw_method,
+        bw_adjust=bw_adjust,
+        gridsize=gridsize,
+        cut=cut,
+        clip=clip,
+    )
+    if hue is not None:
+        hue_levels = (
+            hue_order
+            if hue_order is not None
+            else list(densities[hue].drop_duplicates())
+        )
+        colors = dict(zip(hue_levels, sns.color_palette(palette, len(hue_levels))))
+    else:
+        hue_levels = [None]
+        colors = {None: sns.color_palette(palette)[0]}
+    if y is not None:
+        contour_levels = get_contour_levels(
+            densities[DENSITY].to_numpy(), thresh, levels
+        )
+
+    grid = sns.FacetGrid(
+        densities,
+        col=col,
+        row=row,
+        col_wrap=col_wrap,
+        height=height,
+        aspect=aspect,
+    )
+    facets = [column for column in (row, col) if column is not None]
+    for key, facet in (
+        densities.groupby(facets, observed=True) if facets else [(None, densities)]
+    ):
+        if row is not None and col is not None:
+            ax = grid.axes_dict[key]
+        elif facets:
+            ax = grid.axes_dict[key[0]]
+        else:
+            ax = grid.ax
+
+        curves = [
+            (level, facet if level is None else facet[facet[hue] == level])
+            for level in hue_levels
+        ]
+        curves = [(level, curve) for level, curve in curves if len(curve)]
+        if y is None:
+            _plot_univariate(ax, curves, x, colors, multiple, fill)
+        else:
+            _plot_bivariate(ax, curves, x, y, colors, contour_levels, fill)
+
+    grid.set_titles()
+    grid.set_axis_labels(x, "Density" if y is None else y)
+    if legend and hue is not None:
+        grid.add_legend(
+            legend_data={
+                str(level): Patch(color=colors[level]) for level in hue_levels
+            },
+            title=hue,
+        )
+    grid.tight_layout()
+
+    return grid
+
+
+def _plot_univariate(ax, curves, x, colors, multiple, fill):
+    """Draw one facet's densities - stacked or filled ones share one grid, so they can be summed pointwise"""
+    baseline = 0
+    if multiple == "fill":
+        total = sum(curve[DENSITY].to_numpy() for _, curve in curves)
+    for level, curve in curves:
+        support = curve[x].to_numpy()
+        density = curve[DENSITY].to_numpy()
+        if multiple == "fill":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                density = np.nan_to_num(density / total)
+        top = baseline + density if multiple != "layer" else density
+        bottom = baseline if multiple != "layer" else 0
+        if fill:
+            ax.fill_between(support, bottom, top, color=colors[level], alpha=0.25)
+        ax.plot(support, top, color=colors[level])
+        if multiple != "layer":
+            baseline = top
+
+
+def _plot_bivariate(ax, curves, x, y, colors, contour_levels, fill):
+    """Draw one facet's densities as contours at common levels"""
+    for level, curve in curves:
+        size = int(np.sqrt(len(curve)))
+        shape = (size, size)
+        xx = curve[x].to_numpy().reshape(shape)
+        yy = curve[y].to_numpy().reshape(shape)
+        density = curve[DENSITY].to_numpy().reshape(shape)
+        if fill:
+            cmap = sns.light_palette(colors[level], as_cmap=True)
+            ax.contourf(xx, yy, density, levels=contour_levels, cmap=cmap, extend="max")
+        else:
+            ax.contour(xx, yy, density, levels=contour_levels, colors=[colors[level]])
+
+
+def check_accuracy(values, weights=None, bw_adjust=1, gridsize=DEFAULT_GRIDSIZE):
+    """Largest difference between the FFT and exact densities, relative to the exact density's peak
+
+    :param values: samples - 1-D array, or rows x 2 array
+    :type values: np.ndarray
+    :param weights: sample weights
+    :type weights: np.ndarray
+    :param bw_adjust: multiple of the bandwidth factor
+    :type bw_adjust: float
+    :param gridsize: number of evaluation points per dimension
+    :type gridsize: int
+    :return: relative error
+    :rtype: float
+    """
+    grids, densities = fft_kde(
+        values, weights=weights, bw_adjust=bw_adjust, gridsize=gridsize
+    )
+    exact = exact_kde(values, grids[0], weights=weights, bw_adjust=bw_adjust)
+
+    return np.abs(densities[0] - exact).max() / exact.max()
+
+
+def benchmark(rows_counts, max_exact_rows=1_000_000, tolerance=2e-3):
+    """Time FFT and exact densities of skewed latencies in 1-D and latencies against sizes in 2-D
+
+    The exact density is only computed up to max_exact_rows, and the FFT density is checked against it.
+
+    :param rows_counts: numbers of rows
+    :type rows_counts: list
+    :param max_exact_rows: largest number of rows evaluated exactly
+    :type max_exact_rows: int
+    :param tolerance: largest relative error accepted
+    :type tolerance: float
+    :return: results - dicts with rows, dimensions, fft_seconds, exact_seconds and error (None above max_exact_rows)
+    :rtype: list
+    """
+    events = generate_events(max(rows_counts))
+    results = []
+    for rows_count in rows_counts:
+        for dimensions, columns in ((1, "latency_ms"), (2, ["latency_ms", "size_kb"])):
+            values = events[columns].iloc[:rows_count].to_numpy(dtype=float)
+            # the 2-D exact estimate evaluates gridsize^2 points
+            gridsize = DEFAULT_GRIDSIZE if dimensions == 1 else 100
+
+            start = time.perf_counter()
+            grids, densities = fft_kde(values, gridsize=gridsize)
+            fft_seconds = time.perf_counter() - start
+
+            exact_seconds = error = None
+            if rows_count * gridsize**dimensions <= max_exact_rows * DEFAULT_GRIDSIZE:
+                start = time.perf_counter()
+                exact = exact_kde(values, grids[0])
+                exact_seconds = time.perf_counter() - start
+                error = np.abs(densities[0] - exact).max() / exact.max()
+                assert error < tolerance, error
+
+            results.append(
+                {
+                    "rows": rows_count,
+                    "dimensions": dimensions,
+                    "fft_seconds": fft_seconds,
+                    "exact_seconds": exact_seconds,
+                    "error": error,
+                }
+            )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare FFT and exact kernel density estimates"
+    )
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1000, 100_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument("--max-exact-rows", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.rows, args.max_exact_rows):
+        exact = (
+            "{:>8.3f}s {:>9.1e}".format(result["exact_seconds"], result["error"])
+            if result["exact_seconds"] is not None
+            else ""
+        )
+        print(
+            "{rows:>10} {dimensions}-D {fft_seconds:>8.3f}s ".format(**result) + exact
+        )
+
+
+if __name__ == "__main__":
+    main()
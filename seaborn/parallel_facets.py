@@ -0,0 +1,399 @@
+"""relplot with its facets drawn in a process pool and composited into one FacetGrid
+
+sns.relplot draws facets one after another in one process, so a grid of hundreds of subjects - each line facet
+aggregating and bootstrapping its own confidence band - takes as long as all of them together. Here the data is split
+by facet once, each facet's panel is drawn off-screen by a worker with the axes-level function, and the returned
+images are placed on the axes of an ordinary FacetGrid.
+
+Everything that has to agree across panels is fixed before the workers start: axis limits from the whole data, hue
+order and colours, and the panel size in pixels from the grid's layout. The axes, ticks, titles and legend are drawn
+by the grid itself, so they look as relplot's do.
+
+    grid = parallel_relplot(fmri, x="timepoint", y="signal", hue="event", col="subject", col_wrap=7, kind="line")
+    grid.savefig("fmri.png")
+
+Panels are images, so they do not rescale like vector artists - save at the dpi given. Run from this directory to
+compare with relplot on synthetic fMRI-like data:
+
+    python parallel_facets.py --subjects 140 --processes 1 4
+"""
+
+import argparse
+import numbers
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+import seaborn as sns
+
+from aggregated_plots import get_group_codes
+
+KINDS = {"scatter": "scatterplot", "line": "lineplot"}
+# share of the data range added on each side, like matplotlib's default margins
+MARGIN = 0.05
+
+
+def split_facets(data, col=None, row=None, columns=None):
+    """Rows of each facet, split in one pass over the data
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param columns: columns kept in each facet's data, defaults to all
+    :type columns: list
+    :return: keys, facets - one row per facet with its col/row values, and (key, data) pairs with key as
+        FacetGrid.axes_dict indexes axes
+    :rtype: (pd.DataFrame, list)
+    """
+    facets = [column for column in (row, col) if column is not None]
+    codes, keys = get_group_codes(data, facets)
+    if columns is not None:
+        data = data[columns]
+
+    # a stable sort by facet keeps each facet's rows in their original order
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+
+    result = []
+    for i, facet in keys.iterrows():
+        if row is not None and col is not None:
+            key = (facet[row], facet[col])
+        elif facets:
+            key = facet[facets[0]]
+        else:
+            key = None
+        rows = order[bounds[i] : bounds[i + 1]]
+        result.append((key, data.iloc[rows].reset_index(drop=True)))
+
+    return keys, result
+
+
+def _get_order(values):
+    """Levels in seaborn's default order for hue and facets, as seaborn._base.categorical_order
+
+    Categories in their declared order, sorted levels for numbers, else levels in order of appearance.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return list(values.cat.categories)
+
+    levels = values.dropna().unique()
+    if pd.api.types.is_numeric_dtype(values) or all(
+        isinstance(level, numbers.Number) for level in levels
+    ):
+        levels = np.sort(levels)
+
+    return list(levels)
+
+
+def _get_limits(values):
+    """Data range with MARGIN on each side"""
+    low, high = np.nanmin(values), np.nanmax(values)
+    margin = (high - low) * MARGIN or 0.5
+
+    return low - margin, high + margin
+
+
+def render_panel(data, kind, x, y, xlim, ylim, size, dpi, **kwargs):
+    """Draw one facet off-screen and return its pixels
+
+    The axes fill the whole image with no frame or ticks, so the image maps exactly onto the limits.
+
+    :param data: facet data
+    :type data: pd.DataFrame
+    :param kind: "scatter" or "line"
+    :type kind: str
+    :param x: column on the x axis
+    :type x: str
+    :param y: column on the y axis
+    :type y: str
+    :param xlim: x limits
+    :type xlim: (float, float)
+    :param ylim: y limits
+    :type ylim: (float, float)
+    :param size: width and height in pixels
+    :type size: (int, int)
+    :param dpi: resolution, scales line widths and marker sizes
+    :type dpi: float
+    :param kwargs: further arguments of the axes-level function, with hue, hue_order and palette
+    :return: image - height x width x RGBA
+    :rtype: np.ndarray
+    """
+    figure = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(figure)
+    figure.patch.set_alpha(0)
+    ax = figure.add_axes((0, 0, 1, 1))
+    ax.set_axis_off()
+
+    getattr(sns, KINDS[kind])(data=data, x=x, y=y, ax=ax, legend=False, **kwargs)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    canvas.draw()
+
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def _render_panel(task):
+    return render_panel(**task)
+
+
+def parallel_relplot(
+    data,
+    x,
+    y,
+    hue=None,
+    col=None,
+    row=None,
+    col_wrap=None,
+    kind="scatter",
+    palette=None,
+    hue_order=None,
+    xlim=None,
+    ylim=None,
+    legend=True,
+    height=5,
+    aspect=1,
+    dpi=100,
+    processes=None,
+    **kwargs,
+):
+    """Faceted scatter or line plot like sns.relplot, with each facet drawn by a worker process
+
+    :param data: data
+    :type data: pd.DataFrame
+    :param x: numeric column on the x axis
+    :type x: str
+    :param y: numeric column on the y axis
+    :type y: str
+    :param hue: column mapped to colour
+    :type hue: str
+    :param col: column faceted across columns
+    :type col: str
+    :param row: column faceted across rows
+    :type row: str
+    :param col_wrap: wrap the column facets at this width
+    :type col_wrap: int
+    :param kind: "scatter" or "line"
+    :type kind: str
+    :param palette: colours of the hue levels, or colormap of a numeric hue
+    :param hue_order: order of the hue levels
+    :type hue_order: list
+    :param xlim: x limits shared by all facets, defaults to the range of x with margins
+    :type xlim: (float, float)
+    :param ylim: y limits shared by all facets, defaults to the range of y with margins - line error bands wider
+        than the data, such as errorbar="sd", need them set
+    :type ylim: (float, float)
+    :param legend: add a legend of the hue levels
+    :type legend: bool
+    :param height: height of each facet in inches
+    :type height: float
+    :param aspect: width of each facet relative to its height
+    :type aspect: float
+    :param dpi: resolution of the panels
+    :type dpi: float
+    :param processes: number of worker processes, defaults to the number of CPUs - 1 draws in this process
+    :type processes: int
+    :param kwargs: further arguments of scatterplot or lineplot, e.g. linewidth or errorbar
+    :return: grid
+    :rtype: sns.FacetGrid
+    """
+    if kind not in KINDS:
+        raise ValueError("kind must be one of {}".format(", ".join(KINDS)))
+
+    xlim = xlim if xlim is not None else _get_limits(data[x].to_numpy(dtype=float))
+    ylim = ylim if ylim is not None else _get_limits(data[y].to_numpy(dtype=float))
+    columns = list(
+        dict.fromkeys(column for column in (x, y, hue) if column is not None)
+    )
+    numeric_hue = hue is not None and pd.api.types.is_numeric_dtype(data[hue])
+    if hue is not None and not numeric_hue:
+        hue_order = hue_order if hue_order is not None else _get_order(data[hue])
+        colors = sns.color_palette(palette, len(hue_order))
+        kwargs.update(hue=hue, hue_order=hue_order, palette=colors)
+    elif numeric_hue:
+        # the same normalization in every panel, rather than each facet's own range
+        kwargs.update(
+            hue=hue,
+            palette=palette,
+            hue_norm=(np.nanmin(data[hue]), np.nanmax(data[hue])),
+        )
+    else:
+        kwargs.setdefault("color", sns.color_palette(palette)[0])
+
+    keys, facets = split_facets(data, col=col, row=row, columns=columns)
+    grid = sns.FacetGrid(
+        keys,
+        col=col,
+        row=row,
+        col_wrap=col_wrap,
+        # keys are sorted, so the facet orders come from the data, as relplot's do
+        col_order=_get_order(data[col]) if col is not None else None,
+        row_order=_get_order(data[row]) if row is not None else None,
+        height=height,
+        aspect=aspect,
+    )
+    grid.figure.set_dpi(dpi)
+    for ax in grid.axes.flat:
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+    grid.set_titles()
+    grid.set_axis_labels(x, y)
+    if legend and hue is not None and not numeric_hue:
+        marker = "o" if kind == "scatter" else None
+        linestyle = "" if kind == "scatter" else "-"
+        grid.add_legend(
+            legend_data={
+                str(level): Line2D(
+                    [], [], color=color, marker=marker, linestyle=linestyle
+                )
+                for level, color in zip(hue_order, colors)
+            },
+            title=hue,
+        )
+    grid.tight_layout()
+
+    # every panel has the same size once the layout is final
+    extent = grid.axes.flat[0].get_window_extent()
+    size = (max(int(round(extent.width)), 1), max(int(round(extent.height)), 1))
+    tasks = [
+        dict(
+            data=facet,
+            kind=kind,
+            x=x,
+            y=y,
+            xlim=xlim,
+            ylim=ylim,
+            size=size,
+            dpi=dpi,
+            **kwargs,
+        )
+        for _, facet in facets
+    ]
+    if processes == 1:
+        images = map(_render_panel, tasks)
+    else:
+        executor = ProcessPoolExecutor(processes)
+        images = executor.map(_render_panel, tasks)
+
+    try:
+        for (key, _), image in zip(facets, images):
+            ax = grid.ax if key is None else grid.axes_dict[key]
+            ax.imshow(
+                image,
+                extent=(*xlim, *ylim),
+                aspect="auto",
+                interpolation="none",
+                zorder=2,
+            )
+            ax.set_xlim(xlim)
+            ax.set_ylim(ylim)
+    finally:
+        if processes != 1:
+            executor.shutdown()
+
+    return grid
+
+
+def generate_fmri(subjects_count, timepoints_count=19, seed=0):
+    """Synthetic data shaped like seaborn's fmri: signal by subject, timepoint, event and region, with noise
+
+    :param subjects_count: number of subjects
+    :type subjects_count: int
+    :param timepoints_count: number of timepoints
+    :type timepoints_count: int
+    :param seed: random seed
+    :type seed: int
+    :return: data - columns subject, timepoint, event, region and signal, 10 repeated scans per combination
+    :rtype: pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product(
+        [
+            ["s{}".format(i) for i in range(subjects_count)],
+            range(timepoints_count),
+            ["stim", "cue"],
+            ["frontal", "parietal"],
+            range(10),
+        ],
+        names=["subject", "timepoint", "event", "region", "scan"],
+    )
+    data = index.to_frame(index=False).drop(columns="scan")
+    response = np.sin(data["timepoint"] / timepoints_count * np.pi) * np.where(
+        data["event"] == "stim", 0.2, 0.05
+    )
+    data["signal"] = response + rng.normal(0, 0.05, len(data))
+
+    return data
+
+
+def benchmark(subjects_count, processes_counts, dpi=50):
+    """Time relplot and parallel_relplot drawing one line facet per subject with bootstrapped bands
+
+    :param subjects_count: number of subjects
+    :type subjects_count: int
+    :param processes_counts: numbers of worker processes compared
+    :type processes_counts: list
+    :param dpi: resolution
+    :type dpi: float
+    :return: results - dicts with method, processes and seconds
+    :rtype: list
+    """
+    plt.switch_backend("Agg")
+    fmri = generate_fmri(subjects_count).query("region == 'frontal'")
+    plot = dict(
+        x="timepoint",
+        y="signal",
+        hue="event",
+        col="subject",
+        col_wrap=7,
+        kind="line",
+        height=2,
+        linewidth=2.5,
+    )
+
+    def time_plot(function, **kwargs):
+        start = time.perf_counter()
+        grid = function(fmri, **plot, **kwargs)
+        grid.figure.canvas.draw()
+        seconds = time.perf_counter() - start
+        plt.close(grid.figure)
+        return seconds
+
+    results = [{"method": "relplot", "processes": 1, "seconds": time_plot(sns.relplot)}]
+    for processes in processes_counts:
+        results.append(
+            {
+                "method": "parallel_relplot",
+                "processes": processes,
+                "seconds": time_plot(parallel_relplot, processes=processes, dpi=dpi),
+            }
+        )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare relplot and parallel facet rendering"
+    )
+    parser.add_argument("--subjects", type=int, default=140)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1]
+    )
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.subjects, args.processes):
+        print("{method:>18} {processes:>3} {seconds:>8.2f}s".format(**result))
+
+
+if __name__ == "__main__":
+    main()
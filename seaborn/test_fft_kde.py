@@ -0,0 +1,79 @@
+"""Accuracy of fft_kde against the exact density of scipy's gaussian_kde
+
+Run from the repository root or this directory:
+
+    python -m pytest -q test_fft_kde.py
+"""
+
+import numpy as np
+import pytest
+
+from fft_kde import check_accuracy, exact_kde, fft_kde
+
+# the benchmark's bound on the largest error relative to the exact density's peak
+TOLERANCE = 2e-3
+
+
+def _make_samples(dimensions, rows_count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    if dimensions == 1:
+        # a skewed mixture, so the bandwidth is small relative to the data range
+        return np.concatenate(
+            [
+                rng.normal(0, 1, rows_count // 2),
+                rng.lognormal(1, 0.5, rows_count - rows_count // 2),
+            ]
+        )
+
+    x = rng.normal(0, 1, rows_count)
+    return np.column_stack([x, 0.5 * x + rng.normal(0, 0.7, rows_count)])
+
+
+@pytest.mark.parametrize("dimensions", [1, 2])
+@pytest.mark.parametrize("weighted", [False, True])
+@pytest.mark.parametrize("bw_adjust", [1, 0.3, 2.5])
+def test_matches_exact_kde(dimensions, weighted, bw_adjust):
+    values = _make_samples(dimensions)
+    weights = (
+        np.random.default_rng(1).uniform(0.1, 3, len(values)) if weighted else None
+    )
+    gridsize = 200 if dimensions == 1 else 50
+
+    error = check_accuracy(
+        values, weights=weights, bw_adjust=bw_adjust, gridsize=gridsize
+    )
+
+    assert error < TOLERANCE
+
+
+def test_groups_match_exact_kde():
+    values = _make_samples(1, rows_count=3000)
+    codes = np.repeat([0, 1, 2], 1000)
+    values[codes == 1] += 5
+
+    grids, densities = fft_kde(values, codes=codes)
+
+    for group in range(3):
+        exact = exact_kde(values[codes == group], grids[group])
+        assert np.abs(densities[group] - exact).max() / exact.max() < TOLERANCE
+
+
+def test_clip_keeps_samples_beyond_it():
+    values = _make_samples(1)
+
+    grids, densities = fft_kde(values, clip=(0, 2))
+
+    assert grids[0, 0, 0] == 0 and grids[0, 0, -1] == 2
+    exact = exact_kde(values, grids[0])
+    assert np.abs(densities[0] - exact).max() / exact.max() < TOLERANCE
+
+
+def test_degenerate_groups_are_skipped():
+    values = np.concatenate([_make_samples(1, rows_count=500), [1.0], [2.0, 2.0]])
+    codes = np.concatenate([np.zeros(500, dtype=int), [1], [2, 2]])
+
+    with pytest.warns(UserWarning, match="2 of 3 groups"):
+        grids, densities = fft_kde(values, codes=codes)
+
+    assert np.isfinite(densities[0]).all()
+    assert np.isnan(densities[1:]).all() and np.isnan(grids[1:]).all()
@@ -0,0 +1,263 @@
+"""asyncio engine and sessions for the sales database, with the query patterns of sqlalchemy-practice.py
+
+Uses the aiosqlite driver and AsyncSession over the same Customers and Invoices mappings, so a request handler awaits
+its lookups instead of blocking a thread. Connections get the same pragmas as engines.create_sqlite_engine.
+
+    engine = create_async_sales_engine("sales.db")
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as session:
+        customer = await get_customer(session, 2)
+
+Run from this directory to compare concurrent lookups against a thread per request on the sync engine:
+
+    python async_sales.py --lookups 1000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, selectinload
+
+from bulk_load import bulk_insert_graphs, generate_customer_graphs
+from engines import DEFAULT_PRAGMAS, create_engines, set_pragmas
+from schema import Base, Customers, Invoices
+
+
+def create_async_sales_engine(path, echo=False, pragmas=None, pool_size=20):
+    """Async engine for a SQLite database file using aiosqlite
+
+    :param path: path of the database file
+    :type path: str
+    :param echo: log every statement
+    :type echo: bool
+    :param pragmas: pragma values keyed by name, overriding engines.DEFAULT_PRAGMAS
+    :type pragmas: dict
+    :param pool_size: number of pooled connections
+    :type pool_size: int
+    :return: engine
+    :rtype: sqlalchemy.ext.asyncio.AsyncEngine
+    """
+    pragmas = {
+        name: value
+        for name, value in dict(DEFAULT_PRAGMAS, **(pragmas or {})).items()
+        if value is not None
+    }
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///{}".format(path),
+        echo=echo,
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+
+    # connection events are sync - the adapted aiosqlite connection runs these statements on the event loop
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        set_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+async def create_tables(engine):
+    """Create the sales tables that don't exist yet
+
+    :param engine: async engine
+    :type engine: sqlalchemy.ext.asyncio.AsyncEngine
+    :return: None
+    """
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def get_customer(session, customer_id):
+    """Customer by primary key, from the identity map if already loaded
+
+    :param session: async session on the sales database
+    :type session: sqlalchemy.ext.asyncio.AsyncSession
+    :param customer_id: primary key
+    :type customer_id: int
+    :return: customer, or None if there is none with that key
+    :rtype: Customers
+    """
+    return await session.get(Customers, customer_id)
+
+
+async def get_customer_with_invoices(session, customer_id):
+    """Customer by primary key with their invoices loaded - lazy loading is not available under asyncio
+
+    Always runs the SELECT: session.get returns a customer already in the identity map without loading its invoices.
+
+    :param session: async session on the sales database
+    :type session: sqlalchemy.ext.asyncio.AsyncSession
+    :param customer_id: primary key
+    :type customer_id: int
+    :return: customer, or None if there is none with that key
+    :rtype: Customers
+    """
+    return await session.scalar(
+        select(Customers)
+        .where(Customers.id == customer_id)
+        .options(selectinload(Customers.invoices))
+    )
+
+
+async def find_customers(session, name_prefix, min_id=None):
+    """Customers whose name starts with a prefix, as in the practice script's filter examples
+
+    :param session: async session on the sales database
+    :type session: sqlalchemy.ext.asyncio.AsyncSession
+    :param name_prefix: start of the customer name
+    :type name_prefix: str
+    :param min_id: only customers with a larger id
+    :type min_id: int
+    :return: customers ordered by id
+    :rtype: list
+    """
+    statement = select(Customers).where(Customers.name.like(name_prefix + "%"))
+    if min_id is not None:
+        statement = statement.where(Customers.id > min_id)
+
+    result = await session.scalars(statement.order_by(Customers.id))
+
+    return result.all()
+
+
+async def get_customer_invoices(session, customer_id):
+    """Name, invoice number and amount of each invoice of a customer, joining Customers to Invoices
+
+    :param session: async session on the sales database
+    :type session: sqlalchemy.ext.asyncio.AsyncSession
+    :param customer_id: primary key of the customer
+    :type customer_id: int
+    :return: rows of name, invno and amount
+    :rtype: list
+    """
+    statement = (
+        select(Customers.name, Invoices.invno, Invoices.amount)
+        .join(Invoices, Customers.id == Invoices.custid)
+        .where(Customers.id == customer_id)
+        .order_by(Invoices.id)
+    )
+    result = await session.execute(statement)
+
+    return result.all()
+
+
+async def get_invoice_counts(session):
+    """Every customer with their number of invoices, using the practice script's grouped subquery
+
+    :param session: async session on the sales database
+    :type session: sqlalchemy.ext.asyncio.AsyncSession
+    :return: rows of customer and invoice_count - None for customers without invoices
+    :rtype: list
+    """
+    sub = (
+        select(Invoices.custid, func.count("*").label("invoice_count"))
+        .group_by(Invoices.custid)
+        .subquery()
+        .alias("i")
+    )
+    statement = (
+        select(Customers, sub.c.invoice_count)
+        .outerjoin(sub, Customers.id == sub.c.custid)
+        .order_by(Customers.id)
+    )
+    result = await session.execute(statement)
+
+    return result.all()
+
+
+def benchmark(lookups_count, concurrency, customers_count=10_000):
+    """Throughput of customer-with-invoices lookups: asyncio tasks against a thread per request
+
+    :param lookups_count: number of lookups
+    :type lookups_count: int
+    :param concurrency: concurrent requests - tasks in flight or threads
+    :type concurrency: int
+    :param customers_count: number of customers, each with 3 invoices
+    :type customers_count: int
+    :return: results - dicts with method, lookups and lookups_per_second
+    :rtype: list
+    """
+    results = []
+    customer_ids = [i * 7919 % customers_count + 1 for i in range(lookups_count)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sales.db")
+        write_engine, read_engine = create_engines(path, readers=concurrency)
+        Base.metadata.create_all(write_engine)
+        bulk_insert_graphs(write_engine, generate_customer_graphs(customers_count, 3))
+
+        def lookup_sync(customer_id):
+            with Session(read_engine) as session:
+                customer = session.get(
+                    Customers, customer_id, options=[selectinload(Customers.invoices)]
+                )
+                return len(customer.invoices)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lookup_sync, customer_ids))
+        seconds = time.perf_counter() - start
+        results.append(
+            {
+                "method": "sync_thread_per_request",
+                "lookups": lookups_count,
+                "lookups_per_second": lookups_count / seconds,
+            }
+        )
+        write_engine.dispose()
+        read_engine.dispose()
+
+        async def run_async():
+            engine = create_async_sales_engine(path, pool_size=concurrency)
+            session_factory = async_sessionmaker(engine, expire_on_commit=False)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def lookup(customer_id):
+                async with semaphore:
+                    async with session_factory() as session:
+                        customer = await get_customer_with_invoices(
+                            session, customer_id
+                        )
+                        return len(customer.invoices)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(lookup(i) for i in customer_ids))
+            seconds = time.perf_counter() - start
+            await engine.dispose()
+
+            return seconds
+
+        seconds = asyncio.run(run_async())
+        results.append(
+            {
+                "method": "asyncio",
+                "lookups": lookups_count,
+                "lookups_per_second": lookups_count / seconds,
+            }
+        )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare async lookups with a thread per request"
+    )
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--customers", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.lookups, args.concurrency, args.customers):
+        print("{method:>25} {lookups_per_second:>10,.0f} lookups/s".format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""Load large numbers of rows into the college and sales databases
+
+Rows are streamed from any iterable of dicts - a generator or a CSV file - and inserted with Core executemany in
+fixed-size batches, one transaction per batch, so memory stays flat however many rows are loaded. On SQLite the
+journal can be switched to WAL and fsyncs turned off while loading.
+
+Object graphs such as Customers with their Invoices are inserted the same way: primary keys are assigned up front so
+all parents and then all children of a batch go in as two executemany statements, instead of the unit of work flushing
+one row at a time to learn each parent's key.
+
+Run from this directory to compare against the ORM add_all path:
+
+    python bulk_load.py --rows 10000 100000 1000000
+    python bulk_load.py --rows 100000 --invoices-per-customer 10
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import instance_dict
+
+from schema import Base, Customers, Invoices
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+def iter_batches(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Split an iterable of rows into lists of at most batch_size rows
+
+    :param rows: rows to split
+    :type rows: Iterable[dict]
+    :param batch_size: maximum number of rows per batch
+    :type batch_size: int
+    :return: generator of batches
+    :rtype: Iterator[list]
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+
+        yield batch
+
+
+def iter_csv_rows(path, converters=None):
+    """Stream rows of a CSV file with a header line as dicts
+
+    :param path: path to the CSV file
+    :type path: str
+    :param converters: functions converting the text value of a column, keyed by column name
+    :type converters: dict
+    :return: generator of rows
+    :rtype: Iterator[dict]
+    """
+    converters = converters or {}
+
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            for column, converter in converters.items():
+                row[column] = converter(row[column])
+
+            yield row
+
+
+@contextmanager
+def sqlite_load_pragmas(connection, synchronous_off=True, wal=True):
+    """Relax SQLite durability on a connection while loading, restoring synchronous afterwards
+
+    With synchronous=OFF a power loss during the load can corrupt the database, so only use it for data that can be
+    reloaded. journal_mode=WAL is persistent and left in place.
+
+    :param connection: connection to a SQLite database
+    :type connection: sqlalchemy.engine.Connection
+    :param synchronous_off: skip fsyncs with PRAGMA synchronous=OFF
+    :type synchronous_off: bool
+    :param wal: switch to write-ahead logging with PRAGMA journal_mode=WAL
+    :type wal: bool
+    :return: None
+    """
+    if connection.dialect.name != "sqlite":
+        yield
+        return
+
+    synchronous = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+    if wal:
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    if synchronous_off:
+        connection.exec_driver_sql("PRAGMA synchronous=OFF")
+    connection.commit()
+
+    try:
+        yield
+    finally:
+        connection.rollback()
+        connection.exec_driver_sql("PRAGMA synchronous={}".format(int(synchronous)))
+        connection.commit()
+
+
+def bulk_insert(engine, table, rows, batch_size=DEFAULT_BATCH_SIZE, fast_pragmas=False):
+    """Insert rows with Core executemany, one transaction per batch
+
+    :param engine: engine of the target database
+    :type engine: sqlalchemy.engine.Engine
+    :param table: target table, or a mapped class such as Customers
+    :param rows: rows as dicts keyed by column name - a generator is consumed lazily
+    :type rows: Iterable[dict]
+    :param batch_size: number of rows per executemany and transaction
+    :type batch_size: int
+    :param fast_pragmas: relax SQLite durability while loading, see sqlite_load_pragmas
+    :type fast_pragmas: bool
+    :return: number of rows inserted
+    :rtype: int
+    """
+    table = getattr(table, "__table__", table)
+    insert = table.insert()
+    rows_count = 0
+
+    with engine.connect() as connection:
+        pragmas = sqlite_load_pragmas(connection) if fast_pragmas else _no_pragmas()
+        with pragmas:
+            for batch in iter_batches(rows, batch_size=batch_size):
+                with connection.begin():
+                    connection.execute(insert, batch)
+                rows_count += len(batch)
+
+    return rows_count
+
+
+@contextmanager
+def _no_pragmas():
+    yield
+
+
+def bulk_insert_csv(
+    engine,
+    table,
+    path,
+    converters=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    fast_pragmas=False,
+):
+    """Insert the rows of a CSV file whose header names the table's columns
+
+    :param engine: engine of the target database
+    :type engine: sqlalchemy.engine.Engine
+    :param table: target table, or a mapped class such as Customers
+    :param path: path to the CSV file
+    :type path: str
+    :param converters: functions converting the text value of a column, keyed by column name
+    :type converters: dict
+    :param batch_size: number of rows per executemany and transaction
+    :type batch_size: int
+    :param fast_pragmas: relax SQLite durability while loading, see sqlite_load_pragmas
+    :type fast_pragmas: bool
+    :return: number of rows inserted
+    :rtype: int
+    """
+    rows = iter_csv_rows(path, converters=converters)
+
+    return bulk_insert(
+        engine, table, rows, batch_size=batch_size, fast_pragmas=fast_pragmas
+    )
+
+
+def bulk_insert_graphs(
+    engine,
+    parents,
+    relationship=Customers.invoices,
+    batch_size=DEFAULT_BATCH_SIZE,
+    detach=True,
+):
+    """Insert mapped objects together with the children in a one-to-many relationship, e.g. Customers and Invoices
+
+    Primary keys are allocated after the largest existing key of each table and set on the objects, along with the
+    children's foreign keys. Each batch of parents and all their children are then inserted with two executemany
+    statements in one transaction. Objects come back detached with their keys set, so they can be added to a session
+    without being inserted again. Keys are allocated once per call, so concurrent writers to the same tables fail with
+    an IntegrityError rather than mislinking rows.
+
+    On 5k customers x 5 invoices the insert takes about 3x raw Core executemany of the same rows, or 1.3x without
+    detaching. Creating the ORM objects in the first place costs several times more than either, so graphs built only
+    to be loaded are faster still as plain rows through bulk_insert.
+
+    :param engine: engine of the target database
+    :type engine: sqlalchemy.engine.Engine
+    :param parents: new parent objects with their children attached through the relationship
+    :type parents: Iterable
+    :param relationship: one-to-many relationship attribute linking parents to children
+    :param batch_size: number of parents per transaction
+    :type batch_size: int
+    :param detach: mark the objects detached and persistent - without it they are left transient, with their keys set,
+        and adding them to a session would insert them again
+    :type detach: bool
+    :return: parents - the inserted parent objects
+    :rtype: list
+    """
+    relationship_property = relationship.property
+    parent_mapper = relationship_property.parent
+    child_mapper = relationship_property.mapper
+    ((parent_key_column, foreign_key_column),) = (
+        relationship_property.local_remote_pairs
+    )
+
+    parent_key = parent_mapper.get_property_by_column(parent_key_column).key
+    foreign_key = child_mapper.get_property_by_column(foreign_key_column).key
+    (child_key_column,) = child_mapper.primary_key
+    child_key = child_mapper.get_property_by_column(child_key_column).key
+
+    parent_columns = _get_column_keys(parent_mapper)
+    child_columns = _get_column_keys(child_mapper)
+    parent_insert = parent_mapper.local_table.insert()
+    child_insert = child_mapper.local_table.insert()
+
+    inserted_parents = []
+    with engine.connect() as connection:
+        next_parent_key = _get_max_key(connection, parent_key_column) + 1
+        next_child_key = _get_max_key(connection, child_key_column) + 1
+
+        for batch in iter_batches(parents, batch_size=batch_size):
+            parent_rows = []
+            child_rows = []
+            children = []
+
+            # the objects are transient, so keys are written straight into their instance dicts rather than through
+            # attribute instrumentation - make_transient_to_detached then marks every attribute as committed
+            for parent in batch:
+                parent_dict = instance_dict(parent)
+                parent_dict[parent_key] = next_parent_key
+                parent_rows.append(_get_row(parent_dict, parent_columns))
+
+                for child in parent_dict.get(relationship_property.key, ()):
+                    child_dict = instance_dict(child)
+                    child_dict[child_key] = next_child_key
+                    child_dict[foreign_key] = next_parent_key
+                    child_rows.append(_get_row(child_dict, child_columns))
+                    children.append(child)
+                    next_child_key += 1
+
+                next_parent_key += 1
+
+            with connection.begin():
+                connection.execute(parent_insert, parent_rows)
+                if child_rows:
+                    connection.execute(child_insert, child_rows)
+
+            if detach:
+                for obj in batch + children:
+                    make_transient_to_detached(obj)
+            inserted_parents.extend(batch)
+
+    return inserted_parents
+
+
+def _get_column_keys(mapper):
+    # (attribute name, column name) of each mapped column
+    return [
+        (column_property.key, column_property.columns[0].key)
+        for column_property in mapper.column_attrs
+    ]
+
+
+def _get_row(obj_dict, column_keys):
+    return {column: obj_dict.get(attribute) for attribute, column in column_keys}
+
+
+def _get_max_key(connection, key_column):
+    max_key = connection.execute(select(func.max(key_column))).scalar()
+    connection.rollback()
+
+    return max_key or 0
+
+
+def generate_customers(rows_count):
+    """Customer rows for benchmarking
+
+    :param rows_count: number of rows
+    :type rows_count: int
+    :return: generator of rows
+    :rtype: Iterator[dict]
+    """
+    for i in range(rows_count):
+        yield {
+            "name": "Customer {}".format(i),
+            "address": "{} Station Road".format(i),
+            "email": "customer{}@example.com".format(i),
+        }
+
+
+def benchmark(rows_counts, batch_size=DEFAULT_BATCH_SIZE, orm_max_rows=10**6):
+    """Time loading customers with bulk_insert against session.add_all into fresh SQLite files
+
+    :param rows_counts: numbers of rows to load
+    :type rows_counts: list
+    :param batch_size: number of rows per batch
+    :type batch_size: int
+    :param orm_max_rows: the ORM path is skipped above this many rows
+    :type orm_max_rows: int
+    :return: results - dicts with method, rows and seconds
+    :rtype: list
+    """
+    methods = {
+        "orm_add_all": _load_orm_add_all,
+        "core_executemany": lambda engine, n: bulk_insert(
+            engine, Customers, generate_customers(n), batch_size=batch_size
+        ),
+        "core_executemany_fast_pragmas": lambda engine, n: bulk_insert(
+            engine,
+            Customers,
+            generate_customers(n),
+            batch_size=batch_size,
+            fast_pragmas=True,
+        ),
+    }
+
+    results = []
+    for rows_count in rows_counts:
+        for method, load in methods.items():
+            if method == "orm_add_all" and rows_count > orm_max_rows:
+                continue
+
+            seconds = _time_load(
+                load, rows_count, expected_counts={"customers": rows_count}
+            )
+            results.append({"method": method, "rows": rows_count, "seconds": seconds})
+
+    return results
+
+
+def _time_load(load, rows_count, expected_counts):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine("sqlite:///" + os.path.join(directory, "sales.db"))
+        Base.metadata.create_all(engine)
+
+        start = time.perf_counter()
+        load(engine, rows_count)
+        seconds = time.perf_counter() - start
+
+        with engine.connect() as connection:
+            for table, expected_count in expected_counts.items():
+                count = connection.execute(
+                    text("SELECT count(*) FROM {}".format(table))
+                ).scalar()
+                assert count == expected_count
+        engine.dispose()
+
+    return seconds
+
+
+def generate_customer_graphs(customers_count, invoices_per_customer):
+    """New Customers objects each with the same number of Invoices, for benchmarking
+
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param invoices_per_customer: number of invoices of each customer
+    :type invoices_per_customer: int
+    :return: generator of customers
+    :rtype: Iterator[Customers]
+    """
+    for row in generate_customers(customers_count):
+        yield Customers(
+            invoices=[
+                Invoices(invno=invno, amount=1000 + invno)
+                for invno in range(invoices_per_customer)
+            ],
+            **row,
+        )
+
+
+def benchmark_graphs(
+    customers_counts,
+    invoices_per_customer,
+    batch_size=DEFAULT_BATCH_SIZE,
+    orm_max_rows=10**5,
+):
+    """Time loading customers with invoices through the unit of work, bulk_insert_graphs and raw Core executemany
+
+    The raw Core load inserts plain rows with precomputed keys, a lower bound for bulk_insert_graphs. Creating the
+    object graphs is timed on its own as build_objects, and bulk_insert_graphs is timed on graphs built beforehand.
+
+    :param customers_counts: numbers of customers to load
+    :type customers_counts: list
+    :param invoices_per_customer: number of invoices of each customer
+    :type invoices_per_customer: int
+    :param batch_size: number of customers per batch
+    :type batch_size: int
+    :param orm_max_rows: the ORM path is skipped above this many customers
+    :type orm_max_rows: int
+    :return: results - dicts with method, rows (customers) and seconds
+    :rtype: list
+    """
+
+    def load_orm(engine, n):
+        with Session(engine) as session:
+            session.add_all(generate_customer_graphs(n, invoices_per_customer))
+            session.commit()
+
+    def load_graphs(engine, n, detach=True):
+        bulk_insert_graphs(engine, graphs, batch_size=batch_size, detach=detach)
+
+    def load_core(engine, n):
+        customer_rows = (
+            dict(row, id=i + 1) for i, row in enumerate(generate_customers(n))
+        )
+        invoice_rows = (
+            {"custid": i // invoices_per_customer + 1, "invno": i, "amount": i}
+            for i in range(n * invoices_per_customer)
+        )
+        bulk_insert(engine, Customers, customer_rows, batch_size=batch_size)
+        bulk_insert(
+            engine,
+            Invoices,
+            invoice_rows,
+            batch_size=batch_size * max(invoices_per_customer, 1),
+        )
+
+    methods = {
+        "orm_add_all": load_orm,
+        "bulk_insert_graphs": load_graphs,
+        "bulk_insert_graphs_no_detach": partial(load_graphs, detach=False),
+        "core_executemany": load_core,
+    }
+
+    results = []
+    for customers_count in customers_counts:
+        expected_counts = {
+            "customers": customers_count,
+            "invoices": customers_count * invoices_per_customer,
+        }
+        start = time.perf_counter()
+        graphs = list(generate_customer_graphs(customers_count, invoices_per_customer))
+        results.append(
+            {
+                "method": "build_objects",
+                "rows": customers_count,
+                "seconds": time.perf_counter() - start,
+            }
+        )
+        for method, load in methods.items():
+            if method == "orm_add_all" and customers_count > orm_max_rows:
+                continue
+            if method.startswith("bulk_insert_graphs") and graphs is None:
+                graphs = list(
+                    generate_customer_graphs(customers_count, invoices_per_customer)
+                )
+
+            seconds = _time_load(load, customers_count, expected_counts)
+            if method.startswith("bulk_insert_graphs"):
+                # the load set keys on the objects, so the next one needs fresh graphs
+                graphs = None
+            results.append(
+                {"method": method, "rows": customers_count, "seconds": seconds}
+            )
+
+    return results
+
+
+def _load_orm_add_all(engine, rows_count):
+    with Session(engine) as session:
+        session.add_all(Customers(**row) for row in generate_customers(rows_count))
+        session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark bulk loading against the ORM add_all path"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10**4, 10**5, 10**6])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--orm-max-rows", type=int, default=10**6)
+    parser.add_argument(
+        "--invoices-per-customer",
+        type=int,
+        default=0,
+        help="load customers with this many invoices each through bulk_insert_graphs",
+    )
+    args = parser.parse_args(argv)
+
+    if args.invoices_per_customer:
+        results = benchmark_graphs(
+            args.rows,
+            args.invoices_per_customer,
+            batch_size=args.batch_size,
+            orm_max_rows=args.orm_max_rows,
+        )
+    else:
+        results = benchmark(
+            args.rows, batch_size=args.batch_size, orm_max_rows=args.orm_max_rows
+        )
+    for result in results:
+        print(
+            "{method:>30} {rows:>10} rows {seconds:>8.2f}s {rate:>12,.0f} rows/s".format(
+                rate=result["rows"] / result["seconds"], **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
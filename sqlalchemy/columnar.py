@@ -0,0 +1,243 @@
+"""Fetch the result of a Core select straight into NumPy arrays, one per column
+
+The statement is compiled and run on the raw DBAPI cursor, and each fetchmany batch is transposed and copied into
+preallocated typed arrays that grow geometrically - no Row objects, list of tuples or DataFrame construction per record.
+
+Going around the Result also skips SQLAlchemy's result processors: values arrive as the driver returns them, so on
+SQLite a DateTime column holds ISO strings, a Numeric column floats rather than Decimals and an Enum its stored string.
+Expressions such as func.count(Invoices.id) must be named with .label(), as their names become the keys of the result.
+
+    columns = fetch_columns(connection, select(Invoices.custid, Invoices.amount))
+    columns["amount"].sum()
+
+Run from this directory to compare against Row objects -> list of tuples -> DataFrame:
+
+    python columnar.py --rows 1000000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from sqlalchemy import LABEL_STYLE_TABLENAME_PLUS_COL, select
+
+from bulk_load import bulk_insert
+from engines import create_sqlite_engine
+from schema import Base, Invoices
+
+DEFAULT_BATCH_SIZE = 10_000
+
+PYTHON_TYPE_DTYPES = {int: np.int64, float: np.float64, bool: np.bool_}
+
+
+def get_column_names(statement):
+    """Name of each selected column - its label, or its table and name with LABEL_STYLE_TABLENAME_PLUS_COL
+
+    :param statement: select statement
+    :type statement: sqlalchemy.sql.Select
+    :return: names, in select order
+    :rtype: list
+    :raises ValueError: if a column is an unlabeled expression such as func.count(Invoices.id), or two columns have
+        the same name, e.g. students.c.id and addresses.c.id
+    """
+    # expressions have no name of their own - SQLAlchemy would call them count, sum or _no_label
+    unlabeled = [
+        str(position)
+        for position, column in enumerate(statement.selected_columns)
+        if column.key is None
+    ]
+    if unlabeled:
+        raise ValueError(
+            "unlabeled expressions at column positions {} - name them with .label()".format(
+                ", ".join(unlabeled)
+            )
+        )
+
+    if statement.get_label_style() == LABEL_STYLE_TABLENAME_PLUS_COL:
+        names = list(statement.selected_columns.keys())
+    else:
+        # selected_columns.keys() would silently rename a duplicate to id_1
+        names = [column.key for column in statement.selected_columns]
+
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(
+            "duplicate column names {} - label the columns or use "
+            "set_label_style(LABEL_STYLE_TABLENAME_PLUS_COL)".format(
+                ", ".join(duplicates)
+            )
+        )
+
+    return names
+
+
+def get_column_dtypes(statement):
+    """NumPy dtype of each selected column from its SQL type: int64, float64, bool or object
+
+    :param statement: select statement
+    :type statement: sqlalchemy.sql.Select
+    :return: dtypes keyed by column name, in select order
+    :rtype: dict
+    """
+    dtypes = {}
+    for name, column in zip(get_column_names(statement), statement.selected_columns):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = object
+        dtypes[name] = np.dtype(PYTHON_TYPE_DTYPES.get(python_type, object))
+
+    return dtypes
+
+
+def fetch_columns(
+    connection,
+    statement,
+    dtypes=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    expected_rows=None,
+    as_frame=False,
+):
+    """Result of a select as a NumPy array per column
+
+    Integer columns containing NULLs cannot be stored as int64 - pass a float dtype for them to get NaN instead.
+
+    :param connection: connection to execute the statement on
+    :type connection: sqlalchemy.engine.Connection
+    :param statement: Core select statement
+    :type statement: sqlalchemy.sql.Select
+    :param dtypes: dtypes keyed by column name, overriding those inferred by get_column_dtypes
+    :type dtypes: dict
+    :raises ValueError: if dtypes names a column that is not selected, or two columns have the same name
+    :param batch_size: number of rows fetched from the cursor at a time
+    :type batch_size: int
+    :param expected_rows: initial capacity of the arrays, e.g. from a prior count
+    :type expected_rows: int
+    :param as_frame: return a DataFrame instead of a dict
+    :type as_frame: bool
+    :return: columns - arrays keyed by column name, or a DataFrame with those columns
+    :rtype: dict or pd.DataFrame
+    """
+    column_dtypes = get_column_dtypes(statement)
+    unknown = sorted(set(dtypes or {}) - set(column_dtypes))
+    if unknown:
+        raise ValueError(
+            "dtypes of columns not selected: {}".format(", ".join(unknown))
+        )
+    column_dtypes.update(dtypes or {})
+    names = list(column_dtypes)
+
+    # render_postcompile expands IN lists into one placeholder per value
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    if compiled.positiontup is not None:
+        parameters = [compiled.params[name] for name in compiled.positiontup]
+    else:
+        parameters = compiled.params
+
+    capacity = max(expected_rows or batch_size, 1)
+    arrays = [np.empty(capacity, dtype=column_dtypes[name]) for name in names]
+    rows_count = 0
+
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.execute(str(compiled), parameters)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+
+            end = rows_count + len(batch)
+            if end > capacity:
+                # double the capacity so the number of copies grows with the log of the number of rows
+                while capacity < end:
+                    capacity *= 2
+                for array in arrays:
+                    array.resize(capacity, refcheck=False)
+
+            for array, values in zip(arrays, zip(*batch)):
+                array[rows_count:end] = values
+            rows_count = end
+    finally:
+        cursor.close()
+
+    for array in arrays:
+        array.resize(rows_count, refcheck=False)
+    columns = dict(zip(names, arrays))
+
+    if as_frame:
+        import pandas as pd
+
+        return pd.DataFrame(columns, copy=False)
+
+    return columns
+
+
+def benchmark(rows_count):
+    """Time and peak traced memory of pulling invoice custid and amount into a DataFrame, two ways
+
+    :param rows_count: number of invoices
+    :type rows_count: int
+    :return: results - dicts with method, seconds and peak_mb
+    :rtype: list
+    """
+    import pandas as pd
+
+    engine = create_sqlite_engine()
+    Base.metadata.create_all(engine)
+    bulk_insert(
+        engine,
+        Invoices,
+        (
+            {"custid": i % 1000, "invno": i, "amount": i % 10_000}
+            for i in range(rows_count)
+        ),
+    )
+    statement = select(Invoices.custid, Invoices.amount)
+
+    def from_rows(connection):
+        rows = connection.execute(statement).fetchall()
+        return pd.DataFrame([tuple(row) for row in rows], columns=["custid", "amount"])
+
+    def from_columns(connection):
+        return fetch_columns(connection, statement, as_frame=True)
+
+    results = []
+    with engine.connect() as connection:
+        for method, fetch in [("rows", from_rows), ("fetch_columns", from_columns)]:
+            start = time.perf_counter()
+            frame = fetch(connection)
+            seconds = time.perf_counter() - start
+            assert len(frame) == rows_count
+            del frame
+
+            # tracing slows allocations down, so memory is measured on a separate run
+            tracemalloc.start()
+            fetch(connection)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results.append(
+                {"method": method, "seconds": seconds, "peak_mb": peak / 1e6}
+            )
+
+    engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare fetching into NumPy arrays with building Row objects"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.rows):
+        print("{method:>15} {seconds:>8.2f}s {peak_mb:>10.1f}MB peak".format(**result))
+
+
+if __name__ == "__main__":
+    main()
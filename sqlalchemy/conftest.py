@@ -0,0 +1,40 @@
+"""Fixtures shared by the tests of this directory
+
+The synthetic database is built once per test session in pytest's temporary directory. Set SYNTHETIC_DATA_CACHE to a
+directory to keep it between sessions instead - create_synthetic_database names the file after its parameters, so a
+change of parameters builds a new one.
+"""
+
+import os
+
+import pytest
+
+from engines import create_sqlite_engine
+from synthetic_data import create_synthetic_database
+
+SYNTHETIC_DATABASE_PARAMETERS = {
+    "students_count": 2000,
+    "customers_count": 2000,
+    "seed": 0,
+    "chunk_size": 500,
+}
+
+
+@pytest.fixture(scope="session")
+def synthetic_database(tmp_path_factory):
+    """Path of a SQLite database of synthetic college and sales data"""
+    directory = os.environ.get("SYNTHETIC_DATA_CACHE") or tmp_path_factory.mktemp(
+        "data"
+    )
+
+    return create_synthetic_database(
+        directory, processes=1, **SYNTHETIC_DATABASE_PARAMETERS
+    )
+
+
+@pytest.fixture(scope="session")
+def sales_engine(synthetic_database):
+    """Read-only engine of the synthetic database"""
+    engine = create_sqlite_engine(synthetic_database, read_only=True)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,442 @@
+"""Customer search: full-text token search through an FTS5 shadow table and indexed name prefix lookups
+
+customers_fts is an external-content FTS5 table over the name, address and email of Customers - it stores only the
+full-text index and reads the text from customers. Triggers on customers keep it in sync for ORM flushes, Core
+statements and bulk loads alike. Matches are ranked by BM25, with name matches weighted above address and email.
+
+Prefix lookups such as the practice script's Customers.name.like('Ra%') use schema's ix_customers_name_nocase index:
+SQLite's LIKE ignores case, so only an index in NOCASE order can serve it. Leading wildcards (like('%ra%')) and
+ilike(), which wraps both sides in lower(), cannot use any index - search_customers covers those needs instead.
+
+    with engine.begin() as connection:
+        install(connection)
+    with Session(engine) as session:
+        for customer, score in search_customers(session, "rav kum", page=0):
+            ...
+
+Run from this directory against a database file, or to time lookups on generated customers:
+
+    python customer_search.py sales.db --install
+    python customer_search.py sales.db --search "ravi pune"
+    python customer_search.py --benchmark 10000000
+"""
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import (
+    DDL,
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    func,
+    select,
+)
+from sqlalchemy.orm import Session
+
+from schema import Customers
+
+DEFAULT_PAGE_SIZE = 20
+
+# relative weights of the name, address and email columns in the BM25 rank
+RANK_WEIGHTS = (10.0, 1.0, 1.0)
+
+search_metadata = MetaData()
+
+# mapping of the FTS5 table for building queries - it is created by install, not by create_all
+customers_fts = Table(
+    "customers_fts",
+    search_metadata,
+    Column("rowid", Integer, primary_key=True),
+    Column("customers_fts", String),
+    Column("name", String),
+    Column("address", String),
+    Column("email", String),
+    Column("rank", Float),
+)
+
+# prefix='2 3' adds indexes of 2 and 3 character prefixes, so search-as-you-type queries don't scan the token list
+CREATE_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(
+        name, address, email,
+        content='customers', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+"""
+
+# an external-content table must be told the old values of a row to remove it from the index
+_INSERT_ROW = """
+    INSERT INTO customers_fts (rowid, name, address, email) VALUES (NEW.id, NEW.name, NEW.address, NEW.email);
+"""
+_DELETE_ROW = """
+    INSERT INTO customers_fts (customers_fts, rowid, name, address, email)
+    VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.email);
+"""
+
+TRIGGERS = {
+    "customers_fts_insert": "AFTER INSERT ON customers BEGIN {} END".format(
+        _INSERT_ROW
+    ),
+    "customers_fts_delete": "AFTER DELETE ON customers BEGIN {} END".format(
+        _DELETE_ROW
+    ),
+    "customers_fts_update": "AFTER UPDATE OF id, name, address, email ON customers BEGIN {} {} END".format(
+        _DELETE_ROW, _INSERT_ROW
+    ),
+}
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_LIKE_WILDCARDS = re.compile(r"([%_\\])")
+
+
+def install(connection):
+    """Create the FTS5 table and triggers if missing and the name index, then rebuild the full-text index
+
+    :param connection: connection to the sales database, with the customers table created
+    :type connection: sqlalchemy.engine.Connection
+    :return: None
+    """
+    connection.execute(DDL(CREATE_FTS_TABLE))
+    for name, definition in TRIGGERS.items():
+        connection.execute(
+            DDL("CREATE TRIGGER IF NOT EXISTS {} {}".format(name, definition))
+        )
+    for index in Customers.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+    # make BM25 with the column weights the default rank, used by ORDER BY rank
+    connection.exec_driver_sql(
+        "INSERT INTO customers_fts (customers_fts, rank) VALUES ('rank', 'bm25({})')".format(
+            ", ".join(str(weight) for weight in RANK_WEIGHTS)
+        )
+    )
+    rebuild(connection)
+
+
+def uninstall(connection):
+    """Drop the triggers and the FTS5 table, keeping the name index
+
+    :param connection: connection to the sales database
+    :type connection: sqlalchemy.engine.Connection
+    :return: None
+    """
+    for name in TRIGGERS:
+        connection.execute(DDL("DROP TRIGGER IF EXISTS {}".format(name)))
+    connection.execute(DDL("DROP TABLE IF EXISTS customers_fts"))
+
+
+def rebuild(connection):
+    """Rebuild the full-text index from the customers table, e.g. after loading with the triggers dropped
+
+    :param connection: connection to the sales database
+    :type connection: sqlalchemy.engine.Connection
+    :return: None
+    """
+    connection.exec_driver_sql(
+        "INSERT INTO customers_fts (customers_fts) VALUES ('rebuild')"
+    )
+
+
+def build_match_query(text, prefix=True):
+    """FTS5 query matching rows containing every word of free text, each word as a prefix
+
+    Matching every word as a prefix lets abbreviated queries such as 'rav kum' find Ravi Kumar, as well as completing
+    the word being typed.
+
+    Words are quoted, so characters with a meaning in the FTS5 query syntax - quotes, *, -, AND, NEAR - are searched for
+    literally instead of raising syntax errors.
+
+    :param text: text typed by the user
+    :type text: str
+    :param prefix: match each word as a prefix, for search as you type
+    :type prefix: bool
+    :return: FTS5 query, or None if the text has no words
+    :rtype: str
+    """
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+
+    terms = ['"{}"{}'.format(token, "*" if prefix else "") for token in tokens]
+
+    return " ".join(terms)
+
+
+def select_search(
+    text, page=0, page_size=DEFAULT_PAGE_SIZE, prefix=True, max_candidates=None
+):
+    """Select customers matching free text with their rank, best matches first
+
+    Ranking computes BM25 for every match, about a microsecond each, so a short prefix matching a large share of
+    customers is slow to rank exactly. max_candidates bounds that work: only the first max_candidates matches in id
+    order are ranked, which keeps the latency of very broad queries flat at the cost of exact ordering for them.
+
+    :param text: text typed by the user
+    :type text: str
+    :param page: zero-based page number
+    :type page: int
+    :param page_size: number of customers per page
+    :type page_size: int
+    :param prefix: match each word as a prefix
+    :type prefix: bool
+    :param max_candidates: number of matches ranked, or None to rank all of them
+    :type max_candidates: int
+    :return: statement selecting Customers and score (BM25 - lower is better), or None if the text has no words
+    :rtype: sqlalchemy.sql.Select
+    """
+    match_query = build_match_query(text, prefix=prefix)
+    if match_query is None:
+        return None
+
+    if max_candidates is None:
+        # FTS5 returns the matches in rank order itself, so there is no separate sort step
+        statement = (
+            select(Customers, customers_fts.c.rank.label("score"))
+            .join(customers_fts, customers_fts.c.rowid == Customers.id)
+            .where(customers_fts.c.customers_fts.match(match_query))
+            .order_by(customers_fts.c.rank)
+        )
+    else:
+        # without ORDER BY, FTS5 yields matches in rowid order and stops after the limit - rank is computed per row
+        candidates = (
+            select(customers_fts.c.rowid, customers_fts.c.rank)
+            .where(customers_fts.c.customers_fts.match(match_query))
+            .limit(max_candidates)
+            .subquery("candidates")
+        )
+        statement = (
+            select(Customers, candidates.c.rank.label("score"))
+            .join(candidates, candidates.c.rowid == Customers.id)
+            .order_by(candidates.c.rank)
+        )
+
+    return statement.limit(page_size).offset(page * page_size)
+
+
+def search_customers(
+    session,
+    text,
+    page=0,
+    page_size=DEFAULT_PAGE_SIZE,
+    prefix=True,
+    max_candidates=None,
+):
+    """Page of customers whose name, address or email contains every word of the text, best matches first
+
+    :param session: session on the sales database
+    :type session: sqlalchemy.orm.Session
+    :param text: text typed by the user
+    :type text: str
+    :param page: zero-based page number
+    :type page: int
+    :param page_size: number of customers per page
+    :type page_size: int
+    :param prefix: match each word as a prefix
+    :type prefix: bool
+    :param max_candidates: number of matches ranked, or None to rank all of them, see select_search
+    :type max_candidates: int
+    :return: rows of customer and score - BM25, lower is better
+    :rtype: list
+    """
+    statement = select_search(
+        text,
+        page=page,
+        page_size=page_size,
+        prefix=prefix,
+        max_candidates=max_candidates,
+    )
+    if statement is None:
+        return []
+
+    return session.execute(statement).all()
+
+
+def count_matches(session, text, prefix=True):
+    """Number of customers matching the text, e.g. for the number of pages
+
+    :param session: session on the sales database
+    :type session: sqlalchemy.orm.Session
+    :param text: text typed by the user
+    :type text: str
+    :param prefix: match each word as a prefix
+    :type prefix: bool
+    :return: number of matches
+    :rtype: int
+    """
+    match_query = build_match_query(text, prefix=prefix)
+    if match_query is None:
+        return 0
+
+    return session.scalar(
+        select(func.count()).where(customers_fts.c.customers_fts.match(match_query))
+    )
+
+
+def select_name_prefix(prefix, page=0, page_size=DEFAULT_PAGE_SIZE):
+    """Select customers whose name starts with a prefix, ignoring case, in name order
+
+    The prefix is escaped so that % and _ typed by the user match themselves, and the statement keeps to the form
+    ix_customers_name_nocase can serve: a LIKE on the bare column, ordered in the index's collation.
+
+    :param prefix: start of the name
+    :type prefix: str
+    :param page: zero-based page number
+    :type page: int
+    :param page_size: number of customers per page
+    :type page_size: int
+    :return: statement selecting Customers
+    :rtype: sqlalchemy.sql.Select
+    """
+    pattern = _LIKE_WILDCARDS.sub(r"\\\1", prefix) + "%"
+
+    return (
+        select(Customers)
+        .where(Customers.name.like(pattern, escape="\\"))
+        .order_by(Customers.name.collate("NOCASE"), Customers.id)
+        .limit(page_size)
+        .offset(page * page_size)
+    )
+
+
+def find_customers_by_name_prefix(session, prefix, page=0, page_size=DEFAULT_PAGE_SIZE):
+    """Page of customers whose name starts with a prefix, ignoring case, in name order
+
+    :param session: session on the sales database
+    :type session: sqlalchemy.orm.Session
+    :param prefix: start of the name
+    :type prefix: str
+    :param page: zero-based page number
+    :type page: int
+    :param page_size: number of customers per page
+    :type page_size: int
+    :return: customers
+    :rtype: list
+    """
+    return session.scalars(select_name_prefix(prefix, page, page_size)).all()
+
+
+def benchmark(
+    customers_count,
+    queries=("ra", "ravi", "ravi ka", "pune", "sharma mum", "nikhil gupta"),
+):
+    """Median and 95th percentile latency of each kind of lookup on generated customers
+
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param queries: texts searched for
+    :type queries: tuple
+    :return: results - dicts with method, median_ms and p95_ms
+    :rtype: list
+    """
+    from synthetic_data import populate
+
+    lookups = {
+        # the unindexed baseline a search box falls back to
+        "like_contains": lambda session, text: session.scalars(
+            select(Customers)
+            .where(Customers.name.like("%{}%".format(text.split()[0])))
+            .limit(DEFAULT_PAGE_SIZE)
+        ).all(),
+        "like_prefix": lambda session, text: find_customers_by_name_prefix(
+            session, text.split()[0]
+        ),
+        "fts_search": search_customers,
+        "fts_search_page_5": lambda session, text: search_customers(
+            session, text, page=5
+        ),
+        "fts_search_bounded": lambda session, text: search_customers(
+            session, text, max_candidates=10_000
+        ),
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            "sqlite:///{}".format(os.path.join(directory, "sales.db"))
+        )
+        populate(engine, customers_count=customers_count, max_invoices=0)
+        with engine.begin() as connection:
+            install(connection)
+
+        results = []
+        with Session(engine) as session:
+            for method, lookup in lookups.items():
+                timings = []
+                for _ in range(5):
+                    for text in queries:
+                        start = time.perf_counter()
+                        lookup(session, text)
+                        timings.append((time.perf_counter() - start) * 1000)
+                        session.expunge_all()
+                results.append(
+                    {
+                        "method": method,
+                        "median_ms": statistics.median(timings),
+                        "p95_ms": statistics.quantiles(timings, n=20)[-1],
+                    }
+                )
+        engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search customers")
+    parser.add_argument("path", nargs="?", help="sales database file")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--install", action="store_true")
+    action.add_argument("--uninstall", action="store_true")
+    action.add_argument("--rebuild", action="store_true")
+    action.add_argument("--search", metavar="TEXT")
+    action.add_argument("--benchmark", type=int, metavar="CUSTOMERS")
+    parser.add_argument("--page", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for result in benchmark(args.benchmark):
+            print(
+                "{method:>18} {median_ms:>9.2f}ms median {p95_ms:>9.2f}ms p95".format(
+                    **result
+                )
+            )
+        return 0
+    if args.path is None:
+        parser.error("a database path is required without --benchmark")
+
+    engine = create_engine("sqlite:///{}".format(args.path))
+    if args.search is not None:
+        with Session(engine) as session:
+            for customer, score in search_customers(session, args.search, args.page):
+                print(
+                    "{:>8.2f} {:>10} {} | {} | {}".format(
+                        score,
+                        customer.id,
+                        customer.name,
+                        customer.address,
+                        customer.email,
+                    )
+                )
+            print("{} matches".format(count_matches(session, args.search)))
+        return 0
+
+    with engine.begin() as connection:
+        if args.install:
+            install(connection)
+        elif args.uninstall:
+            uninstall(connection)
+        else:
+            rebuild(connection)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""Engines for the practice SQLite databases with connection pooling and pragmas tuned for concurrent access
+
+A file database gets one writer engine and, optionally, a pool of read-only connections. In WAL mode readers never
+block the writer or each other, so reads go on while a write is in progress rather than waiting for it. In-memory
+databases only exist within one connection, so they share a single connection across threads instead.
+
+    write_engine, read_engine = create_engines("sales.db")
+
+Run from this directory to measure read throughput with a concurrent writer:
+
+    python engines.py --threads 1 2 4 8
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from sqlalchemy import URL, bindparam, create_engine, event, select
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from schema import Base, Customers
+
+MEMORY_DATABASE = ":memory:"
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    # NORMAL is durable in WAL mode except against power loss, and avoids an fsync per commit
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024**2,
+    # negative sizes are in KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+def set_pragmas(dbapi_connection, pragmas):
+    """Execute PRAGMA statements on a new DBAPI connection
+
+    :param dbapi_connection: sqlite3 connection
+    :param pragmas: pragma values keyed by name
+    :type pragmas: dict
+    :return: None
+    """
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute("PRAGMA {}={}".format(name, value))
+    cursor.close()
+
+
+def create_sqlite_engine(
+    path=MEMORY_DATABASE, echo=False, pragmas=None, read_only=False, pool_size=5
+):
+    """Engine for a SQLite database that applies pragmas to every new connection
+
+    File databases use a QueuePool of pool_size connections, read-only engines open the file with mode=ro and
+    PRAGMA query_only. In-memory databases use a StaticPool - a single connection shared across threads - as each
+    connection would otherwise see a different empty database.
+
+    :param path: path of the database file, or ':memory:'
+    :type path: str
+    :param echo: log every statement - slow, for debugging only
+    :type echo: bool
+    :param pragmas: pragma values keyed by name, overriding DEFAULT_PRAGMAS - None keeps the SQLite default
+    :type pragmas: dict
+    :param read_only: open the database read-only
+    :type read_only: bool
+    :param pool_size: number of pooled connections to a file database
+    :type pool_size: int
+    :return: engine
+    :rtype: sqlalchemy.engine.Engine
+    """
+    pragmas = {
+        name: value
+        for name, value in dict(DEFAULT_PRAGMAS, **(pragmas or {})).items()
+        if value is not None
+    }
+
+    if path == MEMORY_DATABASE:
+        # WAL and memory mapping do not apply to in-memory databases
+        pragmas.pop("journal_mode", None)
+        pragmas.pop("mmap_size", None)
+        engine = create_engine(
+            "sqlite://",
+            echo=echo,
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    elif read_only:
+        # the writer engine sets journal_mode - a read-only connection cannot
+        pragmas.pop("journal_mode", None)
+        pragmas["query_only"] = "ON"
+        engine = create_engine(
+            # ?, # and % in the path would otherwise be read as parts of the URI - URL.create keeps the quoting, where
+            # a URL string would be unquoted once by SQLAlchemy before reaching SQLite
+            URL.create(
+                "sqlite",
+                database="file:{}".format(urllib.parse.quote(os.path.abspath(path))),
+                query={"mode": "ro", "uri": "true"},
+            ),
+            echo=echo,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(
+            URL.create("sqlite", database=path),
+            echo=echo,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+            connect_args={"check_same_thread": False},
+        )
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        set_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+def create_engines(path, echo=False, pragmas=None, readers=8):
+    """Writer engine and read-only engine for a SQLite database file
+
+    SQLite allows one writer at a time, so the writer engine holds a single connection and threads queue for it
+    instead of failing with 'database is locked'. The read-only engine pools one connection per reader thread.
+
+    :param path: path of the database file
+    :type path: str
+    :param echo: log every statement
+    :type echo: bool
+    :param pragmas: pragma values keyed by name, overriding DEFAULT_PRAGMAS
+    :type pragmas: dict
+    :param readers: number of pooled read-only connections
+    :type readers: int
+    :return: write_engine, read_engine
+    :rtype: (sqlalchemy.engine.Engine, sqlalchemy.engine.Engine)
+    """
+    write_engine = create_sqlite_engine(path, echo=echo, pragmas=pragmas, pool_size=1)
+
+    # connect once so the database file exists and is in WAL mode before readers open it
+    with write_engine.connect():
+        pass
+
+    read_engine = create_sqlite_engine(
+        path, echo=echo, pragmas=pragmas, read_only=True, pool_size=readers
+    )
+
+    return write_engine, read_engine
+
+
+def benchmark_concurrent_reads(threads_counts, customers_count=100_000, seconds=2.0):
+    """Point lookups per second from reader threads while a writer thread keeps inserting customers
+
+    :param threads_counts: numbers of reader threads to try
+    :type threads_counts: list
+    :param customers_count: number of customers loaded before reading
+    :type customers_count: int
+    :param seconds: duration of each measurement
+    :type seconds: float
+    :return: results - dicts with threads, reads, reads_per_second and writes
+    :rtype: list
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        write_engine, read_engine = create_engines(
+            os.path.join(directory, "sales.db"), readers=max(threads_counts)
+        )
+        Base.metadata.create_all(write_engine)
+        with write_engine.begin() as connection:
+            connection.execute(
+                Customers.__table__.insert(),
+                [{"name": "Customer {}".format(i)} for i in range(customers_count)],
+            )
+
+        for threads_count in threads_counts:
+            stop = threading.Event()
+            reads = [0] * threads_count
+            writes = [0]
+
+            def read(i):
+                lookup = select(Customers.name).where(Customers.id == bindparam("id"))
+                with read_engine.connect() as connection:
+                    while not stop.is_set():
+                        customer_id = (reads[i] * 7919) % customers_count + 1
+                        connection.execute(lookup, {"id": customer_id}).scalar()
+                        reads[i] += 1
+
+            def write():
+                while not stop.is_set():
+                    with write_engine.begin() as connection:
+                        connection.execute(
+                            Customers.__table__.insert(), {"name": "New customer"}
+                        )
+                    writes[0] += 1
+
+            workers = [
+                threading.Thread(target=read, args=(i,)) for i in range(threads_count)
+            ]
+            workers.append(threading.Thread(target=write))
+            for worker in workers:
+                worker.start()
+            time.sleep(seconds)
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+            results.append(
+                {
+                    "threads": threads_count,
+                    "reads": sum(reads),
+                    "reads_per_second": sum(reads) / seconds,
+                    "writes": writes[0],
+                }
+            )
+
+        write_engine.dispose()
+        read_engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure read throughput with a concurrent writer"
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    results = benchmark_concurrent_reads(
+        args.threads, customers_count=args.customers, seconds=args.seconds
+    )
+    for result in results:
+        print(
+            "{threads:>3} readers {reads_per_second:>12,.0f} reads/s {writes:>8} writes".format(
+                **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Per-customer invoice count and total amount, maintained as invoices change instead of recomputed per read
+
+The practice script counts invoices with a GROUP BY subquery that scans the whole invoices table. Here SQLite
+triggers on insert, update and delete of invoices keep a customer_invoice_totals table up to date, so reading the
+counts touches one row per customer. Triggers fire for ORM flushes, Core statements and bulk loads alike.
+
+Run from this directory against a database file:
+
+    python invoice_aggregates.py sales.db --install   # create the table and triggers, then rebuild
+    python invoice_aggregates.py sales.db --check     # list customers whose aggregates are out of date
+    python invoice_aggregates.py sales.db --rebuild   # recompute every aggregate from the invoices table
+"""
+
+import argparse
+import sys
+
+from sqlalchemy import (
+    DDL,
+    Column,
+    Integer,
+    MetaData,
+    Table,
+    create_engine,
+    func,
+    select,
+)
+
+from schema import Customers, Invoices
+
+aggregates_metadata = MetaData()
+
+customer_invoice_totals = Table(
+    "customer_invoice_totals",
+    aggregates_metadata,
+    Column("custid", Integer, primary_key=True, autoincrement=False),
+    Column("invoice_count", Integer, nullable=False),
+    Column("amount_total", Integer, nullable=False),
+)
+
+# add or remove one invoice's contribution to its customer's totals - rows are dropped when their count reaches zero
+_ADD_INVOICE = """
+    INSERT INTO customer_invoice_totals (custid, invoice_count, amount_total)
+    SELECT NEW.custid, 1, COALESCE(NEW.amount, 0) WHERE NEW.custid IS NOT NULL
+    ON CONFLICT (custid) DO UPDATE SET
+        invoice_count = invoice_count + 1,
+        amount_total = amount_total + excluded.amount_total;
+"""
+_REMOVE_INVOICE = """
+    UPDATE customer_invoice_totals
+    SET invoice_count = invoice_count - 1, amount_total = amount_total - COALESCE(OLD.amount, 0)
+    WHERE custid = OLD.custid;
+    DELETE FROM customer_invoice_totals WHERE custid = OLD.custid AND invoice_count = 0;
+"""
+
+TRIGGERS = {
+    "invoices_totals_insert": "AFTER INSERT ON invoices BEGIN {} END".format(
+        _ADD_INVOICE
+    ),
+    "invoices_totals_delete": "AFTER DELETE ON invoices BEGIN {} END".format(
+        _REMOVE_INVOICE
+    ),
+    "invoices_totals_update": "AFTER UPDATE OF custid, amount ON invoices BEGIN {} {} END".format(
+        _REMOVE_INVOICE, _ADD_INVOICE
+    ),
+}
+
+
+def install(connection):
+    """Create the aggregate table and triggers if missing, then rebuild the aggregates
+
+    :param connection: connection to the sales database, with the invoices table created
+    :type connection: sqlalchemy.engine.Connection
+    :return: None
+    """
+    aggregates_metadata.create_all(connection)
+    for name, definition in TRIGGERS.items():
+        connection.execute(
+            DDL("CREATE TRIGGER IF NOT EXISTS {} {}".format(name, definition))
+        )
+    rebuild(connection)
+
+
+def uninstall(connection):
+    """Drop the triggers and the aggregate table
+
+    :param connection: connection to the sales database
+    :type connection: sqlalchemy.engine.Connection
+    :return: None
+    """
+    for name in TRIGGERS:
+        connection.execute(DDL("DROP TRIGGER IF EXISTS {}".format(name)))
+    aggregates_metadata.drop_all(connection)
+
+
+def select_expected_totals():
+    """Aggregates computed from scratch by grouping the invoices table
+
+    :return: statement selecting custid, invoice_count and amount_total
+    :rtype: sqlalchemy.sql.Select
+    """
+    return (
+        select(
+            Invoices.custid,
+            func.count().label("invoice_count"),
+            func.coalesce(func.sum(Invoices.amount), 0).label("amount_total"),
+        )
+        .where(Invoices.custid.is_not(None))
+        .group_by(Invoices.custid)
+    )
+
+
+def rebuild(connection):
+    """Recompute every aggregate from the invoices table
+
+    :param connection: connection to the sales database
+    :type connection: sqlalchemy.engine.Connection
+    :return: number of customers with invoices
+    :rtype: int
+    """
+    connection.execute(customer_invoice_totals.delete())
+    result = connection.execute(
+        customer_invoice_totals.insert().from_select(
+            ["custid", "invoice_count", "amount_total"], select_expected_totals()
+        )
+    )
+
+    return result.rowcount
+
+
+def check_consistency(connection):
+    """Customers whose maintained aggregates differ from those computed from the invoices table
+
+    :param connection: connection to the sales database
+    :type connection: sqlalchemy.engine.Connection
+    :return: mismatches - (custid, expected (count, total) or None, actual (count, total) or None)
+    :rtype: list
+    """
+    expected = {
+        row.custid: (row.invoice_count, row.amount_total)
+        for row in connection.execute(select_expected_totals())
+    }
+    actual = {
+        row.custid: (row.invoice_count, row.amount_total)
+        for row in connection.execute(select(customer_invoice_totals))
+    }
+
+    return [
+        (custid, expected.get(custid), actual.get(custid))
+        for custid in sorted(expected.keys() | actual.keys())
+        if expected.get(custid) != actual.get(custid)
+    ]
+
+
+def select_invoice_counts():
+    """Every customer with their invoice count and total amount, read from the maintained aggregates
+
+    Equivalent to the practice script's outer join against the grouped invoices subquery, without scanning invoices.
+
+    :return: statement selecting Customers, invoice_count and amount_total - None for customers without invoices
+    :rtype: sqlalchemy.sql.Select
+    """
+    return (
+        select(
+            Customers,
+            customer_invoice_totals.c.invoice_count,
+            customer_invoice_totals.c.amount_total,
+        )
+        .outerjoin(
+            customer_invoice_totals,
+            Customers.id == customer_invoice_totals.c.custid,
+        )
+        .order_by(Customers.id)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Maintain per-customer invoice aggregates"
+    )
+    parser.add_argument("path", help="sales database file")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--install", action="store_true")
+    action.add_argument("--uninstall", action="store_true")
+    action.add_argument("--rebuild", action="store_true")
+    action.add_argument("--check", action="store_true")
+    args = parser.parse_args(argv)
+
+    engine = create_engine("sqlite:///{}".format(args.path))
+    with engine.begin() as connection:
+        if args.install:
+            install(connection)
+        elif args.uninstall:
+            uninstall(connection)
+        elif args.rebuild:
+            print("{} customers rebuilt".format(rebuild(connection)))
+        else:
+            mismatches = check_consistency(connection)
+            for custid, expected, actual in mismatches:
+                print(
+                    "customer {}: expected {}, found {}".format(
+                        custid, expected, actual
+                    )
+                )
+            print("{} inconsistent customers".format(len(mismatches)))
+
+            return 1 if mismatches else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""EXPLAIN QUERY PLAN checks for the representative queries of the college and sales databases
+
+Each registered query lists the tables it is expected to scan in full - the outer side of a join over every row. Any
+other full table scan, automatic index (SQLite building a throwaway index because a real one is missing) or temp
+B-tree for a GROUP BY, ORDER BY or DISTINCT is reported as a regression:
+
+    with engine.connect() as connection:
+        assert_query_plans(connection)
+
+Without a connection the checks run against an empty in-memory database created from the declared schema, which is
+enough for SQLite to pick the indexes. Run from this directory to print every plan, optionally against database files
+that already hold data and statistics:
+
+    python query_plans.py
+    python query_plans.py --database college.db --database sales.db
+    python query_plans.py --database sales.db --create-indexes   # add the declared indexes missing from the file
+"""
+
+import argparse
+import re
+import sys
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.sql.util import find_tables
+
+from schema import Base, Customers, Invoices, addresses, college_metadata, students
+
+# SQLite before 3.36 writes 'SCAN TABLE invoices' and 'SEARCH TABLE invoices'
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+_AUTOMATIC_INDEX = re.compile(r"^SEARCH (?:TABLE )?(\w+)(?: AS \w+)? USING AUTOMATIC")
+_TEMP_BTREE = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+
+
+def select_student_addresses():
+    """Students outer joined to their addresses, as in the practice script"""
+    return (
+        select(students.c.name, students.c.lastname, addresses)
+        .select_from(students)
+        .join(addresses, students.c.id == addresses.c.st_id, isouter=True)
+    )
+
+
+def select_addresses_of_student():
+    """Addresses of one student"""
+    return (
+        select(students.c.name, addresses.c.postal_add)
+        .join(addresses, students.c.id == addresses.c.st_id)
+        .where(students.c.id == 1)
+    )
+
+
+def select_customer_invoices():
+    """Customer names outer joined to their invoice amounts, as in the practice script"""
+    return (
+        select(Customers.name, Invoices.amount)
+        .select_from(Customers)
+        .outerjoin(Invoices, Customers.id == Invoices.custid)
+    )
+
+
+def select_customers_by_name_prefix():
+    """Customers whose name starts with a prefix, as in the practice script's like('Ra%') filter"""
+    return select(Customers).where(Customers.name.like("Ra%"))
+
+
+def select_invoices_of_customer():
+    """Invoices of one customer joined to the customer"""
+    return (
+        select(Customers.name, Invoices.invno, Invoices.amount)
+        .join(Invoices, Customers.id == Invoices.custid)
+        .where(Customers.id == 1)
+    )
+
+
+def select_lazy_invoices():
+    """The SELECT issued by lazy loading Customers.invoices"""
+    return select(Invoices).where(Invoices.custid == 1).order_by(Invoices.id)
+
+
+def select_selectin_invoices():
+    """The SELECT issued by selectin loading Customers.invoices"""
+    return select(Invoices).where(Invoices.custid.in_([1, 2, 3]))
+
+
+def select_invoice_counts():
+    """Every customer with their number of invoices, using the practice script's grouped subquery"""
+    sub = (
+        select(Invoices.custid, func.count("*").label("invoice_count"))
+        .group_by(Invoices.custid)
+        .subquery()
+        .alias("i")
+    )
+
+    return (
+        select(Customers, sub.c.invoice_count)
+        .outerjoin(sub, Customers.id == sub.c.custid)
+        .order_by(Customers.id)
+    )
+
+
+# name: (statement factory, tables allowed a full scan)
+REPRESENTATIVE_QUERIES = {
+    "student_addresses": (select_student_addresses, {"students"}),
+    "addresses_of_student": (select_addresses_of_student, set()),
+    "customer_invoices": (select_customer_invoices, {"customers"}),
+    "customers_by_name_prefix": (select_customers_by_name_prefix, set()),
+    "invoices_of_customer": (select_invoices_of_customer, set()),
+    "lazy_invoices": (select_lazy_invoices, set()),
+    "selectin_invoices": (select_selectin_invoices, set()),
+    # counting every customer's invoices reads all of them - the index only spares the GROUP BY its temp B-tree
+    "invoice_counts": (select_invoice_counts, {"customers", "invoices"}),
+}
+
+
+class QueryPlanError(AssertionError):
+    """A representative query's plan regressed to a full scan, automatic index or temp B-tree"""
+
+
+def create_indexes(connection):
+    """Create the indexes declared on the schema that are missing from an existing database
+
+    Only tables that exist in the database are considered, so this works on a college or sales database alike.
+
+    :param connection: connection to the database
+    :type connection: sqlalchemy.engine.Connection
+    :return: names of the indexes created
+    :rtype: list
+    """
+    existing_tables = set(connection.dialect.get_table_names(connection))
+    created = []
+    for metadata in (college_metadata, Base.metadata):
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_indexes = {
+                index["name"]
+                for index in connection.dialect.get_indexes(connection, table.name)
+            }
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    created.append(index.name)
+
+    return created
+
+
+def explain(connection, statement):
+    """Detail lines of SQLite's EXPLAIN QUERY PLAN for a statement, with parameters bound
+
+    :param connection: connection to a SQLite database
+    :type connection: sqlalchemy.engine.Connection
+    :param statement: select statement
+    :type statement: sqlalchemy.sql.Select
+    :return: plan - one detail string per step, e.g. 'SEARCH invoices USING INDEX ix_invoices_custid (custid=?)'
+    :rtype: list
+    """
+    # render_postcompile expands IN lists into one placeholder per value
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    result = connection.exec_driver_sql(
+        "EXPLAIN QUERY PLAN {}".format(compiled), parameters
+    )
+
+    return [row[3] for row in result]
+
+
+def analyze_plan(plan):
+    """Full table scans, automatic indexes and temp B-trees in a query plan
+
+    A scan in the order of an index, or of a covering index, still visits every row and is counted as a full scan.
+
+    :param plan: detail lines from explain
+    :type plan: list
+    :return: findings - dict of full_scans and automatic_indexes (lists of table or subquery names) and temp_btrees
+        (list of what each B-tree is for, e.g. 'GROUP BY')
+    :rtype: dict
+    """
+    findings = {"full_scans": [], "automatic_indexes": [], "temp_btrees": []}
+    for detail in plan:
+        detail = detail.strip()
+        scan = _SCAN.match(detail)
+        if scan:
+            findings["full_scans"].append(scan.group(1))
+            continue
+        automatic_index = _AUTOMATIC_INDEX.match(detail)
+        if automatic_index:
+            findings["automatic_indexes"].append(automatic_index.group(1))
+            continue
+        temp_btree = _TEMP_BTREE.match(detail)
+        if temp_btree:
+            findings["temp_btrees"].append(temp_btree.group(1))
+
+    return findings
+
+
+def _create_schema_connection():
+    engine = create_engine("sqlite://")
+    connection = engine.connect()
+    college_metadata.create_all(connection)
+    Base.metadata.create_all(connection)
+
+    return connection
+
+
+def check_query_plans(connection=None, queries=None):
+    """Plan of each representative query and the regressions found in it
+
+    Queries against tables missing from the database are skipped, so a college or sales database can be checked alone.
+    Scans and automatic indexes are only regressions on tables - SQLite also scans materialized subqueries and builds
+    automatic indexes to join them.
+
+    :param connection: connection to a SQLite database, or None for an empty in-memory one with the declared schema
+    :type connection: sqlalchemy.engine.Connection
+    :param queries: (statement factory, tables allowed a full scan) keyed by name, defaults to REPRESENTATIVE_QUERIES
+    :type queries: dict
+    :return: reports keyed by query name - dicts with plan, the findings of analyze_plan and problems (list of str)
+    :rtype: dict
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = _create_schema_connection()
+
+    try:
+        tables = set(connection.dialect.get_table_names(connection))
+        reports = {}
+        for name, (statement_factory, allowed_scans) in (
+            queries or REPRESENTATIVE_QUERIES
+        ).items():
+            statement = statement_factory()
+            if any(table.name not in tables for table in find_tables(statement)):
+                continue
+
+            plan = explain(connection, statement)
+            findings = analyze_plan(plan)
+            problems = [
+                "full scan of {}".format(table)
+                for table in findings["full_scans"]
+                if table in tables and table not in allowed_scans
+            ]
+            problems += [
+                "automatic index on {}".format(table)
+                for table in findings["automatic_indexes"]
+                if table in tables
+            ]
+            problems += [
+                "temp B-tree for {}".format(purpose)
+                for purpose in findings["temp_btrees"]
+            ]
+            reports[name] = dict(findings, plan=plan, problems=problems)
+    finally:
+        if own_connection:
+            connection.close()
+            connection.engine.dispose()
+
+    return reports
+
+
+def assert_query_plans(connection=None, queries=None):
+    """Raise QueryPlanError if any representative query's plan has a regression, for use in tests
+
+    :param connection: connection to a SQLite database, or None for an empty in-memory one with the declared schema
+    :type connection: sqlalchemy.engine.Connection
+    :param queries: (statement factory, tables allowed a full scan) keyed by name, defaults to REPRESENTATIVE_QUERIES
+    :type queries: dict
+    :return: None
+    """
+    reports = check_query_plans(connection, queries)
+    failures = [
+        "{}: {}\n    {}".format(
+            name, ", ".join(report["problems"]), "\n    ".join(report["plan"])
+        )
+        for name, report in reports.items()
+        if report["problems"]
+    ]
+    if failures:
+        raise QueryPlanError(
+            "{} queries regressed:\n{}".format(len(failures), "\n".join(failures))
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the query plans of the representative queries"
+    )
+    parser.add_argument(
+        "--database",
+        action="append",
+        default=[],
+        help="database file to check, repeatable - defaults to an empty in-memory database",
+    )
+    parser.add_argument(
+        "--create-indexes",
+        action="store_true",
+        help="create the declared indexes missing from each database first",
+    )
+    args = parser.parse_args(argv)
+
+    targets = args.database or [None]
+    failed = False
+    for path in targets:
+        if path is None:
+            reports = check_query_plans()
+            print("declared schema (in memory)")
+        else:
+            engine = create_engine("sqlite:///{}".format(path))
+            with engine.begin() as connection:
+                if args.create_indexes:
+                    for index_name in create_indexes(connection):
+                        print("created index {}".format(index_name))
+                reports = check_query_plans(connection)
+            engine.dispose()
+            print(path)
+
+        for name, report in reports.items():
+            status = "; ".join(report["problems"]) or "ok"
+            print("  {:<26} {}".format(name, status))
+            for detail in report["plan"]:
+                print("      {}".format(detail))
+            failed = failed or bool(report["problems"])
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""Per-statement counts, latency histograms and rows returned, collected from engine events instead of echo logging
+
+Statements are grouped after normalization - literals replaced by ?, IN lists collapsed and whitespace squeezed - so
+the same query with different values is one entry. Executions slower than a threshold are kept with their parameters.
+
+    stats = QueryStats(slow_threshold_ms=50)
+    stats.attach(write_engine, read_engine)
+    ...
+    stats.export_json("query_stats.json")
+
+Timing uses before_cursor_execute/after_cursor_execute, so it covers the driver executing the statement but not
+fetching the rows. Rows are counted as they are fetched for statements that return rows, and taken from the cursor's
+rowcount for the others. Run from this directory to measure the overhead on primary key lookups:
+
+    python query_stats.py --lookups 100000
+"""
+
+import argparse
+import bisect
+import collections
+import functools
+import json
+import re
+import threading
+import time
+
+from sqlalchemy import event, select
+
+from bulk_load import bulk_insert
+from engines import create_sqlite_engine
+from schema import Base, Customers
+
+# upper bounds of the latency histogram buckets in milliseconds - the last bucket is unbounded
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_statement(statement):
+    """Statement with literals replaced by ?, lists of placeholders collapsed to (?...) and whitespace squeezed
+
+    :param statement: SQL text as sent to the driver
+    :type statement: str
+    :return: normalized SQL text
+    :rtype: str
+    """
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(?...)", statement)
+
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class _StatementStats:
+    """Running totals of one normalized statement"""
+
+    __slots__ = ("count", "total_seconds", "max_seconds", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_seconds * 1000,
+            "mean_ms": self.total_seconds * 1000 / self.count if self.count else 0.0,
+            "max_ms": self.max_seconds * 1000,
+            "rows": self.rows,
+            "histogram": {
+                "le_{}".format(bound): count
+                for bound, count in zip(LATENCY_BUCKETS_MS + ("inf",), self.buckets)
+            },
+        }
+
+
+class _RowCountingCursor:
+    """DBAPI cursor proxy adding the number of rows fetched to a statement's totals"""
+
+    def __init__(self, cursor, stats, lock):
+        self._cursor = cursor
+        self._stats = stats
+        self._lock = lock
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _count(self, rows):
+        with self._lock:
+            self._stats.rows += rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count(1)
+
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._count(len(rows))
+
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+
+        return rows
+
+
+class QueryStats:
+    """Statement statistics collected from the engines it is attached to
+
+    :param slow_threshold_ms: executions taking longer are recorded as slow queries
+    :type slow_threshold_ms: float
+    :param max_slow_queries: number of most recent slow queries kept
+    :type max_slow_queries: int
+    :param count_rows: count the rows fetched from statements that return rows - adds a proxy call per fetch
+    :type count_rows: bool
+    """
+
+    def __init__(self, slow_threshold_ms=100, max_slow_queries=100, count_rows=True):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.count_rows = count_rows
+        self.slow_queries = collections.deque(maxlen=max_slow_queries)
+        self._slow_threshold_seconds = slow_threshold_ms / 1000
+        self._statements = collections.defaultdict(_StatementStats)
+        self._lock = threading.Lock()
+        self._engines = []
+
+    def attach(self, *engines):
+        """Start collecting statistics from engines - async engines are attached through their sync engine
+
+        :param engines: engines to watch
+        :type engines: sqlalchemy.engine.Engine
+        :return: self
+        :rtype: QueryStats
+        """
+        for engine in engines:
+            engine = getattr(engine, "sync_engine", engine)
+            event.listen(engine, "before_cursor_execute", self._before_execute)
+            event.listen(engine, "after_cursor_execute", self._after_execute)
+            self._engines.append(engine)
+
+        return self
+
+    def detach(self):
+        """Stop collecting statistics from every attached engine, keeping those collected
+
+        :return: None
+        """
+        for engine in self._engines:
+            event.remove(engine, "before_cursor_execute", self._before_execute)
+            event.remove(engine, "after_cursor_execute", self._after_execute)
+        self._engines.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.detach()
+
+        return False
+
+    def _before_execute(
+        self, connection, cursor, statement, parameters, context, executemany
+    ):
+        context._query_stats_start = time.perf_counter()
+
+    def _after_execute(
+        self, connection, cursor, statement, parameters, context, executemany
+    ):
+        seconds = time.perf_counter() - context._query_stats_start
+        normalized = normalize_statement(statement)
+        returns_rows = cursor.description is not None
+
+        with self._lock:
+            stats = self._statements[normalized]
+            stats.count += 1
+            stats.total_seconds += seconds
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+            if not returns_rows and cursor.rowcount > 0:
+                stats.rows += cursor.rowcount
+
+            if seconds > self._slow_threshold_seconds:
+                self.slow_queries.append(
+                    {
+                        "statement": statement,
+                        "parameters": repr(parameters)[:1000],
+                        "ms": seconds * 1000,
+                        "time": time.time(),
+                    }
+                )
+
+        if returns_rows and self.count_rows:
+            # the result is set up after this event returns and fetches through the execution context's cursor
+            context.cursor = _RowCountingCursor(cursor, stats, self._lock)
+
+    def reset(self):
+        """Discard all statistics and slow queries collected so far
+
+        :return: None
+        """
+        with self._lock:
+            self._statements.clear()
+            self.slow_queries.clear()
+
+    def snapshot(self):
+        """Statistics collected so far, ordered by total time
+
+        :return: snapshot - dict with slow_threshold_ms, latency_buckets_ms, statements (dicts with statement, count,
+            total_ms, mean_ms, max_ms, rows and histogram) and slow_queries (dicts with statement, parameters, ms, time)
+        :rtype: dict
+        """
+        with self._lock:
+            statements = [
+                dict(statement=statement, **stats.to_dict())
+                for statement, stats in self._statements.items()
+            ]
+            slow_queries = list(self.slow_queries)
+
+        statements.sort(key=lambda entry: entry["total_ms"], reverse=True)
+
+        return {
+            "time": time.time(),
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+            "statements": statements,
+            "slow_queries": slow_queries,
+        }
+
+    def export_json(self, path):
+        """Write a snapshot to a JSON file
+
+        :param path: output file path
+        :type path: str
+        :return: None
+        """
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+def benchmark(lookups_count, customers_count=10_000, repeats=3):
+    """Time primary key lookups without instrumentation and with it, with and without counting rows
+
+    The methods take turns for each repeat and the fastest run of each is kept, so drift in machine load affects them
+    alike.
+
+    :param lookups_count: number of lookups per run
+    :type lookups_count: int
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param repeats: number of runs of each method
+    :type repeats: int
+    :return: results - dicts with method and microseconds per lookup
+    :rtype: list
+    """
+    engine = create_sqlite_engine()
+    Base.metadata.create_all(engine)
+    bulk_insert(
+        engine,
+        Customers,
+        (
+            {"id": i + 1, "name": "Customer {}".format(i)}
+            for i in range(customers_count)
+        ),
+    )
+    customer_ids = [i * 7919 % customers_count + 1 for i in range(lookups_count)]
+
+    def run_lookups():
+        start = time.perf_counter()
+        with engine.connect() as connection:
+            for customer_id in customer_ids:
+                connection.execute(
+                    select(Customers.name).where(Customers.id == customer_id)
+                ).all()
+        return (time.perf_counter() - start) / lookups_count * 1e6
+
+    methods = {
+        "plain": None,
+        "query_stats": {},
+        "query_stats_no_rows": {"count_rows": False},
+    }
+    timings = {method: [] for method in methods}
+    for _ in range(repeats):
+        for method, options in methods.items():
+            if options is None:
+                timings[method].append(run_lookups())
+                continue
+
+            with QueryStats(**options).attach(engine) as stats:
+                timings[method].append(run_lookups())
+            assert stats.snapshot()["statements"][0]["count"] == lookups_count
+
+    engine.dispose()
+
+    return [
+        {"method": method, "microseconds": min(timings[method])} for method in methods
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the overhead of statement instrumentation"
+    )
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.lookups, args.customers, args.repeats):
+        print("{method:>20} {microseconds:>8.1f} us/lookup".format(**result))
+
+
+if __name__ == "__main__":
+    main()
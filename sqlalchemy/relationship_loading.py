@@ -0,0 +1,254 @@
+"""Loading strategies for Customers.invoices and a query counter that catches N+1 query patterns
+
+Customers.invoices and Invoices.customer load lazily: touching .invoices on each of N customers issues N more SELECTs.
+Pick a strategy per query instead:
+
+- selectin: one extra SELECT ... WHERE custid IN (...) per 500 customers - the best default for collections
+- joined: one LEFT OUTER JOIN, repeating each customer's columns once per invoice - best for many-to-one or few rows
+- raise: lazy loading raises, to make sure a code path never touches the relationship unloaded
+- lazy: the mapping's default, one SELECT per customer
+
+    customers = session.scalars(select_customers_with_invoices("selectin")).all()
+
+QueryCounter counts the statements an engine executes and flags repeated SELECTs against the sales tables:
+
+    with QueryCounter(engine, max_repeats=10) as counter:
+        ...
+    counter.assert_max_queries(3)
+
+Run from this directory to compare the strategies:
+
+    python relationship_loading.py --customers 100000 --invoices-per-customer 5
+"""
+
+import argparse
+import re
+import time
+from collections import Counter
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, joinedload, lazyload, raiseload, selectinload
+
+from bulk_load import bulk_insert
+from engines import create_sqlite_engine
+from schema import Base, Customers, Invoices
+
+LOADER_OPTIONS = {
+    "lazy": lazyload,
+    "selectin": selectinload,
+    "joined": joinedload,
+    "raise": raiseload,
+}
+
+
+class NPlusOneError(AssertionError):
+    """The same SELECT against a watched table ran more often than allowed"""
+
+
+class QueryCounter:
+    """Context manager recording every statement executed on an engine, flagging N+1 patterns on exit
+
+    :param engine: engine to watch
+    :type engine: sqlalchemy.engine.Engine
+    :param max_repeats: the same SELECT against a watched table may run at most this many times
+    :type max_repeats: int
+    :param tables: tables watched for N+1 patterns
+    :type tables: tuple
+    :param raise_on_n_plus_one: raise NPlusOneError on exit if an N+1 pattern was seen
+    :type raise_on_n_plus_one: bool
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_repeats=10,
+        tables=(Customers.__table__, Invoices.__table__),
+        raise_on_n_plus_one=True,
+    ):
+        self.engine = engine
+        self.max_repeats = max_repeats
+        self.raise_on_n_plus_one = raise_on_n_plus_one
+        self.statements = []
+        self._table_patterns = [
+            re.compile(r"\bFROM\s+{}\b".format(re.escape(table.name)), re.IGNORECASE)
+            for table in tables
+        ]
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+        if exc_type is None and self.raise_on_n_plus_one:
+            self.assert_no_n_plus_one()
+
+        return False
+
+    def _on_execute(
+        self, connection, cursor, statement, parameters, context, executemany
+    ):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        """Number of statements executed so far"""
+        return len(self.statements)
+
+    def get_n_plus_one_statements(self):
+        """SELECTs against watched tables executed more than max_repeats times
+
+        :return: repeats - number of executions keyed by SQL text
+        :rtype: dict
+        """
+        repeats = Counter(
+            statement
+            for statement in self.statements
+            if statement.lstrip().upper().startswith("SELECT")
+            and any(pattern.search(statement) for pattern in self._table_patterns)
+        )
+
+        return {
+            statement: count
+            for statement, count in repeats.items()
+            if count > self.max_repeats
+        }
+
+    def assert_no_n_plus_one(self):
+        """Raise NPlusOneError if an N+1 pattern was seen
+
+        :return: None
+        """
+        repeats = self.get_n_plus_one_statements()
+        if repeats:
+            statement, count = max(repeats.items(), key=lambda item: item[1])
+            raise NPlusOneError(
+                "N+1 query pattern: statement ran {} times (max {}):\n{}".format(
+                    count, self.max_repeats, statement
+                )
+            )
+
+    def assert_max_queries(self, max_queries):
+        """Raise AssertionError if more than max_queries statements were executed
+
+        :param max_queries: maximum number of statements
+        :type max_queries: int
+        :return: None
+        """
+        if self.count > max_queries:
+            raise AssertionError(
+                "{} statements executed, expected at most {}".format(
+                    self.count, max_queries
+                )
+            )
+
+
+def select_customers_with_invoices(strategy="selectin"):
+    """Select all customers, loading their invoices with the given strategy
+
+    :param strategy: one of LOADER_OPTIONS
+    :type strategy: str
+    :return: statement
+    :rtype: sqlalchemy.sql.Select
+    """
+    if strategy not in LOADER_OPTIONS:
+        raise ValueError(
+            "strategy should be one of {}, got '{}'".format(
+                list(LOADER_OPTIONS), strategy
+            )
+        )
+
+    statement = (
+        select(Customers)
+        .options(LOADER_OPTIONS[strategy](Customers.invoices))
+        .order_by(Customers.id)
+    )
+
+    return statement
+
+
+def list_customers_with_invoices(session, strategy="selectin"):
+    """Customers with their invoices loaded, as (customer, invoice count, total amount)
+
+    :param session: session on the sales database
+    :type session: sqlalchemy.orm.Session
+    :param strategy: one of LOADER_OPTIONS other than 'raise'
+    :type strategy: str
+    :return: rows
+    :rtype: list
+    """
+    # joined loading returns each customer once per invoice - unique() collapses them
+    customers = session.scalars(select_customers_with_invoices(strategy)).unique()
+
+    return [
+        (customer, len(customer.invoices), sum(i.amount for i in customer.invoices))
+        for customer in customers
+    ]
+
+
+def benchmark(
+    customers_count, invoices_per_customer, strategies=("lazy", "selectin", "joined")
+):
+    """Time listing all customers with their invoices under each loading strategy
+
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param invoices_per_customer: number of invoices of each customer
+    :type invoices_per_customer: int
+    :param strategies: strategies to compare
+    :type strategies: tuple
+    :return: results - dicts with strategy, queries and seconds
+    :rtype: list
+    """
+    engine = create_sqlite_engine()
+    Base.metadata.create_all(engine)
+    bulk_insert(
+        engine,
+        Customers,
+        (
+            {"id": i + 1, "name": "Customer {}".format(i)}
+            for i in range(customers_count)
+        ),
+    )
+    bulk_insert(
+        engine,
+        Invoices,
+        (
+            {"custid": i // invoices_per_customer + 1, "invno": i, "amount": i % 1000}
+            for i in range(customers_count * invoices_per_customer)
+        ),
+    )
+
+    results = []
+    for strategy in strategies:
+        with Session(engine) as session:
+            with QueryCounter(engine, raise_on_n_plus_one=False) as counter:
+                start = time.perf_counter()
+                list_customers_with_invoices(session, strategy)
+                seconds = time.perf_counter() - start
+
+        results.append(
+            {"strategy": strategy, "queries": counter.count, "seconds": seconds}
+        )
+
+    engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare loading strategies for Customers.invoices"
+    )
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--invoices-per-customer", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.customers, args.invoices_per_customer):
+        print("{strategy:>10} {queries:>8} queries {seconds:>8.2f}s".format(**result))
+
+
+if __name__ == "__main__":
+    main()
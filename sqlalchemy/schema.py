@@ -0,0 +1,59 @@
+"""Tables and mappings of the college and sales databases from sqlalchemy-practice.py, importable by other modules
+
+Foreign keys are indexed: SQLite does not index them itself, and without the index every join from the parent table and
+every lookup of a parent's children scans the child table. query_plans.py checks the plans that depend on them.
+"""
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, MetaData, String, Table
+from sqlalchemy.orm import declarative_base, relationship
+
+# college database - SQLAlchemy Core tables
+college_metadata = MetaData()
+
+students = Table(
+    "students",
+    college_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("lastname", String),
+)
+
+addresses = Table(
+    "addresses",
+    college_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("st_id", Integer, ForeignKey("students.id"), index=True),
+    Column("postal_add", String),
+    Column("email_add", String),
+)
+
+# sales database - ORM mapped classes
+Base = declarative_base()
+
+
+class Customers(Base):
+    __tablename__ = "customers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    address = Column(String)
+    email = Column(String)
+
+    invoices = relationship(
+        "Invoices", order_by="Invoices.id", back_populates="customer"
+    )
+
+
+# SQLite's LIKE ignores case, so a prefix LIKE can only search an index that compares names the same way
+Index("ix_customers_name_nocase", Customers.name.collate("NOCASE"))
+
+
+class Invoices(Base):
+    __tablename__ = "invoices"
+
+    id = Column(Integer, primary_key=True)
+    custid = Column(Integer, ForeignKey("customers.id"), index=True)
+    invno = Column(Integer)
+    amount = Column(Integer)
+
+    customer = relationship("Customers", back_populates="invoices")
@@ -0,0 +1,422 @@
+"""Customers and their Invoices partitioned by a hash of the customer id across several SQLite files
+
+Each customer lives in exactly one shard together with all of their invoices, so lookups and joins for one customer
+touch one file, and every shard has its own write lock, WAL and file to vacuum or back up. ShardRouter routes:
+
+- primary key lookups and a customer's invoices to the customer's shard, through an ORM ShardedSession
+- bulk inserts, partitioned by customer id and written to all shards in parallel
+- scans and aggregates such as the invoice-count subquery to every shard in parallel, merging the results
+
+Shards cannot share an autoincrement sequence, so Customers and Invoices rows need ids assigned by the application.
+
+    with ShardRouter(get_shard_paths("sales", 4)) as router:
+        router.create_all()
+        router.insert(Customers, customer_rows)
+        with router.session() as session:
+            customer = session.get(Customers, 42)
+        counts = router.get_invoice_counts()
+
+Run from this directory to compare load and aggregate times with the number of shards:
+
+    python sharding.py --customers 1000000 --shards 1 2 4 8
+"""
+
+import argparse
+import heapq
+import os
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+
+from bulk_load import DEFAULT_BATCH_SIZE, iter_batches, sqlite_load_pragmas
+from engines import create_sqlite_engine
+from schema import Base, Customers, Invoices
+
+DEFAULT_SHARDS_COUNT = 4
+
+
+def get_shard_index(customer_id, shards_count):
+    """Shard of a customer - CRC32 of the id, so the mapping is the same in every process and Python version
+
+    :param customer_id: customer primary key
+    :type customer_id: int
+    :param shards_count: number of shards
+    :type shards_count: int
+    :return: shard index, from 0 to shards_count - 1
+    :rtype: int
+    """
+    return zlib.crc32(struct.pack("<q", customer_id)) % shards_count
+
+
+def get_shard_paths(directory, shards_count=DEFAULT_SHARDS_COUNT):
+    """Paths of the shard files in a directory
+
+    :param directory: directory holding the shards
+    :type directory: str
+    :param shards_count: number of shards
+    :type shards_count: int
+    :return: paths - sales-0.db, sales-1.db, ...
+    :rtype: list
+    """
+    return [
+        os.path.join(directory, "sales-{}.db".format(index))
+        for index in range(shards_count)
+    ]
+
+
+class ShardRouter:
+    """Engines of the shards, with routing of ORM sessions, bulk inserts and parallel fan-out of Core statements
+
+    Changing the number of shards moves most customers to another shard, so a layout is fixed once loaded.
+
+    :param paths: shard database files, in shard order
+    :type paths: list
+    :param pragmas: pragma values keyed by name, overriding engines.DEFAULT_PRAGMAS
+    :type pragmas: dict
+    :param threads: threads used to run statements on the shards in parallel, defaults to one per shard
+    :type threads: int
+    """
+
+    def __init__(self, paths, pragmas=None, threads=None):
+        self.engines = [create_sqlite_engine(path, pragmas=pragmas) for path in paths]
+        self._executor = ThreadPoolExecutor(threads or len(self.engines))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+        return False
+
+    def dispose(self):
+        """Stop the threads and close every shard's connections
+
+        :return: None
+        """
+        self._executor.shutdown()
+        for engine in self.engines:
+            engine.dispose()
+
+    @property
+    def shards_count(self):
+        """Number of shards"""
+        return len(self.engines)
+
+    def get_shard_index(self, customer_id):
+        """Shard of a customer, see get_shard_index
+
+        :param customer_id: customer primary key
+        :type customer_id: int
+        :return: shard index
+        :rtype: int
+        """
+        return get_shard_index(customer_id, self.shards_count)
+
+    def get_engine(self, customer_id):
+        """Engine of the shard holding a customer and their invoices
+
+        :param customer_id: customer primary key
+        :type customer_id: int
+        :return: engine
+        :rtype: sqlalchemy.engine.Engine
+        """
+        return self.engines[self.get_shard_index(customer_id)]
+
+    def create_all(self):
+        """Create the sales tables in every shard
+
+        :return: None
+        """
+        self._map(Base.metadata.create_all, self.engines)
+
+    def _map(self, function, *iterables):
+        # list() waits for every shard and raises the first error
+        return list(self._executor.map(function, *iterables))
+
+    def session(self, **kwargs):
+        """ORM session routing each statement to the shards that can hold its rows
+
+        Customers are looked up by primary key in one shard, and a customer's invoices are lazy loaded from the
+        customer's shard. Other selects run on every shard one after the other and their results are concatenated -
+        use fan_out for scans and aggregates.
+
+        :param kwargs: further Session arguments
+        :return: session
+        :rtype: sqlalchemy.ext.horizontal_shard.ShardedSession
+        """
+        return ShardedSession(
+            shard_chooser=self._choose_shard,
+            identity_chooser=self._choose_identity_shards,
+            execute_chooser=self._choose_execute_shards,
+            shards={str(index): engine for index, engine in enumerate(self.engines)},
+            **kwargs,
+        )
+
+    def _choose_shard(self, mapper, instance, clause=None):
+        if isinstance(instance, Customers):
+            customer_id = instance.id
+        elif isinstance(instance, Invoices):
+            customer_id = (
+                instance.custid
+                if instance.custid is not None or instance.customer is None
+                else instance.customer.id
+            )
+        else:
+            customer_id = None
+        if customer_id is None:
+            raise ValueError(
+                "{!r} needs a customer id to be routed to a shard".format(instance)
+            )
+
+        return str(self.get_shard_index(customer_id))
+
+    def _choose_identity_shards(
+        self, mapper, primary_key, *, lazy_loaded_from, **kwargs
+    ):
+        if lazy_loaded_from is not None:
+            return [lazy_loaded_from.identity_token]
+        if mapper.class_ is Customers:
+            return [str(self.get_shard_index(primary_key[0]))]
+
+        return [str(index) for index in range(self.shards_count)]
+
+    def _choose_execute_shards(self, orm_context):
+        if orm_context.lazy_loaded_from is not None:
+            return [orm_context.lazy_loaded_from.identity_token]
+
+        return [str(index) for index in range(self.shards_count)]
+
+    def insert(self, table, rows, batch_size=DEFAULT_BATCH_SIZE, fast_pragmas=False):
+        """Insert rows into the shards of their customers, writing all shards in parallel
+
+        Rows are consumed lazily, batch_size rows per shard at a time, and each shard commits one transaction per
+        batch - like bulk_insert, a failure leaves the earlier batches inserted.
+
+        :param table: Customers or Invoices, or their tables
+        :param rows: rows as dicts with id (customers) or custid (invoices) set
+        :type rows: Iterable[dict]
+        :param batch_size: number of rows per executemany and transaction
+        :type batch_size: int
+        :param fast_pragmas: relax SQLite durability while loading, see bulk_load.sqlite_load_pragmas
+        :type fast_pragmas: bool
+        :return: number of rows inserted
+        :rtype: int
+        """
+        table = getattr(table, "__table__", table)
+        key = "id" if table is Customers.__table__ else "custid"
+        insert = table.insert()
+
+        def insert_partition(connection, partition):
+            if partition:
+                with connection.begin():
+                    connection.execute(insert, partition)
+
+            return len(partition)
+
+        rows_count = 0
+        with ExitStack() as stack:
+            connections = [
+                stack.enter_context(engine.connect()) for engine in self.engines
+            ]
+            if fast_pragmas:
+                for connection in connections:
+                    stack.enter_context(sqlite_load_pragmas(connection))
+
+            # rows are read batch_size per shard at a time, so memory stays bounded however many are loaded
+            for chunk in iter_batches(rows, batch_size=batch_size * self.shards_count):
+                partitions = [[] for _ in connections]
+                for row in chunk:
+                    partitions[self.get_shard_index(row[key])].append(row)
+                rows_count += sum(self._map(insert_partition, connections, partitions))
+
+        return rows_count
+
+    def fan_out(self, statement):
+        """Rows of a Core statement executed on every shard in parallel
+
+        SQLite releases the GIL while it executes, so statements that do their work in the database, like aggregates,
+        run concurrently on multi-core machines.
+
+        :param statement: select statement
+        :type statement: sqlalchemy.sql.Select
+        :return: rows of each shard, in shard order
+        :rtype: list[list[sqlalchemy.engine.Row]]
+        """
+
+        def execute(engine):
+            with engine.connect() as connection:
+                return connection.execute(statement).all()
+
+        return self._map(execute, self.engines)
+
+    def get_customer_with_invoices(self, customer_id):
+        """Customer by primary key with their invoices loaded, detached from the session
+
+        :param customer_id: primary key
+        :type customer_id: int
+        :return: customer, or None if there is none with that key
+        :rtype: Customers
+        """
+        with self.session() as session:
+            customer = session.get(Customers, customer_id)
+            if customer is not None:
+                customer.invoices
+
+        return customer
+
+    def get_invoice_counts(self):
+        """Every customer's id, name and number of invoices, using the practice script's grouped subquery on each shard
+
+        :return: rows of id, name and invoice_count (None for customers without invoices) in order of id
+        :rtype: list
+        """
+        sub = (
+            select(Invoices.custid, func.count("*").label("invoice_count"))
+            .group_by(Invoices.custid)
+            .subquery()
+            .alias("i")
+        )
+        statement = (
+            select(Customers.id, Customers.name, sub.c.invoice_count)
+            .outerjoin(sub, Customers.id == sub.c.custid)
+            .order_by(Customers.id)
+        )
+
+        # each shard's rows are sorted by id, so merging keeps the overall order without sorting again
+        return list(heapq.merge(*self.fan_out(statement), key=lambda row: row.id))
+
+    def get_invoice_totals(self):
+        """Number of customers with invoices, invoices and their total amount across all shards
+
+        :return: totals - dict with customers_count, invoices_count and amount_total
+        :rtype: dict
+        """
+        statement = select(
+            func.count(func.distinct(Invoices.custid)),
+            func.count(),
+            func.coalesce(func.sum(Invoices.amount), 0),
+        )
+        shard_totals = [rows[0] for rows in self.fan_out(statement)]
+
+        return {
+            "customers_count": sum(totals[0] for totals in shard_totals),
+            "invoices_count": sum(totals[1] for totals in shard_totals),
+            "amount_total": sum(totals[2] for totals in shard_totals),
+        }
+
+
+def generate_rows(customers_count, invoices_per_customer):
+    """Customer and invoice rows with ids assigned, for loading into shards
+
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param invoices_per_customer: number of invoices of each customer
+    :type invoices_per_customer: int
+    :return: customer_rows, invoice_rows
+    :rtype: (list, list)
+    """
+    customer_rows = [
+        {"id": i + 1, "name": "Customer {}".format(i)} for i in range(customers_count)
+    ]
+    invoice_rows = [
+        {
+            "id": i + 1,
+            "custid": i // invoices_per_customer + 1,
+            "invno": i,
+            "amount": i % 1000,
+        }
+        for i in range(customers_count * invoices_per_customer)
+    ]
+
+    return customer_rows, invoice_rows
+
+
+def benchmark(customers_count, shards_counts, invoices_per_customer=5, lookups=1000):
+    """Time loading, aggregating and looking up customers with each number of shards
+
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param shards_counts: numbers of shards to compare
+    :type shards_counts: list
+    :param invoices_per_customer: number of invoices of each customer
+    :type invoices_per_customer: int
+    :param lookups: number of customer-with-invoices lookups timed
+    :type lookups: int
+    :return: results - dicts with shards, load_seconds, totals_seconds, counts_seconds and lookup_ms
+    :rtype: list
+    """
+    customer_rows, invoice_rows = generate_rows(customers_count, invoices_per_customer)
+    customer_ids = [i * 7919 % customers_count + 1 for i in range(lookups)]
+
+    results = []
+    for shards_count in shards_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            with ShardRouter(get_shard_paths(directory, shards_count)) as router:
+                router.create_all()
+
+                start = time.perf_counter()
+                router.insert(Customers, customer_rows, fast_pragmas=True)
+                router.insert(Invoices, invoice_rows, fast_pragmas=True)
+                load_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                totals = router.get_invoice_totals()
+                totals_seconds = time.perf_counter() - start
+                assert totals["invoices_count"] == len(invoice_rows)
+
+                start = time.perf_counter()
+                counts = router.get_invoice_counts()
+                counts_seconds = time.perf_counter() - start
+                assert len(counts) == customers_count
+
+                start = time.perf_counter()
+                for customer_id in customer_ids:
+                    customer = router.get_customer_with_invoices(customer_id)
+                    assert len(customer.invoices) == invoices_per_customer
+                lookup_ms = (time.perf_counter() - start) / lookups * 1000
+
+        results.append(
+            {
+                "shards": shards_count,
+                "load_seconds": load_seconds,
+                "totals_seconds": totals_seconds,
+                "counts_seconds": counts_seconds,
+                "lookup_ms": lookup_ms,
+            }
+        )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare load, aggregate and lookup times across numbers of shards"
+    )
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--invoices-per-customer", type=int, default=5)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args(argv)
+
+    print(
+        "{:>6} {:>10} {:>10} {:>10} {:>10}".format(
+            "shards", "load", "totals", "counts", "lookup"
+        )
+    )
+    for result in benchmark(
+        args.customers, args.shards, invoices_per_customer=args.invoices_per_customer
+    ):
+        print(
+            "{shards:>6} {load_seconds:>9.2f}s {totals_seconds:>9.3f}s "
+            "{counts_seconds:>9.3f}s {lookup_ms:>8.2f}ms".format(**result)
+        )
+
+
+if __name__ == "__main__":
+    main()
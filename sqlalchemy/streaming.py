@@ -0,0 +1,105 @@
+"""Iterate large query results in fixed-size batches instead of materializing them with all() or fetchall()
+
+Each batch is fetched from the cursor as it is consumed, so memory is bounded by the batch size rather than the number
+of rows. ORM scans can skip the identity map entirely with read_only=True, getting plain rows of column values.
+
+    for invoices in iter_orm_batches(session, select(Invoices), batch_size=10_000):
+        ...
+"""
+
+from sqlalchemy import select
+
+from schema import Invoices, addresses, students
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+def iter_core_batches(connection, statement, batch_size=DEFAULT_BATCH_SIZE):
+    """Rows of a Core statement in lists of at most batch_size rows
+
+    :param connection: connection to execute the statement on
+    :type connection: sqlalchemy.engine.Connection
+    :param statement: select statement
+    :type statement: sqlalchemy.sql.Select
+    :param batch_size: number of rows fetched per batch
+    :type batch_size: int
+    :return: generator of batches
+    :rtype: Iterator[list[sqlalchemy.engine.Row]]
+    """
+    result = connection.execution_options(
+        stream_results=True, yield_per=batch_size
+    ).execute(statement)
+
+    yield from result.partitions()
+
+
+def iter_orm_batches(
+    session, statement, batch_size=DEFAULT_BATCH_SIZE, read_only=False
+):
+    """Results of an ORM select in lists of at most batch_size
+
+    Loaded objects are only weakly referenced by the session, so batches that are no longer referenced are freed.
+    With read_only=True the statement runs on the session's connection without the ORM, returning rows of column
+    values that are never added to the identity map - faster, but the rows cannot be modified or lazy load.
+
+    :param session: session to execute the statement in
+    :type session: sqlalchemy.orm.Session
+    :param statement: select of a mapped class, e.g. select(Invoices)
+    :type statement: sqlalchemy.sql.Select
+    :param batch_size: number of rows fetched per batch
+    :type batch_size: int
+    :param read_only: skip the ORM and identity map and return rows
+    :type read_only: bool
+    :return: generator of batches - of mapped objects when a single entity is selected, rows otherwise
+    :rtype: Iterator[list]
+    """
+    if read_only:
+        yield from iter_core_batches(
+            session.connection(), statement, batch_size=batch_size
+        )
+        return
+
+    result = session.execute(statement.execution_options(yield_per=batch_size))
+    if len(statement.column_descriptions) == 1:
+        result = result.scalars()
+
+    yield from result.partitions()
+
+
+def iter_invoice_batches(session, batch_size=DEFAULT_BATCH_SIZE, read_only=False):
+    """All invoices in order of id, in lists of at most batch_size
+
+    :param session: session on the sales database
+    :type session: sqlalchemy.orm.Session
+    :param batch_size: number of invoices fetched per batch
+    :type batch_size: int
+    :param read_only: return rows instead of Invoices objects, see iter_orm_batches
+    :type read_only: bool
+    :return: generator of batches
+    :rtype: Iterator[list]
+    """
+    statement = select(Invoices).order_by(Invoices.id)
+
+    return iter_orm_batches(
+        session, statement, batch_size=batch_size, read_only=read_only
+    )
+
+
+def iter_student_address_batches(connection, batch_size=DEFAULT_BATCH_SIZE):
+    """Students outer joined to their addresses, in lists of at most batch_size rows
+
+    :param connection: connection to the college database
+    :type connection: sqlalchemy.engine.Connection
+    :param batch_size: number of rows fetched per batch
+    :type batch_size: int
+    :return: generator of batches
+    :rtype: Iterator[list[sqlalchemy.engine.Row]]
+    """
+    statement = (
+        select(students.c.name, students.c.lastname, addresses)
+        .select_from(students)
+        .join(addresses, students.c.id == addresses.c.st_id, isouter=True)
+        .order_by(students.c.id)
+    )
+
+    return iter_core_batches(connection, statement, batch_size=batch_size)
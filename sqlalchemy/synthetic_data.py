@@ -0,0 +1,487 @@
+"""Deterministic synthetic data for the college and sales databases, at load-test scale
+
+Generates students with 0-3 addresses and customers with invoices, with skew like real data: first names, last names
+and cities follow Zipf-like popularity (so filters such as name.like('Ra%') match a realistic share of rows), and the
+number of invoices per customer is Zipf distributed - most customers have one or two, a few have hundreds.
+
+Rows are generated in chunks of parents in a process pool and written through bulk_load.bulk_insert with relaxed
+SQLite durability, while the next chunks are being generated. Each chunk draws from its own random stream derived from
+the seed, the table and the chunk index, so the data depends only on the seed and chunk size, not on the number of
+processes. Primary keys are assigned explicitly, so tables must be empty.
+
+    populate(engine, students_count=10**6, customers_count=10**6, seed=42)
+
+conftest.py builds one with create_synthetic_database as the session-scoped pytest fixture synthetic_database, shared
+by every test of this directory through a read-only engine, sales_engine.
+
+Run from this directory:
+
+    python synthetic_data.py synthetic.db --students 1000000 --customers 1000000 --seed 42
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+
+from bulk_load import DEFAULT_BATCH_SIZE, bulk_insert
+from schema import Base, Customers, Invoices, addresses, college_metadata, students
+
+DEFAULT_CHUNK_SIZE = 100_000
+# students or customers generated but not yet written, whatever the number of processes - with their children, a
+# chunk of 100k customers is around 100MB of row dicts
+DEFAULT_MAX_PARENTS_IN_FLIGHT = 400_000
+
+# independent random stream per table, see _get_rng
+_TABLE_STREAMS = {"students": 0, "addresses": 1, "customers": 2, "invoices": 3}
+
+# ordered by popularity - drawn with probability proportional to 1 / rank ** ZIPF_EXPONENT
+FIRST_NAMES = [
+    "Ravi",
+    "Priya",
+    "Rajiv",
+    "Amit",
+    "Komal",
+    "Rahul",
+    "Anjali",
+    "Sanjay",
+    "Deepa",
+    "Rajender",
+    "Gopal",
+    "Sunita",
+    "Abdul",
+    "Meera",
+    "Govind",
+    "Ramesh",
+    "Kavita",
+    "Vijay",
+    "Pooja",
+    "Arjun",
+    "Neha",
+    "Suresh",
+    "Lakshmi",
+    "Rakesh",
+    "Farah",
+    "Manoj",
+    "Radha",
+    "Imran",
+    "Shreya",
+    "Nikhil",
+]
+LAST_NAMES = [
+    "Kumar",
+    "Sharma",
+    "Patel",
+    "Singh",
+    "Kapoor",
+    "Khanna",
+    "Pande",
+    "Krishna",
+    "Nath",
+    "Rao",
+    "Bhandari",
+    "Sattar",
+    "Rajhans",
+    "Pant",
+    "Kala",
+    "Iyer",
+    "Reddy",
+    "Menon",
+    "Joshi",
+    "Gupta",
+]
+CITIES = [
+    "Mumbai",
+    "Delhi",
+    "Bengaluru",
+    "Hyderabad",
+    "Pune",
+    "Chennai",
+    "Kolkata",
+    "Ahmedabad",
+    "Gurgaon",
+    "Jaipur",
+    "Lucknow",
+    "Kochi",
+]
+STREETS = ["MG Road", "Station Road", "Church Street", "Park Street", "Ring Road"]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "example.com"]
+ZIPF_EXPONENT = 1.1
+
+# probability of a student having 0, 1, 2 or 3 addresses
+ADDRESS_COUNT_PROBABILITIES = [0.1, 0.6, 0.25, 0.05]
+
+
+def _get_rng(seed, table, chunk_index):
+    """Random generator of one chunk of a table, independent of every other chunk and table"""
+    sequence = np.random.SeedSequence(
+        seed, spawn_key=(_TABLE_STREAMS[table], chunk_index)
+    )
+
+    return np.random.default_rng(sequence)
+
+
+def _choose(rng, values, size):
+    """Values drawn with Zipf-like popularity, the first value being the most common"""
+    weights = 1 / np.arange(1, len(values) + 1) ** ZIPF_EXPONENT
+
+    return np.asarray(values, dtype=object)[
+        rng.choice(len(values), size=size, p=weights / weights.sum())
+    ]
+
+
+def _get_child_counts(rng, table, parents_count, invoices_zipf, max_invoices):
+    """Number of addresses of each student or invoices of each customer - always the first draw of a chunk's stream"""
+    if table == "addresses":
+        return rng.choice(
+            len(ADDRESS_COUNT_PROBABILITIES),
+            size=parents_count,
+            p=ADDRESS_COUNT_PROBABILITIES,
+        )
+
+    return np.minimum(rng.zipf(invoices_zipf, size=parents_count), max_invoices)
+
+
+def _count_children(task, table, seed, invoices_zipf=None, max_invoices=None):
+    chunk_index, start, end = task
+    rng = _get_rng(seed, table, chunk_index)
+
+    return int(
+        _get_child_counts(rng, table, end - start, invoices_zipf, max_invoices).sum()
+    )
+
+
+def _generate_students(task, seed):
+    chunk_index, start, end = task
+    rng = _get_rng(seed, "students", chunk_index)
+    names = _choose(rng, FIRST_NAMES, end - start)
+    lastnames = _choose(rng, LAST_NAMES, end - start)
+
+    return [
+        {"id": student_id, "name": name, "lastname": lastname}
+        for student_id, name, lastname in zip(
+            range(start + 1, end + 1), names, lastnames
+        )
+    ]
+
+
+def _generate_addresses(task, seed):
+    chunk_index, start, end, first_id = task
+    rng = _get_rng(seed, "addresses", chunk_index)
+    counts = _get_child_counts(rng, "addresses", end - start, None, None)
+    student_ids = np.repeat(np.arange(start + 1, end + 1), counts)
+    streets = _choose(rng, STREETS, len(student_ids))
+    cities = _choose(rng, CITIES, len(student_ids))
+    domains = _choose(rng, EMAIL_DOMAINS, len(student_ids))
+
+    return [
+        {
+            "id": address_id,
+            "st_id": student_id,
+            "postal_add": "{} {}".format(street, city),
+            "email_add": "student{}@{}".format(student_id, domain),
+        }
+        for address_id, student_id, street, city, domain in zip(
+            range(first_id, first_id + len(student_ids)),
+            student_ids.tolist(),
+            streets,
+            cities,
+            domains,
+        )
+    ]
+
+
+def _generate_customers(task, seed):
+    chunk_index, start, end = task
+    rng = _get_rng(seed, "customers", chunk_index)
+    names = _choose(rng, FIRST_NAMES, end - start)
+    lastnames = _choose(rng, LAST_NAMES, end - start)
+    street_numbers = rng.integers(1, 500, end - start).tolist()
+    streets = _choose(rng, STREETS, end - start)
+    cities = _choose(rng, CITIES, end - start)
+    domains = _choose(rng, EMAIL_DOMAINS, end - start)
+
+    return [
+        {
+            "id": customer_id,
+            "name": "{} {}".format(name, lastname),
+            "address": "{} {}, {}".format(number, street, city),
+            "email": "{}.{}{}@{}".format(name, lastname, customer_id, domain).lower(),
+        }
+        for customer_id, name, lastname, number, street, city, domain in zip(
+            range(start + 1, end + 1),
+            names,
+            lastnames,
+            street_numbers,
+            streets,
+            cities,
+            domains,
+        )
+    ]
+
+
+def _generate_invoices(task, seed, invoices_zipf, max_invoices):
+    chunk_index, start, end, first_id = task
+    rng = _get_rng(seed, "invoices", chunk_index)
+    counts = _get_child_counts(
+        rng, "invoices", end - start, invoices_zipf, max_invoices
+    )
+    customer_ids = np.repeat(np.arange(start + 1, end + 1), counts)
+    # amounts are log-normal around 5000, rounded to 50
+    amounts = np.round(rng.lognormal(np.log(5000), 0.8, len(customer_ids)) / 50) * 50
+
+    return [
+        {"id": invoice_id, "custid": customer_id, "invno": invoice_id, "amount": amount}
+        for invoice_id, customer_id, amount in zip(
+            range(first_id, first_id + len(customer_ids)),
+            customer_ids.tolist(),
+            amounts.astype(np.int64).tolist(),
+        )
+    ]
+
+
+def _get_chunks(rows_count, chunk_size):
+    return [
+        (chunk_index, start, min(start + chunk_size, rows_count))
+        for chunk_index, start in enumerate(range(0, rows_count, chunk_size))
+    ]
+
+
+def _map_in_order(executor, function, tasks, window):
+    """function applied to each task in the pool, yielding results in order with at most window tasks in flight"""
+    if executor is None:
+        yield from map(function, tasks)
+        return
+
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _insert_chunks(engine, table, executor, function, tasks, window, batch_size):
+    rows = (
+        row
+        for chunk in _map_in_order(executor, function, tasks, window)
+        for row in chunk
+    )
+
+    return bulk_insert(engine, table, rows, batch_size=batch_size, fast_pragmas=True)
+
+
+def _insert_children(
+    engine, table, executor, parent_chunks, generate, count, window, batch_size
+):
+    # child ids are numbered consecutively across chunks, so the number of children of each chunk is needed first
+    counts = list(_map_in_order(executor, count, parent_chunks, window))
+    first_ids = np.cumsum([1] + counts[:-1]).tolist()
+    tasks = [chunk + (first_id,) for chunk, first_id in zip(parent_chunks, first_ids)]
+
+    return _insert_chunks(engine, table, executor, generate, tasks, window, batch_size)
+
+
+def populate(
+    engine,
+    students_count=0,
+    customers_count=0,
+    seed=0,
+    invoices_zipf=2.0,
+    max_invoices=1000,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    processes=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    max_parents_in_flight=DEFAULT_MAX_PARENTS_IN_FLIGHT,
+):
+    """Create the college and sales tables and fill them with synthetic rows
+
+    Declared indexes are dropped while loading and rebuilt afterwards, which is faster than maintaining them row by
+    row. The same seed and chunk_size always give the same rows.
+
+    :param engine: engine of the target database - its tables must be empty or missing
+    :type engine: sqlalchemy.engine.Engine
+    :param students_count: number of students, each with 0 to 3 addresses
+    :type students_count: int
+    :param customers_count: number of customers
+    :type customers_count: int
+    :param seed: random seed
+    :type seed: int
+    :param invoices_zipf: exponent of the Zipf distribution of invoices per customer - larger means less skew
+    :type invoices_zipf: float
+    :param max_invoices: cap on the number of invoices of one customer
+    :type max_invoices: int
+    :param chunk_size: number of students or customers generated per task
+    :type chunk_size: int
+    :param processes: number of generating processes, 1 to generate in this process, None for the number of CPUs
+    :type processes: int
+    :param batch_size: number of rows per executemany and transaction
+    :type batch_size: int
+    :param max_parents_in_flight: students or customers generated ahead of the writer, bounding memory - at least one
+        chunk, and at most two per process. Lower chunk_size to keep more processes busy under the same bound
+    :type max_parents_in_flight: int
+    :return: rows_counts - number of rows inserted keyed by table name
+    :rtype: dict
+    """
+    tables = [students, addresses, Customers.__table__, Invoices.__table__]
+    college_metadata.create_all(engine)
+    Base.metadata.create_all(engine)
+    indexes = [index for table in tables for index in table.indexes]
+    with engine.begin() as connection:
+        for index in indexes:
+            index.drop(connection, checkfirst=True)
+
+    processes = processes or os.cpu_count()
+    executor = ProcessPoolExecutor(processes) if processes > 1 else None
+    # enough chunks in flight to keep every process busy while the writer catches up, but bounded by rows rather
+    # than processes, so memory does not grow with the number of CPUs
+    window = max(min(2 * processes, max_parents_in_flight // chunk_size), 1)
+    invoice_options = {"invoices_zipf": invoices_zipf, "max_invoices": max_invoices}
+    rows_counts = {}
+    try:
+        student_chunks = _get_chunks(students_count, chunk_size)
+        rows_counts["students"] = _insert_chunks(
+            engine,
+            students,
+            executor,
+            partial(_generate_students, seed=seed),
+            student_chunks,
+            window,
+            batch_size,
+        )
+        rows_counts["addresses"] = _insert_children(
+            engine,
+            addresses,
+            executor,
+            student_chunks,
+            partial(_generate_addresses, seed=seed),
+            partial(_count_children, table="addresses", seed=seed),
+            window,
+            batch_size,
+        )
+
+        customer_chunks = _get_chunks(customers_count, chunk_size)
+        rows_counts["customers"] = _insert_chunks(
+            engine,
+            Customers.__table__,
+            executor,
+            partial(_generate_customers, seed=seed),
+            customer_chunks,
+            window,
+            batch_size,
+        )
+        rows_counts["invoices"] = _insert_children(
+            engine,
+            Invoices.__table__,
+            executor,
+            customer_chunks,
+            partial(_generate_invoices, seed=seed, **invoice_options),
+            partial(_count_children, table="invoices", seed=seed, **invoice_options),
+            window,
+            batch_size,
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    with engine.begin() as connection:
+        for index in indexes:
+            index.create(connection)
+        connection.exec_driver_sql("ANALYZE")
+
+    return rows_counts
+
+
+def create_synthetic_database(directory, **kwargs):
+    """Path of a SQLite database populated with the given parameters, built only if the directory lacks one already
+
+    The file name is derived from the parameters, so a session-scoped fixture or a persistent cache directory reuses
+    the database across tests or runs. It is built under a temporary name and renamed, so an interrupted build is
+    never mistaken for a complete one.
+
+    :param directory: directory holding the databases
+    :type directory: str or os.PathLike
+    :param kwargs: parameters of populate other than engine - processes, batch_size and max_parents_in_flight do
+        not change the data, so they are left out of the file name
+    :return: path of the database file
+    :rtype: str
+    """
+    parameters = {
+        key: value
+        for key, value in kwargs.items()
+        if key not in ("processes", "batch_size", "max_parents_in_flight")
+    }
+    digest = hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[
+        :12
+    ]
+    path = os.path.join(directory, "synthetic-{}.db".format(digest))
+    if os.path.exists(path):
+        return path
+
+    partial_path = "{}.{}.partial".format(path, os.getpid())
+    engine = create_engine("sqlite:///{}".format(partial_path))
+    try:
+        populate(engine, **kwargs)
+    finally:
+        engine.dispose()
+    os.replace(partial_path, path)
+
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fill the college and sales tables with synthetic data"
+    )
+    parser.add_argument("path", help="SQLite database file")
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--invoices-zipf", type=float, default=2.0)
+    parser.add_argument("--max-invoices", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    engine = create_engine("sqlite:///{}".format(args.path))
+    start = time.perf_counter()
+    rows_counts = populate(
+        engine,
+        students_count=args.students,
+        customers_count=args.customers,
+        seed=args.seed,
+        invoices_zipf=args.invoices_zipf,
+        max_invoices=args.max_invoices,
+        chunk_size=args.chunk_size,
+        processes=args.processes,
+    )
+    seconds = time.perf_counter() - start
+
+    for table, rows_count in rows_counts.items():
+        print("{:>10} {:>12,} rows".format(table, rows_count))
+    print(
+        "{:>10} {:>12,.0f} rows/s".format("total", sum(rows_counts.values()) / seconds)
+    )
+
+    with engine.connect() as connection:
+        top_counts = connection.execute(
+            select(func.count())
+            .select_from(Invoices)
+            .group_by(Invoices.custid)
+            .order_by(func.count().desc())
+            .limit(5)
+        ).scalars()
+        print("most invoices per customer: {}".format(list(top_counts)))
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
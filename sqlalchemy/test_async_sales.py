@@ -0,0 +1,63 @@
+"""Lookups of async_sales on AsyncSession
+
+Run from the repository root or this directory:
+
+    python -m pytest -q test_async_sales.py
+"""
+
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from async_sales import (
+    create_async_sales_engine,
+    get_customer,
+    get_customer_with_invoices,
+)
+from bulk_load import bulk_insert_graphs, generate_customer_graphs
+from engines import create_sqlite_engine
+from schema import Base
+
+
+def _run(tmp_path, lookups):
+    path = str(tmp_path / "sales.db")
+    engine = create_sqlite_engine(path)
+    Base.metadata.create_all(engine)
+    bulk_insert_graphs(engine, generate_customer_graphs(10, 3))
+    engine.dispose()
+
+    async def run():
+        async_engine = create_async_sales_engine(path)
+        try:
+            session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+            async with session_factory() as session:
+                return await lookups(session)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_customer_with_invoices(tmp_path):
+    async def lookups(session):
+        customer = await get_customer_with_invoices(session, 2)
+        return customer.id, len(customer.invoices)
+
+    assert _run(tmp_path, lookups) == (2, 3)
+
+
+def test_customer_with_invoices_after_get_customer(tmp_path):
+    async def lookups(session):
+        customer = await get_customer(session, 2)
+        # the customer is now in the identity map with its invoices unloaded
+        customer_with_invoices = await get_customer_with_invoices(session, 2)
+        return customer_with_invoices is customer, len(customer.invoices)
+
+    assert _run(tmp_path, lookups) == (True, 3)
+
+
+def test_missing_customer(tmp_path):
+    async def lookups(session):
+        return await get_customer_with_invoices(session, 1000)
+
+    assert _run(tmp_path, lookups) is None
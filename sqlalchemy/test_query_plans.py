@@ -0,0 +1,43 @@
+"""Query plan checks of the representative queries against the indexes declared in schema.py
+
+Run from the repository root or this directory:
+
+    python -m pytest -q test_query_plans.py
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from query_plans import QueryPlanError, assert_query_plans, check_query_plans
+from schema import Base, college_metadata
+
+
+@pytest.fixture
+def schema_connection():
+    """Connection to an empty in-memory database created from the declared schema"""
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        college_metadata.create_all(connection)
+        Base.metadata.create_all(connection)
+        yield connection
+    engine.dispose()
+
+
+def test_declared_schema_has_no_plan_regressions():
+    assert_query_plans()
+
+
+def test_synthetic_database_has_no_plan_regressions(sales_engine):
+    with sales_engine.connect() as connection:
+        assert_query_plans(connection)
+
+
+def test_missing_index_is_a_plan_regression(schema_connection):
+    schema_connection.execute(text("DROP INDEX ix_invoices_custid"))
+
+    reports = check_query_plans(schema_connection)
+    assert reports["lazy_invoices"]["problems"]
+    assert reports["selectin_invoices"]["problems"]
+    assert not reports["customers_by_name_prefix"]["problems"]
+    with pytest.raises(QueryPlanError, match="lazy_invoices"):
+        assert_query_plans(schema_connection)
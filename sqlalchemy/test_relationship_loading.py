@@ -0,0 +1,81 @@
+"""N+1 detection of QueryCounter under each loading strategy of Customers.invoices
+
+Run from the repository root or this directory:
+
+    python -m pytest -q test_relationship_loading.py
+"""
+
+import math
+
+import pytest
+from sqlalchemy import exc, select
+from sqlalchemy.orm import Session
+
+from relationship_loading import (
+    NPlusOneError,
+    QueryCounter,
+    list_customers_with_invoices,
+    select_customers_with_invoices,
+)
+from schema import Customers
+
+
+def test_lazy_loading_raises(sales_engine):
+    with Session(sales_engine) as session:
+        with pytest.raises(NPlusOneError, match="N\\+1 query pattern"):
+            with QueryCounter(sales_engine):
+                list_customers_with_invoices(session, "lazy")
+
+
+@pytest.mark.parametrize("strategy", ["selectin", "joined"])
+def test_eager_loading_passes(sales_engine, strategy):
+    with Session(sales_engine) as session:
+        with QueryCounter(sales_engine) as counter:
+            rows = list_customers_with_invoices(session, strategy)
+
+    customers_count = len(rows)
+    assert customers_count > 0
+    # selectin loads the invoices of 500 customers per SELECT
+    counter.assert_max_queries(
+        1 if strategy == "joined" else 1 + math.ceil(customers_count / 500)
+    )
+
+
+@pytest.mark.parametrize("strategy", ["lazy", "selectin", "joined"])
+def test_strategies_load_the_same_invoices(sales_engine, strategy):
+    with Session(sales_engine) as session:
+        expected = [
+            (customer.id, count, total)
+            for customer, count, total in list_customers_with_invoices(
+                session, "selectin"
+            )
+        ]
+    with Session(sales_engine) as session:
+        rows = [
+            (customer.id, count, total)
+            for customer, count, total in list_customers_with_invoices(
+                session, strategy
+            )
+        ]
+
+    assert rows == expected
+
+
+def test_raise_loading_raises_on_access(sales_engine):
+    with Session(sales_engine) as session:
+        customer = session.scalars(select_customers_with_invoices("raise")).first()
+        with pytest.raises(exc.InvalidRequestError):
+            customer.invoices
+
+
+def test_counter_counts_without_raising(sales_engine):
+    with Session(sales_engine) as session:
+        with QueryCounter(sales_engine, raise_on_n_plus_one=False) as counter:
+            customers = session.scalars(select(Customers).limit(20)).all()
+            for customer in customers:
+                customer.invoices
+
+    assert counter.count == 1 + len(customers)
+    assert counter.get_n_plus_one_statements()
+    with pytest.raises(AssertionError):
+        counter.assert_max_queries(1)
@@ -0,0 +1,433 @@
+"""Coefficient of determination, adjusted R^2 and RMSE from mergeable running sums, overall and by group
+
+R^2 needs the total sum of squares about the mean of y, which a single pass cannot compute directly without the
+cancellation of sum(y^2) - n mean^2. Each chunk's weight, mean and sum of squared deviations are computed exactly
+within the chunk and combined with the running values by Chan et al.'s update of Welford's algorithm:
+
+    delta = mean_b - mean_a
+    mean = mean_a + delta * w_b / (w_a + w_b)
+    m2 = m2_a + m2_b + delta^2 * w_a * w_b / (w_a + w_b)
+
+The same update merges accumulators from different chunks or processes, so metrics over billions of predictions are
+computed chunk by chunk with memory bounded by the chunk size and the number of groups. Multi-output targets are
+2-D arrays with one column per output, accumulated in the same pass.
+
+    accumulators = accumulate(y_true, y_pred, groups=segments)
+    metrics = accumulators[OVERALL].get_metrics(features_count=12)
+
+Feed chunks read from files to update_accumulators. Accumulators pickle, so workers can return theirs to be combined
+key by key with RegressionAccumulator.merge. Run from this directory to compare with sklearn on synthetic data:
+
+    python coefficient_of_determination.py --benchmark 10000000
+
+Results match sklearn.metrics.r2_score, including its conventions for constant targets.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNKSIZE = 1_000_000
+OVERALL = ()
+
+
+class RegressionAccumulator:
+    """Mergeable weights, means and sums of squares from which R^2, adjusted R^2 and RMSE are computed
+
+    :param outputs_count: number of outputs (target columns)
+    :type outputs_count: int
+    """
+
+    def __init__(self, outputs_count=1):
+        self.rows_count = 0
+        self.weight = np.zeros(outputs_count)
+        self.mean = np.zeros(outputs_count)
+        self.m2 = np.zeros(outputs_count)
+        self.residual_sum_of_squares = np.zeros(outputs_count)
+        self.minimum = np.full(outputs_count, np.inf)
+        self.maximum = np.full(outputs_count, -np.inf)
+
+    def add_moments(
+        self, rows_count, weight, mean, m2, residual_sum_of_squares, minimum, maximum
+    ):
+        """Combine the moments of another set of samples with these in place
+
+        :param rows_count: number of samples
+        :type rows_count: int
+        :param weight: total sample weight, per output
+        :type weight: np.ndarray
+        :param mean: weighted mean of the targets, per output
+        :type mean: np.ndarray
+        :param m2: weighted sum of squared deviations of the targets from their mean, per output
+        :type m2: np.ndarray
+        :param residual_sum_of_squares: weighted sum of squared residuals, per output
+        :type residual_sum_of_squares: np.ndarray
+        :param minimum: smallest target, per output
+        :type minimum: np.ndarray
+        :param maximum: largest target, per output
+        :type maximum: np.ndarray
+        :return: self
+        :rtype: RegressionAccumulator
+        """
+        total = self.weight + weight
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.where(total > 0, weight / total, 0.0)
+        delta = mean - self.mean
+
+        self.m2 += m2 + delta**2 * self.weight * share
+        self.mean += delta * share
+        self.weight = total
+        self.residual_sum_of_squares += residual_sum_of_squares
+        self.rows_count += rows_count
+        np.minimum(self.minimum, minimum, out=self.minimum)
+        np.maximum(self.maximum, maximum, out=self.maximum)
+
+        return self
+
+    def update(self, y_true, y_pred, sample_weight=None):
+        """Add a chunk of samples
+
+        :param y_true: targets - 1-D, or samples x outputs
+        :type y_true: np.ndarray
+        :param y_pred: predictions, with the shape of y_true
+        :type y_pred: np.ndarray
+        :param sample_weight: sample weights, defaults to 1
+        :type sample_weight: np.ndarray
+        :return: self
+        :rtype: RegressionAccumulator
+        """
+        moments = get_group_moments(y_true, y_pred, sample_weight=sample_weight)
+
+        return self.add_moments(*(values[0] for values in moments))
+
+    def merge(self, other):
+        """Add the samples of another accumulator in place
+
+        :param other: accumulator with the same number of outputs
+        :type other: RegressionAccumulator
+        :return: self
+        :rtype: RegressionAccumulator
+        """
+        return self.add_moments(
+            other.rows_count,
+            other.weight,
+            other.mean,
+            other.m2,
+            other.residual_sum_of_squares,
+            other.minimum,
+            other.maximum,
+        )
+
+    def get_metrics(self, features_count=None):
+        """Metrics for the samples added so far
+
+        Like sklearn's r2_score, an output with constant targets has R^2 1 if it is predicted exactly and 0 otherwise.
+        Constant targets are found from their minimum and maximum, since with sample weights the weighted mean of a
+        constant can be off by a rounding error, leaving m2 tiny but not zero.
+
+        :param features_count: number of model features, for adjusted R^2
+        :type features_count: int
+        :return: metrics - samples_count, r2 and rmse averaged over outputs, r2_variance_weighted, adjusted_r2 (None
+            without features_count), and outputs - dicts of r2, adjusted_r2, rmse, mean and variance per output
+        :rtype: dict
+        """
+        constant = self.minimum == self.maximum
+        m2 = np.where(constant, 0.0, self.m2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r2 = 1 - self.residual_sum_of_squares / m2
+            rmse = np.sqrt(self.residual_sum_of_squares / self.weight)
+            variance = m2 / self.weight
+        r2[constant] = np.where(self.residual_sum_of_squares[constant] == 0, 1.0, 0.0)
+        r2[self.weight == 0] = np.nan
+
+        adjusted_r2 = np.full_like(r2, np.nan)
+        if features_count is not None and self.rows_count - features_count - 1 > 0:
+            adjusted_r2 = 1 - (1 - r2) * (self.rows_count - 1) / (
+                self.rows_count - features_count - 1
+            )
+        r2_variance_weighted = (
+            float((r2 * m2).sum() / m2.sum()) if m2.sum() > 0 else float(r2.mean())
+        )
+
+        return {
+            "samples_count": int(self.rows_count),
+            "r2": float(r2.mean()),
+            "r2_variance_weighted": r2_variance_weighted,
+            "adjusted_r2": (
+                float(adjusted_r2.mean()) if features_count is not None else None
+            ),
+            "rmse": float(rmse.mean()),
+            "outputs": [
+                {
+                    "r2": float(r2[i]),
+                    "adjusted_r2": (
+                        float(adjusted_r2[i]) if features_count is not None else None
+                    ),
+                    "rmse": float(rmse[i]),
+                    "mean": float(self.mean[i]),
+                    "variance": float(variance[i]),
+                }
+                for i in range(len(r2))
+            ],
+        }
+
+
+def _as_2d(values, name):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    if values.ndim != 2:
+        raise ValueError("{} must be 1-D or 2-D, got {}-D".format(name, values.ndim))
+    if np.isnan(values).any():
+        raise ValueError("{} must not contain NaN".format(name))
+
+    return values
+
+
+def get_group_moments(y_true, y_pred, codes=None, groups_count=1, sample_weight=None):
+    """Sample count, weight, mean, sum of squared deviations and residual sum of squares of each group in one chunk
+
+    Deviations are taken from each group's own mean in later passes over the chunk, so they do not cancel.
+
+    :param y_true: targets - 1-D, or samples x outputs
+    :type y_true: np.ndarray
+    :param y_pred: predictions, with the shape of y_true
+    :type y_pred: np.ndarray
+    :param codes: group of each sample, from 0 - defaults to one group
+    :type codes: np.ndarray
+    :param groups_count: number of groups
+    :type groups_count: int
+    :param sample_weight: sample weights, defaults to 1
+    :type sample_weight: np.ndarray
+    :return: rows_count, weight, mean, m2, residual_sum_of_squares, minimum, maximum - rows_count per group, the
+        others groups x outputs
+    :rtype: tuple
+    """
+    y_true = _as_2d(y_true, "y_true")
+    y_pred = _as_2d(y_pred, "y_pred")
+    if y_true.shape != y_pred.shape:
+        raise ValueError(
+            "y_true and y_pred have different shapes: {} and {}".format(
+                y_true.shape, y_pred.shape
+            )
+        )
+    if codes is None:
+        codes = np.zeros(len(y_true), dtype=np.intp)
+    weights = (
+        np.ones(len(y_true))
+        if sample_weight is None
+        else np.asarray(sample_weight, dtype=np.float64)
+    )
+
+    rows_count = np.bincount(codes, minlength=groups_count)
+    weight = np.bincount(codes, weights, minlength=groups_count)
+    shape = (groups_count, y_true.shape[1])
+    mean, m2, residual_sum_of_squares = (np.zeros(shape) for _ in range(3))
+    minimum = np.full(shape, np.inf)
+    maximum = np.full(shape, -np.inf)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for j in range(y_true.shape[1]):
+            target = y_true[:, j]
+            mean[:, j] = np.nan_to_num(
+                np.bincount(codes, weights * target, minlength=groups_count) / weight
+            )
+            # bincount adds sequentially, so large targets leave an error in the mean that would inflate m2 -
+            # the mean of the deviations from it corrects that
+            deviations = target - mean[codes, j]
+            correction = np.nan_to_num(
+                np.bincount(codes, weights * deviations, minlength=groups_count)
+                / weight
+            )
+            mean[:, j] += correction
+            deviations -= correction[codes]
+            m2[:, j] = np.bincount(
+                codes, weights * deviations**2, minlength=groups_count
+            )
+            residual_sum_of_squares[:, j] = np.bincount(
+                codes, weights * (target - y_pred[:, j]) ** 2, minlength=groups_count
+            )
+            np.minimum.at(minimum[:, j], codes, target)
+            np.maximum.at(maximum[:, j], codes, target)
+
+    weight = np.repeat(weight[:, np.newaxis], shape[1], axis=1)
+
+    return rows_count, weight, mean, m2, residual_sum_of_squares, minimum, maximum
+
+
+def _get_accumulator(accumulators, key, outputs_count):
+    accumulator = accumulators.get(key)
+    if accumulator is None:
+        accumulator = accumulators[key] = RegressionAccumulator(outputs_count)
+
+    return accumulator
+
+
+def update_accumulators(accumulators, y_true, y_pred, groups=None, sample_weight=None):
+    """Add a chunk of samples to the accumulators of their groups and to the overall one, in place
+
+    :param accumulators: accumulators keyed by tuple of group values, with OVERALL for all samples
+    :type accumulators: dict
+    :param y_true: targets - 1-D, or samples x outputs
+    :type y_true: np.ndarray
+    :param y_pred: predictions, with the shape of y_true
+    :type y_pred: np.ndarray
+    :param groups: group values of each sample - a column, or a data frame of columns
+    :type groups: pd.Series | pd.DataFrame
+    :param sample_weight: sample weights, defaults to 1
+    :type sample_weight: np.ndarray
+    :return: accumulators
+    :rtype: dict
+    """
+    outputs_count = 1 if np.ndim(y_true) == 1 else np.shape(y_true)[1]
+    _get_accumulator(accumulators, OVERALL, outputs_count).update(
+        y_true, y_pred, sample_weight=sample_weight
+    )
+    if groups is None:
+        return accumulators
+
+    groups = pd.DataFrame(groups)
+    grouped = groups.groupby(list(groups.columns), dropna=False, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    # missing values as None, so the keys of different chunks match
+    keys = [
+        tuple(None if pd.isna(value) else value for value in key)
+        for key in grouped.size()
+        .index.to_frame(index=False)
+        .itertuples(index=False, name=None)
+    ]
+    moments = get_group_moments(
+        y_true, y_pred, codes, len(keys), sample_weight=sample_weight
+    )
+    for i, key in enumerate(keys):
+        if moments[0][i]:
+            _get_accumulator(accumulators, key, outputs_count).add_moments(
+                *(values[i] for values in moments)
+            )
+
+    return accumulators
+
+
+def accumulate(
+    y_true, y_pred, groups=None, sample_weight=None, chunksize=DEFAULT_CHUNKSIZE
+):
+    """Accumulators for arrays of targets and predictions, processed in chunks
+
+    :param y_true: targets - 1-D, or samples x outputs
+    :type y_true: np.ndarray
+    :param y_pred: predictions, with the shape of y_true
+    :type y_pred: np.ndarray
+    :param groups: group values of each sample - a column, or a data frame of columns
+    :type groups: pd.Series | pd.DataFrame
+    :param sample_weight: sample weights, defaults to 1
+    :type sample_weight: np.ndarray
+    :param chunksize: samples per chunk, bounding the temporary arrays
+    :type chunksize: int
+    :return: accumulators - keyed by tuple of group values, with OVERALL for all samples
+    :rtype: dict
+    """
+    accumulators = {}
+    if groups is not None:
+        groups = pd.DataFrame(groups)
+    for start in range(0, len(y_true), chunksize):
+        rows = slice(start, start + chunksize)
+        update_accumulators(
+            accumulators,
+            y_true[rows],
+            y_pred[rows],
+            groups=None if groups is None else groups.iloc[rows],
+            sample_weight=None if sample_weight is None else sample_weight[rows],
+        )
+
+    return accumulators
+
+
+def r2_score(y_true, y_pred, sample_weight=None, multioutput="uniform_average"):
+    """Coefficient of determination of arrays, computed in chunks
+
+    :param y_true: targets - 1-D, or samples x outputs
+    :type y_true: np.ndarray
+    :param y_pred: predictions, with the shape of y_true
+    :type y_pred: np.ndarray
+    :param sample_weight: sample weights, defaults to 1
+    :type sample_weight: np.ndarray
+    :param multioutput: "uniform_average", "variance_weighted" or "raw_values", as in sklearn
+    :type multioutput: str
+    :return: R^2, or an array per output for "raw_values"
+    :rtype: float | np.ndarray
+    """
+    metrics = accumulate(y_true, y_pred, sample_weight=sample_weight)[
+        OVERALL
+    ].get_metrics()
+    if multioutput == "raw_values":
+        return np.array([output["r2"] for output in metrics["outputs"]])
+    if multioutput == "variance_weighted":
+        return metrics["r2_variance_weighted"]
+    if multioutput == "uniform_average":
+        return metrics["r2"]
+
+    raise ValueError(
+        "multioutput must be 'uniform_average', 'variance_weighted' or 'raw_values'"
+    )
+
+
+def benchmark(rows_count, outputs_count=3, groups_count=100, offset=1e9, seed=0):
+    """Compare accumulated R^2 with sklearn's and with the one-pass sum-of-squares formula, on targets far from zero
+
+    :param rows_count: number of samples
+    :type rows_count: int
+    :param outputs_count: number of outputs
+    :type outputs_count: int
+    :param groups_count: number of groups for the grouped run
+    :type groups_count: int
+    :param offset: added to every target and prediction - large values make the naive formula cancel
+    :type offset: float
+    :param seed: random seed
+    :type seed: int
+    :return: results - dicts with method, seconds and r2
+    :rtype: list
+    """
+    from sklearn.metrics import r2_score as sklearn_r2_score
+
+    rng = np.random.default_rng(seed)
+    y_true = rng.normal(offset, 1, (rows_count, outputs_count))
+    y_pred = y_true + rng.normal(0, 0.5, (rows_count, outputs_count))
+    groups = pd.Series(rng.integers(0, groups_count, rows_count))
+
+    def naive_r2():
+        total = (y_true**2).sum(axis=0) - rows_count * y_true.mean(axis=0) ** 2
+        return float(np.mean(1 - ((y_true - y_pred) ** 2).sum(axis=0) / total))
+
+    methods = {
+        "sklearn": lambda: sklearn_r2_score(y_true, y_pred),
+        "naive_sum_of_squares": naive_r2,
+        "accumulator": lambda: r2_score(y_true, y_pred),
+        "accumulator_grouped": lambda: accumulate(y_true, y_pred, groups=groups)[
+            OVERALL
+        ].get_metrics()["r2"],
+    }
+    results = []
+    for method, function in methods.items():
+        start = time.perf_counter()
+        r2 = function()
+        results.append(
+            {"method": method, "seconds": time.perf_counter() - start, "r2": r2}
+        )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare accumulated R^2 with sklearn's on synthetic targets far from zero"
+    )
+    parser.add_argument("--benchmark", type=int, default=1_000_000, metavar="ROWS")
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.benchmark):
+        print("{method:>22} {seconds:>8.2f}s r2={r2:.12f}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+"""Simulation of random walks, Brownian motion, geometric Brownian motion, Ornstein-Uhlenbeck and Poisson processes
+
+Paths are generated as blocks of paths x steps with NumPy - the increments of a block in one call and their running sum
+(or, for Ornstein-Uhlenbeck, a first-order linear filter) along the steps - rather than stepping in Python. Paths are
+split into chunks that bound memory, each chunk drawing from its own stream spawned from one SeedSequence, so results
+depend only on the seed and chunk size, not on how chunks are spread across processes.
+
+    times, paths = simulate("ornstein_uhlenbeck", 10_000, 1000, dt=0.01, theta=2.0, sigma=0.5)
+    stats = simulate("brownian_motion", 1_000_000, 1000, dt=0.001, statistics=True, processes=8)
+
+With statistics=True the chunks are reduced to mergeable per-step moments and extremes (PathStatistics) instead of
+returning the paths, so path counts are limited by time rather than memory. Run from this directory to time it:
+
+    python stochastic_processes.py --paths 1000000 --steps 1000
+"""
+
+import argparse
+import inspect
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+# number of path values per chunk - 8M float64 values are 64MB
+DEFAULT_CHUNK_VALUES = 8_000_000
+
+
+def random_walk(rng, paths_count, steps_count, dt=1.0, p=0.5, step=1.0, start=0.0):
+    """Simple random walk - each step is +step with probability p and -step otherwise
+
+    :param rng: random generator
+    :type rng: np.random.Generator
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step, unused - walks move once per step
+    :type dt: float
+    :param p: probability of stepping up
+    :type p: float
+    :param step: step size
+    :type step: float
+    :param start: starting value
+    :type start: float
+    :return: increments - paths x steps
+    :rtype: np.ndarray
+    """
+    ups = rng.random((paths_count, steps_count)) < p
+
+    return np.where(ups, step, -step)
+
+
+def brownian_motion(
+    rng, paths_count, steps_count, dt=1.0, mu=0.0, sigma=1.0, start=0.0
+):
+    """Brownian motion with drift mu and volatility sigma
+
+    :param rng: random generator
+    :type rng: np.random.Generator
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param mu: drift per unit time
+    :type mu: float
+    :param sigma: volatility per square root of unit time
+    :type sigma: float
+    :param start: starting value
+    :type start: float
+    :return: increments - paths x steps
+    :rtype: np.ndarray
+    """
+    increments = rng.standard_normal((paths_count, steps_count))
+    increments *= sigma * np.sqrt(dt)
+    increments += mu * dt
+
+    return increments
+
+
+def geometric_brownian_motion(
+    rng, paths_count, steps_count, dt=1.0, mu=0.0, sigma=1.0, start=1.0
+):
+    """Increments of the logarithm of geometric Brownian motion, dS = mu S dt + sigma S dW, simulated exactly
+
+    :param rng: random generator
+    :type rng: np.random.Generator
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param mu: drift per unit time
+    :type mu: float
+    :param sigma: volatility per square root of unit time
+    :type sigma: float
+    :param start: starting value, positive
+    :type start: float
+    :return: log increments - paths x steps
+    :rtype: np.ndarray
+    """
+    return brownian_motion(
+        rng, paths_count, steps_count, dt=dt, mu=mu - sigma**2 / 2, sigma=sigma
+    )
+
+
+def ornstein_uhlenbeck(
+    rng, paths_count, steps_count, dt=1.0, theta=1.0, mu=0.0, sigma=1.0, start=0.0
+):
+    """Innovations of the Ornstein-Uhlenbeck process dX = theta (mu - X) dt + sigma dW, simulated exactly
+
+    :param rng: random generator
+    :type rng: np.random.Generator
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param theta: rate of mean reversion, positive
+    :type theta: float
+    :param mu: long-term mean
+    :type mu: float
+    :param sigma: volatility per square root of unit time
+    :type sigma: float
+    :param start: starting value
+    :type start: float
+    :return: innovations - paths x steps, filtered into paths by get_paths
+    :rtype: np.ndarray
+    """
+    decay = np.exp(-theta * dt)
+    scale = sigma * np.sqrt((1 - decay**2) / (2 * theta))
+    increments = rng.standard_normal((paths_count, steps_count))
+    increments *= scale
+
+    return increments
+
+
+def poisson_process(rng, paths_count, steps_count, dt=1.0, rate=1.0, start=0.0):
+    """Poisson counting process with the given rate
+
+    :param rng: random generator
+    :type rng: np.random.Generator
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param rate: expected events per unit time
+    :type rate: float
+    :param start: starting count
+    :type start: float
+    :return: increments - events per step, paths x steps
+    :rtype: np.ndarray
+    """
+    return rng.poisson(rate * dt, (paths_count, steps_count)).astype(np.float64)
+
+
+def compound_poisson_process(
+    rng,
+    paths_count,
+    steps_count,
+    dt=1.0,
+    rate=1.0,
+    jump_mean=0.0,
+    jump_std=1.0,
+    start=0.0,
+):
+    """Compound Poisson process with normally distributed jumps
+
+    The sum of n normal jumps is normal with mean n jump_mean and variance n jump_std^2, so each step draws its jump
+    count and then one normal value, whatever the number of jumps.
+
+    :param rng: random generator
+    :type rng: np.random.Generator
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param rate: expected jumps per unit time
+    :type rate: float
+    :param jump_mean: mean jump size
+    :type jump_mean: float
+    :param jump_std: standard deviation of the jump size
+    :type jump_std: float
+    :param start: starting value
+    :type start: float
+    :return: increments - sum of the jumps in each step, paths x steps
+    :rtype: np.ndarray
+    """
+    jumps = rng.poisson(rate * dt, (paths_count, steps_count)).astype(np.float64)
+    increments = rng.standard_normal((paths_count, steps_count))
+    increments *= jump_std * np.sqrt(jumps)
+    increments += jump_mean * jumps
+
+    return increments
+
+
+PROCESSES = {
+    "random_walk": random_walk,
+    "brownian_motion": brownian_motion,
+    "geometric_brownian_motion": geometric_brownian_motion,
+    "ornstein_uhlenbeck": ornstein_uhlenbeck,
+    "poisson_process": poisson_process,
+    "compound_poisson_process": compound_poisson_process,
+}
+
+
+def get_paths(process, increments, dt=1.0, start=None, **params):
+    """Paths from a process's increments, starting value first
+
+    :param process: name in PROCESSES
+    :type process: str
+    :param increments: increments from the process's function - paths x steps
+    :type increments: np.ndarray
+    :param dt: time step
+    :type dt: float
+    :param start: starting value, defaults to the process function's
+    :type start: float
+    :param params: the process's parameters
+    :return: paths - paths x (steps + 1)
+    :rtype: np.ndarray
+    """
+    if start is None:
+        start = _get_default(process, "start")
+    paths = np.empty((increments.shape[0], increments.shape[1] + 1))
+
+    if process == "ornstein_uhlenbeck":
+        theta = params.get("theta", _get_default(process, "theta"))
+        mu = params.get("mu", _get_default(process, "mu"))
+        decay = np.exp(-theta * dt)
+        # X_{k+1} - mu = decay (X_k - mu) + innovation, a first-order recursive filter along each path
+        initial = np.full((increments.shape[0], 1), decay * (start - mu))
+        paths[:, 1:], _ = signal.lfilter([1.0], [1.0, -decay], increments, zi=initial)
+        paths[:, 1:] += mu
+    else:
+        np.cumsum(increments, axis=1, out=paths[:, 1:])
+        paths[:, 1:] += (
+            np.log(start) if process == "geometric_brownian_motion" else start
+        )
+    paths[:, 0] = start
+
+    if process == "geometric_brownian_motion":
+        np.exp(paths[:, 1:], out=paths[:, 1:])
+
+    return paths
+
+
+def _get_default(process, name):
+    """Default of a parameter of a process function"""
+    return inspect.signature(PROCESSES[process]).parameters[name].default
+
+
+class PathStatistics:
+    """Mergeable per-step mean, variance, minimum and maximum over paths, and the distribution of path extremes
+
+    :param steps_count: number of steps - statistics are kept for steps_count + 1 times, the start included
+    :type steps_count: int
+    """
+
+    def __init__(self, steps_count):
+        self.paths_count = 0
+        self.mean = np.zeros(steps_count + 1)
+        self.m2 = np.zeros(steps_count + 1)
+        self.minimum = np.full(steps_count + 1, np.inf)
+        self.maximum = np.full(steps_count + 1, -np.inf)
+        self.path_maximum_sum = 0.0
+        self.path_minimum_sum = 0.0
+
+    def add_moments(
+        self,
+        paths_count,
+        mean,
+        m2,
+        minimum,
+        maximum,
+        path_maximum_sum,
+        path_minimum_sum,
+    ):
+        """Combine the statistics of other paths with these in place, by Chan et al.'s update of Welford's algorithm
+
+        :return: self
+        :rtype: PathStatistics
+        """
+        total = self.paths_count + paths_count
+        if total == 0:
+            return self
+        delta = mean - self.mean
+
+        self.m2 += m2 + delta**2 * self.paths_count * paths_count / total
+        self.mean += delta * paths_count / total
+        self.paths_count = total
+        np.minimum(self.minimum, minimum, out=self.minimum)
+        np.maximum(self.maximum, maximum, out=self.maximum)
+        self.path_maximum_sum += path_maximum_sum
+        self.path_minimum_sum += path_minimum_sum
+
+        return self
+
+    def update(self, paths):
+        """Add a block of paths
+
+        :param paths: paths x (steps + 1)
+        :type paths: np.ndarray
+        :return: self
+        :rtype: PathStatistics
+        """
+        mean = paths.mean(axis=0)
+
+        return self.add_moments(
+            len(paths),
+            mean,
+            ((paths - mean) ** 2).sum(axis=0),
+            paths.min(axis=0),
+            paths.max(axis=0),
+            paths.max(axis=1).sum(),
+            paths.min(axis=1).sum(),
+        )
+
+    def merge(self, other):
+        """Add the paths of other statistics in place
+
+        :param other: statistics with the same number of steps
+        :type other: PathStatistics
+        :return: self
+        :rtype: PathStatistics
+        """
+        return self.add_moments(
+            other.paths_count,
+            other.mean,
+            other.m2,
+            other.minimum,
+            other.maximum,
+            other.path_maximum_sum,
+            other.path_minimum_sum,
+        )
+
+    def get_statistics(self, times=None):
+        """Statistics per time
+
+        :param times: time of each value, defaults to the step number
+        :type times: np.ndarray
+        :return: statistics - time, mean, std (sample), min and max, with the mean path maximum and minimum in attrs
+        :rtype: pd.DataFrame
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.m2 / (self.paths_count - 1))
+        statistics = pd.DataFrame(
+            {
+                "time": times if times is not None else np.arange(len(self.mean)),
+                "mean": self.mean,
+                "std": std,
+                "min": self.minimum,
+                "max": self.maximum,
+            }
+        )
+        statistics.attrs["paths_count"] = self.paths_count
+        statistics.attrs["mean_path_maximum"] = self.path_maximum_sum / self.paths_count
+        statistics.attrs["mean_path_minimum"] = self.path_minimum_sum / self.paths_count
+
+        return statistics
+
+
+def simulate_chunk(
+    process, paths_count, steps_count, seed, dt=1.0, statistics=False, **params
+):
+    """Paths of one chunk from its own random stream
+
+    :param process: name in PROCESSES
+    :type process: str
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param seed: seed of the chunk's stream
+    :type seed: np.random.SeedSequence
+    :param dt: time step
+    :type dt: float
+    :param statistics: reduce the paths to PathStatistics
+    :type statistics: bool
+    :param params: the process's parameters
+    :return: paths - paths x (steps + 1), or their statistics
+    :rtype: np.ndarray | PathStatistics
+    """
+    rng = np.random.default_rng(seed)
+    increments = PROCESSES[process](rng, paths_count, steps_count, dt=dt, **params)
+    paths = get_paths(process, increments, dt=dt, **params)
+    if statistics:
+        return PathStatistics(steps_count).update(paths)
+
+    return paths
+
+
+def _simulate_chunk(task):
+    return simulate_chunk(**task)
+
+
+def simulate(
+    process,
+    paths_count,
+    steps_count,
+    dt=1.0,
+    seed=0,
+    chunk_paths=None,
+    processes=1,
+    statistics=False,
+    **params,
+):
+    """Simulate paths of a process in chunks, optionally across a process pool
+
+    :param process: name in PROCESSES
+    :type process: str
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param seed: seed of the SeedSequence the chunk streams are spawned from
+    :type seed: int
+    :param chunk_paths: paths per chunk, defaults to DEFAULT_CHUNK_VALUES values - part of the seed, since each chunk
+        has its own stream
+    :type chunk_paths: int
+    :param processes: number of worker processes - 1 simulates in this process, None uses every CPU
+    :type processes: int
+    :param statistics: return per-step statistics instead of the paths
+    :type statistics: bool
+    :param params: the process's parameters, e.g. mu and sigma - see the process functions
+    :return: times, paths (paths x (steps + 1)) - or, with statistics, a data frame from PathStatistics.get_statistics
+    :rtype: (np.ndarray, np.ndarray) | pd.DataFrame
+    """
+    if process not in PROCESSES:
+        raise ValueError(
+            "process must be one of {}".format(", ".join(sorted(PROCESSES)))
+        )
+    if paths_count < 1:
+        raise ValueError("paths_count must be at least 1, got {}".format(paths_count))
+    if steps_count < 0:
+        raise ValueError("steps_count must not be negative, got {}".format(steps_count))
+    chunk_paths = chunk_paths or max(DEFAULT_CHUNK_VALUES // (steps_count + 1), 1)
+    chunk_sizes = [
+        min(chunk_paths, paths_count - start)
+        for start in range(0, paths_count, chunk_paths)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    times = dt * np.arange(steps_count + 1)
+
+    tasks = [
+        dict(
+            process=process,
+            paths_count=size,
+            steps_count=steps_count,
+            seed=chunk_seed,
+            dt=dt,
+            statistics=statistics,
+            **params,
+        )
+        for size, chunk_seed in zip(chunk_sizes, seeds)
+    ]
+    if processes == 1:
+        chunks = map(_simulate_chunk, tasks)
+        results = _collect(chunks, paths_count, steps_count, statistics)
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            chunks = executor.map(_simulate_chunk, tasks)
+            results = _collect(chunks, paths_count, steps_count, statistics)
+
+    if statistics:
+        return results.get_statistics(times)
+
+    return times, results
+
+
+def _collect(chunks, paths_count, steps_count, statistics):
+    """Merge chunk statistics, or copy chunk paths into one array, as the chunks arrive in order"""
+    if statistics:
+        merged = PathStatistics(steps_count)
+        for chunk in chunks:
+            merged.merge(chunk)
+        return merged
+
+    paths = np.empty((paths_count, steps_count + 1))
+    start = 0
+    for chunk in chunks:
+        paths[start : start + len(chunk)] = chunk
+        start += len(chunk)
+
+    return paths
+
+
+def simulate_loop(paths_count, steps_count, dt=1.0, mu=0.0, sigma=1.0, seed=0):
+    """Brownian motion stepped one value at a time in Python, the baseline simulate is compared with
+
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param dt: time step
+    :type dt: float
+    :param mu: drift per unit time
+    :type mu: float
+    :param sigma: volatility per square root of unit time
+    :type sigma: float
+    :param seed: random seed
+    :type seed: int
+    :return: final values of the paths
+    :rtype: list
+    """
+    rng = random.Random(seed)
+    scale = sigma * dt**0.5
+    finals = []
+    for _ in range(paths_count):
+        value = 0.0
+        for _ in range(steps_count):
+            value += mu * dt + scale * rng.gauss(0.0, 1.0)
+        finals.append(value)
+
+    return finals
+
+
+def benchmark(paths_count, steps_count, processes_counts, loop_paths=1000):
+    """Time streaming statistics of Brownian motion with each number of processes, and the Python loop
+
+    The loop simulates only loop_paths paths, and its time is scaled up to paths_count.
+
+    :param paths_count: number of paths
+    :type paths_count: int
+    :param steps_count: number of steps
+    :type steps_count: int
+    :param processes_counts: numbers of worker processes compared
+    :type processes_counts: list
+    :param loop_paths: number of paths simulated by the loop
+    :type loop_paths: int
+    :return: results - dicts with method, processes, seconds and final_std of the paths, which should be close to 1
+    :rtype: list
+    """
+    dt = 1 / steps_count
+
+    start = time.perf_counter()
+    finals = np.array(simulate_loop(loop_paths, steps_count, dt=dt))
+    results = [
+        {
+            "method": "loop",
+            "processes": 1,
+            "seconds": (time.perf_counter() - start) * paths_count / loop_paths,
+            "final_std": finals.std(ddof=1),
+        }
+    ]
+    for processes in processes_counts:
+        start = time.perf_counter()
+        statistics = simulate(
+            "brownian_motion",
+            paths_count,
+            steps_count,
+            dt=dt,
+            processes=processes,
+            statistics=True,
+        )
+        results.append(
+            {
+                "method": "simulate",
+                "processes": processes,
+                "seconds": time.perf_counter() - start,
+                "final_std": statistics["std"].iloc[-1],
+            }
+        )
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare simulating Brownian motion in a Python loop and in NumPy chunks"
+    )
+    parser.add_argument("--paths", type=int, default=1_000_000)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1]
+    )
+    args = parser.parse_args(argv)
+
+    for result in benchmark(args.paths, args.steps, args.processes):
+        print(
+            "{method:>8} {processes:>3} {seconds:>8.2f}s final std {final_std:.4f}".format(
+                **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()